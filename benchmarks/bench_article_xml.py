@@ -0,0 +1,70 @@
+#!/usr/bin/env python3
+
+"""Compare speed and peak memory of the tree-based and the streaming parsers of articles in cas_xml files"""
+
+import argparse
+import gzip
+import os
+import time
+import tracemalloc
+
+from textpresso_classifiers.fileutils import CAS_CHUNK_SIZE, CasType, extract_text_from_article_xml, iter_sofa_string, \
+    iter_text_from_article_xml, read_compressed_cas_content, extract_text_from_cas_content, \
+    extract_text_from_compressed_cas
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def measure(function, *args):
+    """run a function and measure its execution time and the peak memory allocated while running it
+
+    :param function: the function to run
+    :return: the result of the function, the execution time in seconds and the peak memory in bytes
+    :rtype: Tuple[Any, float, int]
+    """
+    tracemalloc.start()
+    start_time = time.perf_counter()
+    result = function(*args)
+    elapsed_time = time.perf_counter() - start_time
+    peak_memory = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return result, elapsed_time, peak_memory
+
+
+def main():
+    this_dir = os.path.split(__file__)[0]
+    parser = argparse.ArgumentParser(description="Benchmark the extraction of the body of articles from cas_xml files "
+                                                 "with the tree-based parser and with the streaming parser")
+    parser.add_argument("-r", "--repeat", metavar="repeat", dest="repeat", type=int, default=3,
+                        help="number of times each measure is repeated (the best time is reported)")
+    parser.add_argument("cas_dir", metavar="cas_dir", type=str, nargs="?",
+                        default=os.path.join(this_dir, os.pardir, "tests", "datasets", "cas", "animals"),
+                        help="directory containing the cas_xml files to process")
+    args = parser.parse_args()
+
+    print("file", "stage", "tree_time_s", "stream_time_s", "tree_peak_mb", "stream_peak_mb", sep="\t")
+    for file in sorted(os.listdir(args.cas_dir)):
+        file_path = os.path.join(args.cas_dir, file)
+        with gzip.open(file_path, "rt") as cas_file:
+            article_xml = "".join(iter_sofa_string(cas_file))
+        stages = [("parse", lambda: extract_text_from_article_xml(article_xml),
+                   lambda: "".join(iter_text_from_article_xml(
+                       article_xml[i:i + CAS_CHUNK_SIZE] for i in range(0, len(article_xml), CAS_CHUNK_SIZE)))),
+                  ("end_to_end", lambda: extract_text_from_cas_content(read_compressed_cas_content(file_path),
+                                                                       cas_type=CasType.XML),
+                   lambda: extract_text_from_compressed_cas(file_path, cas_type=CasType.XML))]
+        for stage, tree_function, stream_function in stages:
+            tree_results = [measure(tree_function) for _ in range(args.repeat)]
+            stream_results = [measure(stream_function) for _ in range(args.repeat)]
+            if stage == "parse" and tree_results[0][0] != stream_results[0][0]:
+                raise Exception("the parsers returned different text for " + file)
+            print(file, stage, "{:.4f}".format(min(res[1] for res in tree_results)),
+                  "{:.4f}".format(min(res[1] for res in stream_results)),
+                  "{:.2f}".format(max(res[2] for res in tree_results) / 1024 ** 2),
+                  "{:.2f}".format(max(res[2] for res in stream_results) / 1024 ** 2), sep="\t")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+
+"""Compare the per-document latency of the vectorizers compiled for inference with the latency of the original
+vectorizer followed by the selection of the best features, on synthetic documents"""
+
+import argparse
+import os
+import tempfile
+import time
+
+import numpy as np
+from sklearn.feature_extraction.text import TfidfVectorizer
+from synthetic_corpus import SyntheticCorpusGenerator
+from textpresso_classifiers.inference import CompiledVectorizer, save_inference_model, load_inference_model
+from textpresso_classifiers.selection import FeatureSelector
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def time_transform(transform, docs, batch_size: int, repeat: int):
+    """transform a set of documents in batches multiple times and measure the best time per document
+
+    :param transform: the function that transforms a batch of documents
+    :param docs: the documents
+    :type docs: List[str]
+    :param batch_size: the number of documents transformed at a time
+    :type batch_size: int
+    :param repeat: the number of times the documents are transformed
+    :type repeat: int
+    :return: the best time per document in seconds and the transformed matrices of the last run
+    :rtype: Tuple[float, List]
+    """
+    best_time = None
+    results = []
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        results = [transform(docs[i:i + batch_size]) for i in range(0, len(docs), batch_size)]
+        elapsed_time = (time.perf_counter() - start_time) / len(docs)
+        best_time = elapsed_time if best_time is None else min(best_time, elapsed_time)
+    return best_time, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the transformation of documents by compiled vectorizers")
+    parser.add_argument("-d", "--docs", metavar="num_docs", dest="num_docs", type=int, default=2000,
+                        help="number of synthetic training documents")
+    parser.add_argument("-t", "--test-docs", metavar="num_test_docs", dest="num_test_docs", type=int, default=200,
+                        help="number of synthetic documents to transform")
+    parser.add_argument("-l", "--doc-length", metavar="doc_length", dest="doc_length", type=int, default=1000,
+                        help="average number of words of the synthetic documents")
+    parser.add_argument("-n", "--ngram-size", metavar="ngram_size", dest="ngram_size", type=int, default=2,
+                        help="number of consecutive words to be considered as a single feature")
+    parser.add_argument("-b", "--best-features-num", metavar="best_features_size", dest="best_features_size", type=int,
+                        default=20000, help="number of features to select")
+    parser.add_argument("-s", "--batch-sizes", metavar="batch_sizes", dest="batch_sizes", type=str, default="1,8,64",
+                        help="comma-separated list of the numbers of documents transformed at a time")
+    parser.add_argument("-r", "--repeat", metavar="repeat", dest="repeat", type=int, default=3,
+                        help="number of times each measure is repeated (the best time is reported)")
+    args = parser.parse_args()
+
+    generator = SyntheticCorpusGenerator(doc_length=args.doc_length)
+    target = [doc_idx % 2 for doc_idx in range(args.num_docs)]
+    training_docs = [generator.generate_text(doc_idx, category) for doc_idx, category in enumerate(target)]
+    test_docs = [generator.generate_text(args.num_docs + doc_idx, doc_idx % 2) for doc_idx in
+                 range(args.num_test_docs)]
+    vectorizer = TfidfVectorizer(ngram_range=(1, args.ngram_size))
+    feature_selector = FeatureSelector(k=args.best_features_size).fit(vectorizer.fit_transform(training_docs), target)
+    feature_idx = feature_selector.get_selected_idx()
+    transforms = [("vectorizer_and_selection", lambda docs: vectorizer.transform(docs)[:, feature_idx]),
+                  ("compiled_exact_norm", CompiledVectorizer(vectorizer, feature_idx).transform),
+                  ("compiled_selected_norm", CompiledVectorizer(vectorizer, feature_idx, exact_norm=False).transform)]
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        model_dir = os.path.join(tmp_dir, "model.mmap")
+        save_inference_model(model_dir, CompiledVectorizer(vectorizer, feature_idx), None, mmap=True)
+        transforms.append(("compiled_exact_norm_mmap", load_inference_model(model_dir)[0].transform))
+        # the feature vectors normalized on the selected features only are the exact ones divided by the norm of their
+        # selected part, which measures how much the two normalizations differ
+        selected_norms = np.sqrt(np.asarray(vectorizer.transform(test_docs)[:, feature_idx].power(2).sum(axis=1)))
+        print("vocabulary:", len(vectorizer.vocabulary_), "selected:", len(feature_idx))
+        print("norm of the selected features in the exact feature vectors:", "mean:",
+              "{:.3f}".format(selected_norms.mean()), "min:", "{:.3f}".format(selected_norms.min()), "max:",
+              "{:.3f}".format(selected_norms.max()))
+        print("transform", "batch_size", "ms_per_doc", "speedup", sep="\t")
+        for batch_size in [int(batch_size) for batch_size in args.batch_sizes.split(",")]:
+            reference_time, reference_results = None, None
+            for name, transform in transforms:
+                doc_time, results = time_transform(transform, test_docs, batch_size, args.repeat)
+                if reference_time is None:
+                    reference_time, reference_results = doc_time, results
+                elif "exact_norm" in name and any(abs(result - reference_result).max() > 1e-9 for result,
+                                                  reference_result in zip(results, reference_results)):
+                    raise Exception('the features of the compiled vectorizer differ from the original ones')
+                print(name, batch_size, "{:.3f}".format(doc_time * 1000), "{:.2f}".format(reference_time / doc_time),
+                      sep="\t")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+"""Compare the speed of the selection of the best features by sorting all the scores and by partitioning them, and the
+speed of the scoring functions of feature selection on large vocabularies"""
+
+import argparse
+import time
+
+import numpy as np
+import scipy.sparse as sp
+from textpresso_classifiers.selection import FeatureSelector, FeatureScorer, get_top_k_idx
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def time_function(function, repeat: int):
+    """call a function multiple times and measure the best time
+
+    :param function: the function to call, without arguments
+    :param repeat: the number of calls
+    :type repeat: int
+    :return: the best time in seconds and the result of the last call
+    :rtype: Tuple[float, Any]
+    """
+    best_time = None
+    result = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        result = function()
+        elapsed_time = time.perf_counter() - start_time
+        best_time = elapsed_time if best_time is None else min(best_time, elapsed_time)
+    return best_time, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark feature selection on a synthetic sparse matrix with a large "
+                                                 "vocabulary")
+    parser.add_argument("-d", "--docs", metavar="num_docs", dest="num_docs", type=int, default=2000,
+                        help="number of synthetic documents")
+    parser.add_argument("-f", "--features", metavar="num_features", dest="num_features", type=int, default=2000000,
+                        help="size of the synthetic vocabulary")
+    parser.add_argument("-t", "--terms-per-doc", metavar="terms_per_doc", dest="terms_per_doc", type=int, default=500,
+                        help="number of distinct terms in each synthetic document")
+    parser.add_argument("-b", "--best-features-num", metavar="best_features_size", dest="best_features_size", type=int,
+                        default=20000, help="number of features to select")
+    parser.add_argument("-r", "--repeat", metavar="repeat", dest="repeat", type=int, default=3,
+                        help="number of times each measure is repeated (the best time is reported)")
+    args = parser.parse_args()
+
+    random_state = np.random.RandomState(0)
+    # term frequencies follow a zipf distribution, as in natural language
+    indices = np.minimum(random_state.zipf(1.3, size=args.num_docs * args.terms_per_doc), args.num_features) - 1
+    indptr = np.arange(0, len(indices) + 1, args.terms_per_doc)
+    features = sp.csr_matrix((random_state.rand(len(indices)), indices, indptr),
+                             shape=(args.num_docs, args.num_features))
+    features.sum_duplicates()
+    target = random_state.randint(0, 2, size=args.num_docs)
+
+    print("stage", "time_s", "speedup", sep="\t")
+    scores = FeatureSelector(scorer=FeatureScorer.CHI2).fit(features, target).scores_
+    sort_time, sorted_idx = time_function(lambda: sorted(range(len(scores)), key=lambda k: scores[k],
+                                                         reverse=True)[:args.best_features_size], args.repeat)
+    partition_time, partitioned_idx = time_function(lambda: get_top_k_idx(scores, args.best_features_size),
+                                                    args.repeat)
+    print("top_k_sort", "{:.4f}".format(sort_time), "1.00", sep="\t")
+    print("top_k_argpartition", "{:.4f}".format(partition_time), "{:.2f}".format(sort_time / partition_time),
+          sep="\t")
+    if np.isnan(scores).sum() == 0 and list(sorted_idx) != partitioned_idx.tolist():
+        raise Exception('the features selected by partitioning differ from the ones selected by sorting')
+    for feature_scorer in FeatureScorer:
+        feature_selector = FeatureSelector(scorer=feature_scorer, k=args.best_features_size)
+        fit_time, _ = time_function(lambda: feature_selector.fit(features, target), args.repeat)
+        print("fit_" + feature_scorer.name.lower(), "{:.4f}".format(fit_time), "", sep="\t")
+
+
+if __name__ == '__main__':
+    main()
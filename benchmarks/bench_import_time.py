@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+"""Measure the start-up time of the modules of the package and of the command line programs, each in a new
+interpreter, to track the cost of the modules imported at start-up"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ["textpresso_classifiers", "textpresso_classifiers.fileutils", "textpresso_classifiers.models",
+           "textpresso_classifiers.service", "textpresso_classifiers.classifiers",
+           "textpresso_classifiers.multimodel"]
+
+PROGRAMS = ["convert_doc_to_txt.py", "tp_classification_client.py", "tp_classification_service.py",
+            "tp_classification_pipeline.py", "tp_doc_classifier.py", "classifiers_comparison.py"]
+
+# the heavy modules whose loading is reported for each entry point
+HEAVY_MODULES = ["sklearn", "nltk", "PyPDF2"]
+
+
+def time_command(command, repeat: int):
+    """run a command in a new process multiple times and measure the best wall time
+
+    :param command: the command to run
+    :param repeat: the number of runs
+    :type repeat: int
+    :return: the best time in seconds and the standard output of the last run
+    :rtype: Tuple[float, str]
+    """
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join([ROOT_DIR] + [path for path in [env.get("PYTHONPATH")] if path])
+    best_time = None
+    output = ""
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        output = subprocess.run(command, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL, env=env, check=True,
+                                universal_newlines=True).stdout
+        elapsed_time = time.perf_counter() - start_time
+        best_time = elapsed_time if best_time is None else min(best_time, elapsed_time)
+    return best_time, output
+
+
+def measure_module(module_name: str, repeat: int):
+    """measure the time to import a module in a new interpreter and the heavy modules loaded by the import
+
+    :param module_name: the name of the module
+    :type module_name: str
+    :param repeat: the number of runs
+    :type repeat: int
+    :return: the best time in seconds and the heavy modules loaded
+    :rtype: Tuple[float, List[str]]
+    """
+    code = "import sys, {}; print(' '.join(m for m in {} if m in sys.modules))".format(module_name, HEAVY_MODULES)
+    elapsed_time, output = time_command([sys.executable, "-c", code], repeat)
+    return elapsed_time, output.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the import time of the package modules and the start-up "
+                                                 "time of the command line programs (with --help)")
+    parser.add_argument("-r", "--repeat", metavar="repeat", dest="repeat", type=int, default=5,
+                        help="number of times each measure is repeated (the best time is reported)")
+    parser.add_argument("-o", "--output-file", metavar="output_file", dest="output_file", type=str, default=None,
+                        help="json file where the results are written, to track them over time")
+    args = parser.parse_args()
+
+    results = {}
+    interpreter_time, _ = time_command([sys.executable, "-c", "pass"], args.repeat)
+    print("entry_point", "time_s", "heavy_modules", sep="\t")
+    print("python", "{:.3f}".format(interpreter_time), "", sep="\t")
+    results["python"] = interpreter_time
+    for module_name in MODULES:
+        elapsed_time, heavy_modules = measure_module(module_name, args.repeat)
+        print(module_name, "{:.3f}".format(elapsed_time), ",".join(heavy_modules), sep="\t")
+        results[module_name] = elapsed_time
+    for program in PROGRAMS:
+        elapsed_time, _ = time_command([sys.executable, os.path.join(ROOT_DIR, "bin", program), "--help"],
+                                       args.repeat)
+        print(program + " --help", "{:.3f}".format(elapsed_time), "", sep="\t")
+        results[program + " --help"] = elapsed_time
+    if args.output_file is not None:
+        with open(args.output_file, "w") as output_file:
+            json.dump({"timestamp": time.time(), "repeat": args.repeat, "import_times": results}, output_file,
+                      indent=2)
+
+
+if __name__ == '__main__':
+    main()
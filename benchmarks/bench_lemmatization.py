@@ -0,0 +1,69 @@
+#!/usr/bin/env python3
+
+"""Compare the speed of feature extraction with lemmatization with and without memoized lemmas and worker processes"""
+
+import argparse
+import os
+import time
+
+from sklearn.feature_extraction.text import TfidfVectorizer
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType, LemmaTokenizer
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def time_feature_extraction(training_dir: str, max_cache_size: int, n_jobs: int):
+    """extract features with lemmatization from the cas files in a directory and measure the time spent
+
+    :param training_dir: the directory containing the cas files, in c_elegans (cas_pdf) and animals (cas_xml)
+        sub-directories
+    :type training_dir: str
+    :param max_cache_size: the size of the memo table of the lemmatizer
+    :type max_cache_size: int
+    :param n_jobs: the number of worker processes used to lemmatize the documents
+    :type n_jobs: int
+    :return: the time spent extracting the features in seconds and the number of memoized lemmas
+    :rtype: Tuple[float, int]
+    """
+    classifier = TextpressoDocumentClassifier()
+    classifier.add_classified_docs_to_dataset(os.path.join(training_dir, "c_elegans"), file_type="cas_pdf", category=1)
+    classifier.add_classified_docs_to_dataset(os.path.join(training_dir, "animals"), file_type="cas_xml", category=0)
+    classifier.generate_training_and_test_sets(percentage_training=0.8)
+    # the lemma tokenizer of the current vectorizer is re-used by feature extraction
+    lemma_tokenizer = LemmaTokenizer(max_cache_size=max_cache_size)
+    classifier.vectorizer = TfidfVectorizer(tokenizer=lemma_tokenizer)
+    start_time = time.perf_counter()
+    classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, lemmatization=True, n_jobs=n_jobs)
+    return time.perf_counter() - start_time, len(lemma_tokenizer.lemma_cache)
+
+
+def main():
+    this_dir = os.path.split(__file__)[0]
+    parser = argparse.ArgumentParser(description="Benchmark feature extraction with lemmatization, with and without "
+                                                 "memoized lemmas and parallel tokenization")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=-1,
+                        help="number of worker processes used for parallel tokenization (-1 to use all the available "
+                             "cpus)")
+    parser.add_argument("-r", "--repeat", metavar="repeat", dest="repeat", type=int, default=3,
+                        help="number of times each measure is repeated (the best time is reported)")
+    parser.add_argument("training_dir", metavar="training_dir", type=str, nargs="?",
+                        default=os.path.join(this_dir, os.pardir, "tests", "datasets", "cas"),
+                        help="directory containing the c_elegans and animals directories of cas files")
+    args = parser.parse_args()
+
+    print("configuration", "time_s", "memoized_lemmas", "speedup", sep="\t")
+    baseline_time = None
+    for configuration, max_cache_size, n_jobs in [("no_memo", 0, 1), ("memo", 200000, 1),
+                                                  ("memo_parallel", 200000, args.n_jobs)]:
+        results = [time_feature_extraction(args.training_dir, max_cache_size, n_jobs) for _ in range(args.repeat)]
+        best_time = min(elapsed_time for elapsed_time, _ in results)
+        if baseline_time is None:
+            baseline_time = best_time
+        print(configuration, "{:.4f}".format(best_time), results[0][1], "{:.2f}".format(baseline_time / best_time),
+              sep="\t")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,111 @@
+#!/usr/bin/env python3
+
+"""Compare the size and the loading time of classifiers saved as pickle files and in the compact inference format"""
+
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from sklearn.svm import SVC
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def train_classifier(training_dir: str, top_n_feat: int):
+    """train a classifier on the cas files in a directory
+
+    :param training_dir: the directory containing the cas files, in c_elegans (cas_pdf) and animals (cas_xml)
+        sub-directories
+    :type training_dir: str
+    :param top_n_feat: the number of features selected for the classifier
+    :type top_n_feat: int
+    :return: the trained classifier
+    :rtype: TextpressoDocumentClassifier
+    """
+    classifier = TextpressoDocumentClassifier()
+    classifier.add_classified_docs_to_dataset(os.path.join(training_dir, "c_elegans"), file_type="cas_pdf", category=1)
+    classifier.add_classified_docs_to_dataset(os.path.join(training_dir, "animals"), file_type="cas_xml", category=0)
+    classifier.generate_training_and_test_sets(percentage_training=1)
+    classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, ngram_range=(1, 2), top_n_feat=top_n_feat)
+    classifier.train_classifier(model=SVC(kernel="linear"))
+    return classifier
+
+
+def time_loading(file_path: str, repeat: int):
+    """load a classifier from file multiple times and measure the best loading time
+
+    :param file_path: the path to the file of the classifier
+    :type file_path: str
+    :param repeat: the number of times the classifier is loaded
+    :type repeat: int
+    :return: the best loading time in seconds and the loaded classifier
+    :rtype: Tuple[float, TextpressoDocumentClassifier]
+    """
+    best_time = None
+    classifier = None
+    for _ in range(repeat):
+        start_time = time.perf_counter()
+        classifier = TextpressoDocumentClassifier.load_from_file(file_path)
+        elapsed_time = time.perf_counter() - start_time
+        best_time = elapsed_time if best_time is None else min(best_time, elapsed_time)
+    return best_time, classifier
+
+
+def main():
+    this_dir = os.path.split(__file__)[0]
+    parser = argparse.ArgumentParser(description="Benchmark the size and the loading time of classifiers saved as "
+                                                 "pickle files and in the compact inference format")
+    parser.add_argument("-m", "--models-dir", metavar="models_dir", dest="models_dir", type=str, default=None,
+                        help="directory containing pickle files of trained classifiers to convert. A classifier is "
+                             "trained on the cas files of training_dir if not specified")
+    parser.add_argument("-b", "--best-features-num", metavar="best_features_size", dest="best_features_size", type=int,
+                        default=1000, help="number of features selected for the classifier trained on training_dir")
+    parser.add_argument("--no-exact-norm", dest="exact_norm", action="store_false", default=True,
+                        help="do not store the weights of the unselected features in the inference format. The files "
+                             "are smaller and faster to load, but TF-IDF vectors are normalized on the selected "
+                             "features only and the predictions may differ from the ones of the pickle files")
+    parser.add_argument("-r", "--repeat", metavar="repeat", dest="repeat", type=int, default=5,
+                        help="number of times each model is loaded (the best time is reported)")
+    parser.add_argument("training_dir", metavar="training_dir", type=str, nargs="?",
+                        default=os.path.join(this_dir, os.pardir, "tests", "datasets", "cas"),
+                        help="directory containing the c_elegans and animals directories of cas files")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    model_files = []
+    if args.models_dir is not None:
+        model_files = [os.path.join(args.models_dir, file) for file in sorted(os.listdir(args.models_dir)) if
+                       file.endswith(".pkl")]
+    else:
+        model_file = os.path.join(tmp_dir, "trained.pkl")
+        train_classifier(args.training_dir, args.best_features_size).save_to_file(model_file)
+        model_files.append(model_file)
+    test_classifier = TextpressoDocumentClassifier()
+    test_classifier.add_classified_docs_to_dataset(os.path.join(args.training_dir, "animals"), file_type="cas_xml",
+                                                   category=0)
+    test_docs = test_classifier.dataset.data
+
+    print("model", "pickle_bytes", "inference_bytes", "pickle_load_s", "inference_load_s", "load_speedup",
+          "same_predictions", sep="\t")
+    for model_file in model_files:
+        inference_file = os.path.join(tmp_dir, os.path.splitext(os.path.basename(model_file))[0] + ".npz")
+        TextpressoDocumentClassifier.load_from_file(model_file).save_for_inference(inference_file,
+                                                                                   exact_norm=args.exact_norm)
+        pickle_time, pickle_classifier = time_loading(model_file, args.repeat)
+        inference_time, inference_classifier = time_loading(inference_file, args.repeat)
+        same_predictions = (pickle_classifier.classifier.predict(pickle_classifier._transform_for_prediction(
+            test_docs)) == inference_classifier.classifier.predict(inference_classifier._transform_for_prediction(
+                test_docs))).all()
+        print(os.path.basename(model_file), os.path.getsize(model_file), os.path.getsize(inference_file),
+              "{:.4f}".format(pickle_time), "{:.4f}".format(inference_time),
+              "{:.2f}".format(pickle_time / inference_time), same_predictions, sep="\t")
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
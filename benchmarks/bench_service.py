@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+
+"""Measure the throughput and the latency of the classification service with concurrent clients, compared with loading
+the models for each batch of documents as separate classification processes do"""
+
+import argparse
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+import numpy as np
+from sklearn.svm import LinearSVC
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.multimodel import MultiModelClassifier
+from textpresso_classifiers.service import ClassificationService, ClassificationClient
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+PROCESS_PER_BATCH_CODE = "import sys; from textpresso_classifiers.multimodel import MultiModelClassifier; " \
+                         "MultiModelClassifier.load_from_dir(sys.argv[1]).predict_texts([open(sys.argv[2]).read()])"
+
+
+def save_models(training_dir: str, models_dir: str, num_models: int):
+    """train classifiers on the cas files in a directory and save them as models of different datatypes
+
+    :param training_dir: the directory containing the cas files, in c_elegans (cas_pdf) and animals (cas_xml)
+        sub-directories
+    :type training_dir: str
+    :param models_dir: the directory where the models are saved
+    :type models_dir: str
+    :param num_models: the number of models to save
+    :type num_models: int
+    :return: the fulltext of the training documents
+    :rtype: List[str]
+    """
+    classifier = TextpressoDocumentClassifier()
+    classifier.add_classified_docs_to_dataset(os.path.join(training_dir, "c_elegans"), file_type="cas_pdf", category=1)
+    classifier.add_classified_docs_to_dataset(os.path.join(training_dir, "animals"), file_type="cas_xml", category=0)
+    classifier.generate_training_and_test_sets(percentage_training=1)
+    texts = list(classifier.training_set.data)
+    for model_idx in range(num_models):
+        classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, ngram_range=(1, 1 + model_idx % 2),
+                                    top_n_feat=1000 * (model_idx + 1))
+        classifier.train_classifier(model=LinearSVC())
+        classifier.save_for_inference(os.path.join(models_dir, "datatype{}_SVM_LINEAR.npz".format(model_idx)))
+    return texts
+
+
+def run_clients(client_factory, texts, num_clients: int, num_requests: int):
+    """send single-document requests from concurrent clients and measure the latency of each request
+
+    :param client_factory: function without arguments that returns a new client
+    :param texts: the documents to classify, sent in turn
+    :type texts: List[str]
+    :param num_clients: the number of concurrent clients
+    :type num_clients: int
+    :param num_requests: the number of requests sent by each client
+    :type num_requests: int
+    :return: the wall time in seconds and the latencies of the requests
+    :rtype: Tuple[float, List[float]]
+    """
+    latencies = []
+    latencies_lock = threading.Lock()
+
+    def send_requests(client_idx):
+        client = client_factory()
+        client_latencies = []
+        for request_idx in range(num_requests):
+            start_time = time.perf_counter()
+            client.predict_texts([texts[(client_idx + request_idx) % len(texts)]])
+            client_latencies.append(time.perf_counter() - start_time)
+        client.close()
+        with latencies_lock:
+            latencies.extend(client_latencies)
+
+    threads = [threading.Thread(target=send_requests, args=(client_idx,)) for client_idx in range(num_clients)]
+    start_time = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return time.perf_counter() - start_time, latencies
+
+
+def main():
+    this_dir = os.path.split(__file__)[0]
+    parser = argparse.ArgumentParser(description="Benchmark the classification service with concurrent clients")
+    parser.add_argument("-d", "--models-dir", metavar="models_dir", dest="models_dir", type=str, default=None,
+                        help="directory of the models to serve, as loaded by tp_multi_doc_classifier.py. Models are "
+                             "trained on the cas files of training_dir if not specified")
+    parser.add_argument("-n", "--num-models", metavar="num_models", dest="num_models", type=int, default=4,
+                        help="number of models trained on training_dir")
+    parser.add_argument("-c", "--clients", metavar="clients", dest="clients", type=str, default="1,4,16",
+                        help="comma separated list of numbers of concurrent clients")
+    parser.add_argument("-r", "--requests", metavar="requests", dest="requests", type=int, default=20,
+                        help="number of single-document requests sent by each client")
+    parser.add_argument("--max-batch-size", metavar="max_batch_size", dest="max_batch_size", type=int, default=64,
+                        help="maximum number of documents classified together by the service")
+    parser.add_argument("--max-wait-ms", metavar="max_wait_ms", dest="max_wait_ms", type=float, default=5,
+                        help="maximum time in milliseconds that a request waits for other requests")
+    parser.add_argument("training_dir", metavar="training_dir", type=str, nargs="?",
+                        default=os.path.join(this_dir, os.pardir, "tests", "datasets", "cas"),
+                        help="directory containing the c_elegans and animals directories of cas files")
+    args = parser.parse_args()
+
+    tmp_dir = tempfile.mkdtemp()
+    models_dir = args.models_dir
+    if models_dir is None:
+        models_dir = os.path.join(tmp_dir, "models")
+        os.makedirs(models_dir)
+        texts = save_models(args.training_dir, models_dir, args.num_models)
+    else:
+        texts = save_models(args.training_dir, tmp_dir, 0)
+
+    # without the service, a new process imports the package and loads all the models for each batch of documents
+    text_file_path = os.path.join(tmp_dir, "document.txt")
+    with open(text_file_path, "w") as text_file:
+        text_file.write(texts[0])
+    process_latencies = []
+    for _ in range(3):
+        start_time = time.perf_counter()
+        subprocess.run([sys.executable, "-c", PROCESS_PER_BATCH_CODE, models_dir, text_file_path], check=True)
+        process_latencies.append(time.perf_counter() - start_time)
+    multi_classifier = MultiModelClassifier.load_from_dir(models_dir)
+
+    print("mode", "clients", "requests", "throughput_docs_s", "mean_latency_ms", "p95_latency_ms", "mean_batch_size",
+          sep="\t")
+    print("process_per_batch", 1, len(process_latencies), "{:.1f}".format(1 / np.mean(process_latencies)),
+          "{:.2f}".format(np.mean(process_latencies) * 1000),
+          "{:.2f}".format(np.percentile(process_latencies, 95) * 1000), 1, sep="\t")
+    for transport in ["tcp", "unix"]:
+        for num_clients in [int(value) for value in args.clients.split(",")]:
+            service = ClassificationService(multi_classifier, max_batch_size=args.max_batch_size,
+                                            max_wait=args.max_wait_ms / 1000)
+            if transport == "tcp":
+                host, port = service.start(port=0)
+                client_factory = lambda: ClassificationClient(host=host, port=port)
+            else:
+                unix_socket = service.start(unix_socket=os.path.join(tmp_dir, "service.sock"))
+                client_factory = lambda: ClassificationClient(unix_socket=unix_socket)
+            wall_time, latencies = run_clients(client_factory, texts, num_clients, args.requests)
+            stats = service.stats
+            service.stop()
+            print("service_" + transport, num_clients, len(latencies), "{:.1f}".format(len(latencies) / wall_time),
+                  "{:.2f}".format(np.mean(latencies) * 1000), "{:.2f}".format(np.percentile(latencies, 95) * 1000),
+                  "{:.2f}".format(stats.get_mean_batch_size()), sep="\t")
+    shutil.rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
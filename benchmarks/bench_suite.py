@@ -0,0 +1,284 @@
+#!/usr/bin/env python3
+
+"""Measure the throughput of each stage of TextpressoDocumentClassifier (text extraction, vectorization, feature
+selection, training and prediction) on synthetic corpora of increasing size, for a set of models and n-gram sizes.
+The results of each run are appended to a history file and compared with a baseline to flag regressions"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+from synthetic_corpus import FILE_TYPES, SyntheticCorpusGenerator, get_corpus
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.models import MODEL_TYPES, create_model, is_dense_model
+from textpresso_classifiers.selection import FeatureSelector, FeatureScorer
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def get_result_key(result):
+    """get the key that identifies the configuration of a benchmark result across runs
+
+    :param result: the benchmark result
+    :type result: Dict[str, Any]
+    :return: the key of the result
+    :rtype: Tuple
+    """
+    return result["stage"], result["file_type"], result["num_docs"], result.get("ngram_size"), result.get("model")
+
+
+def find_regressions(results, baseline_results, tolerance: float = 0.2, min_time_delta: float = 0.05):
+    """compare the results of a run with the results of a baseline run and find the stages that became slower
+
+    A result is a regression if its time exceeds the time of the baseline by more than the tolerance, and by more than
+    a minimum absolute delta, so that the noise of very short stages is not reported
+
+    :param results: the results of the run
+    :type results: List[Dict[str, Any]]
+    :param baseline_results: the results of the baseline run
+    :type baseline_results: List[Dict[str, Any]]
+    :param tolerance: the maximum relative slowdown
+    :type tolerance: float
+    :param min_time_delta: the minimum slowdown in seconds
+    :type min_time_delta: float
+    :return: the results that are regressions, with the time of the baseline and the ratio to it
+    :rtype: List[Dict[str, Any]]
+    """
+    baseline_times = {get_result_key(result): result["time_s"] for result in baseline_results}
+    regressions = []
+    for result in results:
+        baseline_time = baseline_times.get(get_result_key(result))
+        if baseline_time is not None and result["time_s"] > baseline_time * (1 + tolerance) and \
+                result["time_s"] - baseline_time > min_time_delta:
+            regressions.append(dict(result, baseline_time_s=baseline_time,
+                                    ratio=result["time_s"] / baseline_time if baseline_time > 0 else float("inf")))
+    return regressions
+
+
+def get_environment_info():
+    """get the information on the environment of a benchmark run, to tell apart results of different machines and
+    versions of the code
+
+    :return: the information on the environment
+    :rtype: Dict[str, Any]
+    """
+    import sklearn
+    try:
+        revision = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT_DIR, stdout=subprocess.PIPE,
+                                  stderr=subprocess.DEVNULL, check=True, universal_newlines=True).stdout.strip()
+    except Exception:
+        revision = None
+    return {"revision": revision, "hostname": platform.node(), "python": platform.python_version(),
+            "numpy": np.__version__, "sklearn": sklearn.__version__, "cpus": os.cpu_count()}
+
+
+def time_stage(results, stage: str, num_items: int, function, **config):
+    """call a function and record its time as the result of a stage
+
+    :param results: the list where the result is appended
+    :type results: List[Dict[str, Any]]
+    :param stage: the name of the stage
+    :type stage: str
+    :param num_items: the number of documents processed by the stage
+    :type num_items: int
+    :param function: the function to call, without arguments
+    :param config: the configuration of the stage (e.g., file type, number of documents, model)
+    :return: the result of the function
+    """
+    start_time = time.perf_counter()
+    function_result = function()
+    elapsed_time = time.perf_counter() - start_time
+    result = dict(config, stage=stage, time_s=elapsed_time,
+                  docs_per_s=num_items / elapsed_time if elapsed_time > 0 else float("inf"))
+    results.append(result)
+    print(stage, config["file_type"], config["num_docs"], config.get("ngram_size", ""), config.get("model", ""),
+          "{:.3f}".format(elapsed_time), "{:.1f}".format(result["docs_per_s"]), sep="\t", flush=True)
+    return function_result
+
+
+def benchmark_corpus(corpus_dir: str, file_type: str, num_docs: int, ngram_sizes, models, top_n_feat: int,
+                     n_jobs: int):
+    """run all the stages of a classifier on a corpus, for each combination of n-gram size and model
+
+    :param corpus_dir: the directory of the corpus, with positive and negative sub-directories
+    :type corpus_dir: str
+    :param file_type: the type of the files of the corpus
+    :type file_type: str
+    :param num_docs: the number of documents of the corpus
+    :type num_docs: int
+    :param ngram_sizes: the n-gram sizes
+    :type ngram_sizes: List[int]
+    :param models: the types of model, among MODEL_TYPES
+    :type models: List[str]
+    :param top_n_feat: the number of features selected
+    :type top_n_feat: int
+    :param n_jobs: the number of worker processes used to extract the text and to tokenize the documents
+    :type n_jobs: int
+    :return: the results of the stages
+    :rtype: List[Dict[str, Any]]
+    """
+    results = []
+    classifier = TextpressoDocumentClassifier()
+
+    def extract():
+        for category, category_dir in [(1, "positive"), (0, "negative")]:
+            classifier.add_classified_docs_to_dataset(os.path.join(corpus_dir, category_dir), file_type=file_type,
+                                                      category=category, n_jobs=n_jobs)
+
+    time_stage(results, "extraction", num_docs, extract, file_type=file_type, num_docs=num_docs)
+    for ngram_size in ngram_sizes:
+        config = {"file_type": file_type, "num_docs": num_docs, "ngram_size": ngram_size}
+        classifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=0)
+        training_set, test_set = classifier.training_set, classifier.test_set
+        classifier.vocabulary = None
+        time_stage(results, "vectorization", num_docs,
+                   lambda: classifier.extract_features(tokenizer_type=TokenizerType.TFIDF,
+                                                       ngram_range=(1, ngram_size), n_jobs=n_jobs), **config)
+        feature_selector = time_stage(
+            results, "feature_selection", len(training_set.data),
+            lambda: FeatureSelector(scorer=FeatureScorer.CHI2, k=top_n_feat).fit(training_set.tr_features,
+                                                                                 training_set.target), **config)
+        training_set.tr_features = feature_selector.transform(training_set.tr_features)
+        test_set.tr_features = feature_selector.transform(test_set.tr_features)
+        for model_type in models:
+            dense = is_dense_model(model_type)
+            model = create_model(model_type)
+            time_stage(results, "training", len(training_set.data),
+                       lambda: classifier.train_classifier(model=model, dense=dense),
+                       model=model_type, **config)
+            test_results = time_stage(results, "prediction", len(test_set.data),
+                                      lambda: classifier.test_classifier(dense=dense), model=model_type, **config)
+            results[-1]["accuracy"] = test_results.accuracy
+    return results
+
+
+def load_run(file_path: str):
+    """load a benchmark run from a json file. If the file is a history with one run per line, the last run is loaded
+
+    :param file_path: the path to the file
+    :type file_path: str
+    :return: the benchmark run
+    :rtype: Dict[str, Any]
+    """
+    with open(file_path) as run_file:
+        content = run_file.read().strip()
+    try:
+        return json.loads(content)
+    except ValueError:
+        return json.loads(content.splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of the document classifier on synthetic "
+                                                 "corpora, record the results in a history file and flag regressions "
+                                                 "against a baseline")
+    parser.add_argument("-s", "--sizes", metavar="sizes", dest="sizes", type=str, default="1000",
+                        help="comma separated list of corpus sizes (number of documents), e.g., 1000,10000,100000")
+    parser.add_argument("-f", "--file-types", metavar="file_types", dest="file_types", type=str, default="cas_pdf",
+                        help="comma separated list of file types of the corpora, among " + ", ".join(FILE_TYPES))
+    parser.add_argument("-m", "--models", metavar="models", dest="models", type=str, default="SGD,SVM_LINEAR",
+                        help="comma separated list of models, among " + ", ".join(MODEL_TYPES))
+    parser.add_argument("-n", "--ngram-sizes", metavar="ngram_sizes", dest="ngram_sizes", type=str, default="1,2",
+                        help="comma separated list of n-gram sizes")
+    parser.add_argument("-b", "--best-features-num", metavar="best_features_size", dest="best_features_size", type=int,
+                        default=20000, help="number of features to select")
+    parser.add_argument("-l", "--doc-length", metavar="doc_length", dest="doc_length", type=int, default=1000,
+                        help="average number of words of the synthetic documents")
+    parser.add_argument("-c", "--corpus-dir", metavar="corpus_dir", dest="corpus_dir", type=str, default=None,
+                        help="directory where the synthetic corpora are stored and re-used across runs. A temporary "
+                             "directory is used if not specified")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=1,
+                        help="number of worker processes used to generate, extract and tokenize the documents")
+    parser.add_argument("-o", "--history-file", metavar="history_file", dest="history_file", type=str,
+                        default="benchmark_history.jsonl", help="file where the results of the run are appended, as "
+                                                                "a json object per line")
+    parser.add_argument("-B", "--baseline-file", metavar="baseline_file", dest="baseline_file", type=str, default=None,
+                        help="json file with the results of a baseline run, or a history file whose last run is used "
+                             "as baseline")
+    parser.add_argument("--save-baseline", dest="save_baseline", action="store_true",
+                        help="store the results of the run in the baseline file instead of comparing them")
+    parser.add_argument("-t", "--tolerance", metavar="tolerance", dest="tolerance", type=float, default=0.2,
+                        help="relative slowdown with respect to the baseline that is flagged as a regression")
+    parser.add_argument("--min-time-delta", metavar="min_time_delta", dest="min_time_delta", type=float, default=0.05,
+                        help="minimum slowdown in seconds that is flagged as a regression")
+    args = parser.parse_args()
+    if args.save_baseline and args.baseline_file is None:
+        parser.error("--save-baseline requires a baseline file")
+    models = [model.strip() for model in args.models.split(",")]
+    for model in models:
+        if model not in MODEL_TYPES:
+            parser.error("model type not supported: " + model)
+    file_types = [file_type.strip() for file_type in args.file_types.split(",")]
+    for file_type in file_types:
+        if file_type not in FILE_TYPES:
+            parser.error("file type not supported: " + file_type)
+
+    params = {"sizes": [int(size) for size in args.sizes.split(",")], "file_types": file_types, "models": models,
+              "ngram_sizes": [int(ngram_size) for ngram_size in args.ngram_sizes.split(",")],
+              "best_features_size": args.best_features_size, "doc_length": args.doc_length, "n_jobs": args.n_jobs}
+    generator = SyntheticCorpusGenerator(doc_length=args.doc_length)
+    tmp_dir = None
+    corpus_dir = args.corpus_dir
+    if corpus_dir is None:
+        tmp_dir = tempfile.TemporaryDirectory()
+        corpus_dir = tmp_dir.name
+    # the modules loaded on first use are imported before the measures, so that they are not timed as part of a stage
+    FeatureSelector(scorer=FeatureScorer.CHI2).fit(np.ones((2, 1)), [0, 1])
+    for model in models:
+        create_model(model)
+    results = []
+    print("stage", "file_type", "num_docs", "ngram_size", "model", "time_s", "docs_per_s", sep="\t")
+    try:
+        for file_type in file_types:
+            for num_docs in params["sizes"]:
+                start_time = time.perf_counter()
+                corpus_path, generated = get_corpus(corpus_dir, num_docs, file_type, generator, n_jobs=args.n_jobs)
+                if generated:
+                    print("generated corpus", corpus_path, "in", "{:.2f}".format(time.perf_counter() - start_time),
+                          "s", file=sys.stderr)
+                results.extend(benchmark_corpus(corpus_path, file_type, num_docs, params["ngram_sizes"], models,
+                                                args.best_features_size, args.n_jobs))
+    finally:
+        if tmp_dir is not None:
+            tmp_dir.cleanup()
+
+    run = {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "environment": get_environment_info(), "params": params,
+           "results": results}
+    if args.history_file:
+        with open(args.history_file, "a") as history_file:
+            history_file.write(json.dumps(run) + "\n")
+    if args.baseline_file is not None:
+        if args.save_baseline:
+            with open(args.baseline_file, "w") as baseline_file:
+                json.dump(run, baseline_file, indent=2)
+        else:
+            baseline_run = load_run(args.baseline_file)
+            regressions = find_regressions(results, baseline_run["results"], tolerance=args.tolerance,
+                                           min_time_delta=args.min_time_delta)
+            if baseline_run.get("environment", {}).get("hostname") != run["environment"]["hostname"]:
+                print("warning: the baseline was recorded on a different machine", file=sys.stderr)
+            for param in ["doc_length", "best_features_size", "n_jobs"]:
+                if baseline_run.get("params", {}).get(param) != params[param]:
+                    print("warning: the baseline was recorded with a different value of", param, file=sys.stderr)
+            for regression in regressions:
+                print("REGRESSION", regression["stage"], regression["file_type"], regression["num_docs"],
+                      regression.get("ngram_size", ""), regression.get("model", ""),
+                      "{:.3f}s vs {:.3f}s ({:.2f}x)".format(regression["time_s"], regression["baseline_time_s"],
+                                                            regression["ratio"]), sep="\t", file=sys.stderr)
+            if regressions:
+                sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+
+"""Generate synthetic corpora of positive and negative documents in the formats read by the package (txt, cas_pdf,
+cas_xml and pdf), to benchmark the classifiers on any number of documents"""
+
+import argparse
+import gzip
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import partial
+from xml.sax.saxutils import escape
+
+import numpy as np
+from textpresso_classifiers.fileutils import get_num_jobs
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+FILE_TYPES = ["txt", "cas_pdf", "cas_xml", "pdf"]
+FILE_EXTENSIONS = {"txt": ".txt", "cas_pdf": ".tpcas.gz", "cas_xml": ".tpcas.gz", "pdf": ".pdf"}
+CORPUS_INFO_FILE_NAME = "corpus.json"
+
+CAS_HEADER = '<?xml version="1.0" encoding="UTF-8"?><xmi:XMI xmlns:textpresso="http:///org/apache/uima/' \
+             'textpresso.ecore" xmlns:cas="http:///uima/cas.ecore" xmlns:tcas="http:///uima/tcas.ecore" ' \
+             'xmlns:xmi="http://www.omg.org/XMI"  xmi:version="2.0"><cas:NULL xmi:id="0"/> <cas:Sofa xmi:id="1" ' \
+             'sofaNum="1" sofaID="_InitialView" mimeType="text" sofaString="'
+CAS_FOOTER = '"/></xmi:XMI>'
+SYLLABLES = [consonant + vowel for consonant in "bcdfghklmnprstvz" for vowel in "aeiou"]
+LINE_LENGTH = 80
+PDF_LINES_PER_PAGE = 50
+
+
+class SyntheticCorpusGenerator(object):
+    """generate documents made of pseudo-words drawn from a zipfian distribution, as the words of natural language
+
+    Each class has a small set of topic words, which make up a fraction of the words of its documents, so that the
+    documents can be told apart by a classifier. The text of each document only depends on the seed of the generator
+    and on the index of the document, so that the same corpus is generated regardless of the number of processes
+    """
+
+    def __init__(self, vocabulary_size: int = 50000, doc_length: int = 1000, topic_size: int = 200,
+                 topic_ratio: float = 0.02, seed: int = 0):
+        """create a new generator
+
+        :param vocabulary_size: the number of distinct words
+        :type vocabulary_size: int
+        :param doc_length: the average number of words of the documents
+        :type doc_length: int
+        :param topic_size: the number of topic words of each class
+        :type topic_size: int
+        :param topic_ratio: the fraction of the words of each document drawn from the topic words of its class
+        :type topic_ratio: float
+        :param seed: the seed of the random generator
+        :type seed: int
+        """
+        self.vocabulary_size = vocabulary_size
+        self.doc_length = doc_length
+        self.topic_size = topic_size
+        self.topic_ratio = topic_ratio
+        self.seed = seed
+        random_state = np.random.RandomState(seed)
+        words = {}
+        syllables = np.array(SYLLABLES, dtype=object)
+        while len(words) < vocabulary_size:
+            # words of 2 to 4 syllables, generated in bulk and de-duplicated in order of generation
+            candidates = syllables[random_state.randint(0, len(SYLLABLES), size=(vocabulary_size, 4))]
+            num_syllables = random_state.randint(2, 5, size=vocabulary_size)
+            words.update((word, None) for word in ("".join(word_syllables[:length]) for word_syllables, length in
+                                                   zip(candidates.tolist(), num_syllables.tolist())))
+        self.vocabulary = np.array(list(words)[:vocabulary_size])
+        weights = 1 / np.arange(1, vocabulary_size + 1) ** 1.1
+        self.cumulative_weights = np.cumsum(weights) / weights.sum()
+        # topic words are taken from the middle of the distribution, as they are neither stop words nor rare words
+        topic_words_idx = random_state.permutation(np.arange(vocabulary_size // 10, vocabulary_size // 2))
+        self.topic_words_idx = {1: topic_words_idx[:topic_size], 0: topic_words_idx[topic_size:2 * topic_size]}
+
+    def get_info(self):
+        """get the parameters of the generator
+
+        :return: the parameters of the generator
+        :rtype: Dict[str, Any]
+        """
+        return {"vocabulary_size": self.vocabulary_size, "doc_length": self.doc_length, "topic_size": self.topic_size,
+                "topic_ratio": self.topic_ratio, "seed": self.seed}
+
+    def generate_lines(self, doc_idx: int, category: int):
+        """generate the text of a document as a list of lines
+
+        :param doc_idx: the index of the document in the corpus
+        :type doc_idx: int
+        :param category: the class of the document, either 1 (positive) or 0 (negative)
+        :type category: int
+        :return: the lines of the document
+        :rtype: List[str]
+        """
+        random_state = np.random.RandomState([self.seed, doc_idx])
+        num_words = max(int(random_state.normal(self.doc_length, self.doc_length / 4)), 10)
+        words_idx = np.searchsorted(self.cumulative_weights, random_state.rand(num_words))
+        is_topic_word = random_state.rand(num_words) < self.topic_ratio
+        topic_words_idx = self.topic_words_idx[category]
+        words_idx[is_topic_word] = topic_words_idx[random_state.randint(0, len(topic_words_idx),
+                                                                        size=is_topic_word.sum())]
+        words = self.vocabulary[np.minimum(words_idx, self.vocabulary_size - 1)].tolist()
+        # sentences of 8 to 24 words
+        sentence_ends = np.cumsum(random_state.randint(8, 25, size=num_words // 8 + 1))
+        for sentence_start, sentence_end in zip(np.concatenate([[0], sentence_ends[:-1]]), sentence_ends):
+            if sentence_start >= num_words:
+                break
+            words[sentence_start] = words[sentence_start].capitalize()
+            words[min(sentence_end, num_words) - 1] += "."
+        lines = []
+        line_words = []
+        line_length = 0
+        for word in words:
+            line_words.append(word)
+            line_length += len(word) + 1
+            if line_length >= LINE_LENGTH:
+                lines.append(" ".join(line_words))
+                line_words = []
+                line_length = 0
+        if line_words:
+            lines.append(" ".join(line_words))
+        return lines
+
+    def generate_text(self, doc_idx: int, category: int):
+        """generate the text of a document
+
+        :param doc_idx: the index of the document in the corpus
+        :type doc_idx: int
+        :param category: the class of the document, either 1 (positive) or 0 (negative)
+        :type category: int
+        :return: the text of the document
+        :rtype: str
+        """
+        return "\n".join(self.generate_lines(doc_idx, category))
+
+    def write_document(self, file_path: str, doc_idx: int, category: int, file_type: str):
+        """generate a document and write it to file in the specified format
+
+        :param file_path: the path to the file
+        :type file_path: str
+        :param doc_idx: the index of the document in the corpus
+        :type doc_idx: int
+        :param category: the class of the document, either 1 (positive) or 0 (negative)
+        :type category: int
+        :param file_type: the format of the file, among FILE_TYPES
+        :type file_type: str
+        """
+        lines = self.generate_lines(doc_idx, category)
+        if file_type == "txt":
+            with open(file_path, "w") as output_file:
+                output_file.write("\n".join(lines))
+        elif file_type == "cas_pdf":
+            sofa_string = " <_pdf _page=1/> \n" + "".join(line + " <_pdf _cr/> \n" for line in lines)
+            write_compressed_cas(file_path, sofa_string)
+        elif file_type == "cas_xml":
+            sofa_string = "<article>\n <front>\n  <article-meta>\n   <title-group>\n    <article-title>" + \
+                          escape(lines[0]) + "</article-title>\n   </title-group>\n  </article-meta>\n </front>\n" \
+                          " <body>\n  <sec>\n   <p>" + escape(" ".join(lines[1:])) + "</p>\n  </sec>\n </body>\n" \
+                          "</article>\n"
+            write_compressed_cas(file_path, sofa_string)
+        elif file_type == "pdf":
+            with open(file_path, "wb") as output_file:
+                output_file.write(get_pdf_content(lines))
+        else:
+            raise Exception('file type not supported: ' + file_type)
+
+    def generate_corpus(self, output_dir: str, num_docs: int, file_type: str, positive_ratio: float = 0.5,
+                        n_jobs: int = 1):
+        """generate a corpus of documents, stored in the *positive* and *negative* sub-directories of the output
+        directory, as expected by the training programs of the package
+
+        :param output_dir: the directory where the corpus is written
+        :type output_dir: str
+        :param num_docs: the number of documents
+        :type num_docs: int
+        :param file_type: the format of the files, among FILE_TYPES
+        :type file_type: str
+        :param positive_ratio: the fraction of positive documents
+        :type positive_ratio: float
+        :param n_jobs: the number of worker processes used to write the documents
+        :type n_jobs: int
+        """
+        if file_type not in FILE_TYPES:
+            raise Exception('file type not supported: ' + file_type)
+        num_positive = int(num_docs * positive_ratio)
+        tasks = []
+        for category, category_dir in [(1, "positive"), (0, "negative")]:
+            os.makedirs(os.path.join(output_dir, category_dir), exist_ok=True)
+            doc_range = range(num_positive) if category == 1 else range(num_positive, num_docs)
+            tasks.extend((os.path.join(output_dir, category_dir, "doc{:06d}".format(doc_idx) +
+                                       FILE_EXTENSIONS[file_type]), doc_idx, category) for doc_idx in doc_range)
+        n_jobs = get_num_jobs(n_jobs)
+        batches = [tasks[i:i + 1000] for i in range(0, len(tasks), 1000)]
+        if n_jobs > 1:
+            with ProcessPoolExecutor(max_workers=n_jobs) as executor:
+                list(executor.map(partial(_write_documents, self, file_type), batches))
+        else:
+            for batch in batches:
+                _write_documents(self, file_type, batch)
+        with open(os.path.join(output_dir, CORPUS_INFO_FILE_NAME), "w") as info_file:
+            json.dump(dict(self.get_info(), num_docs=num_docs, num_positive=num_positive, file_type=file_type),
+                      info_file, indent=2)
+
+
+def _write_documents(generator: SyntheticCorpusGenerator, file_type: str, tasks):
+    for file_path, doc_idx, category in tasks:
+        generator.write_document(file_path, doc_idx, category, file_type)
+
+
+def write_compressed_cas(file_path: str, sofa_string: str):
+    """write a compressed cas file containing only the sofa string of a document
+
+    :param file_path: the path to the file
+    :type file_path: str
+    :param sofa_string: the (unescaped) sofa string of the document
+    :type sofa_string: str
+    """
+    with gzip.open(file_path, "wt", compresslevel=6) as output_file:
+        output_file.write(CAS_HEADER + escape(sofa_string, {'"': "&quot;", "'": "&apos;", "\n": "&#10;"}) +
+                          CAS_FOOTER)
+
+
+def get_pdf_content(lines):
+    """create a minimal pdf file with the specified lines of text, written with a standard font
+
+    :param lines: the lines of text
+    :type lines: List[str]
+    :return: the content of the pdf file
+    :rtype: bytes
+    """
+    pages_lines = [lines[i:i + PDF_LINES_PER_PAGE] for i in range(0, len(lines), PDF_LINES_PER_PAGE)] or [[]]
+    num_pages = len(pages_lines)
+    # objects: 1 catalog, 2 pages, 3 font, then a page and its content stream for each page
+    objects = ["<< /Type /Catalog /Pages 2 0 R >>",
+               "<< /Type /Pages /Kids [" + " ".join("{} 0 R".format(4 + 2 * i) for i in range(num_pages)) +
+               "] /Count {} >>".format(num_pages),
+               "<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    for page_idx, page_lines in enumerate(pages_lines):
+        stream = "BT /F1 10 Tf 12 TL 50 800 Td\n" + "".join(
+            "(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") + ") Tj T*\n"
+            for line in page_lines) + "ET"
+        objects.append("<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] /Resources << /Font << /F1 3 0 R >> >> "
+                       "/Contents {} 0 R >>".format(5 + 2 * page_idx))
+        objects.append("<< /Length {} >>\nstream\n".format(len(stream.encode("latin-1"))) + stream + "\nendstream")
+    content = b"%PDF-1.4\n"
+    offsets = []
+    for obj_idx, obj in enumerate(objects):
+        offsets.append(len(content))
+        content += "{} 0 obj\n{}\nendobj\n".format(obj_idx + 1, obj).encode("latin-1")
+    xref_offset = len(content)
+    content += "xref\n0 {}\n0000000000 65535 f \n".format(len(objects) + 1).encode("latin-1")
+    content += "".join("{:010d} 00000 n \n".format(offset) for offset in offsets).encode("latin-1")
+    content += "trailer\n<< /Size {} /Root 1 0 R >>\nstartxref\n{}\n%%EOF\n".format(len(objects) + 1,
+                                                                                     xref_offset).encode("latin-1")
+    return content
+
+
+def get_corpus(corpus_dir: str, num_docs: int, file_type: str, generator: SyntheticCorpusGenerator, n_jobs: int = 1):
+    """get the directory of a synthetic corpus, generating the corpus only if it does not exist yet with the same
+    parameters, so that the corpora are re-used across benchmark runs
+
+    :param corpus_dir: the directory containing the synthetic corpora
+    :type corpus_dir: str
+    :param num_docs: the number of documents
+    :type num_docs: int
+    :param file_type: the format of the files, among FILE_TYPES
+    :type file_type: str
+    :param generator: the generator of the documents
+    :type generator: SyntheticCorpusGenerator
+    :param n_jobs: the number of worker processes used to write the documents
+    :type n_jobs: int
+    :return: the directory of the corpus, and whether the corpus has been generated
+    :rtype: Tuple[str, bool]
+    """
+    output_dir = os.path.join(corpus_dir, "{}_{}_{}".format(file_type, num_docs, generator.seed))
+    info_file_path = os.path.join(output_dir, CORPUS_INFO_FILE_NAME)
+    if os.path.isfile(info_file_path):
+        with open(info_file_path) as info_file:
+            info = json.load(info_file)
+        if all(info.get(key) == value for key, value in generator.get_info().items()):
+            return output_dir, False
+        os.remove(info_file_path)
+    generator.generate_corpus(output_dir, num_docs, file_type, n_jobs=n_jobs)
+    return output_dir, True
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic corpus of positive and negative documents")
+    parser.add_argument("output_dir", help="directory where the positive and negative documents are written")
+    parser.add_argument("-n", "--num-docs", metavar="num_docs", dest="num_docs", type=int, default=1000,
+                        help="number of documents")
+    parser.add_argument("-f", "--file-type", metavar="file_type", dest="file_type", type=str, default="cas_pdf",
+                        choices=FILE_TYPES, help="format of the documents")
+    parser.add_argument("-l", "--doc-length", metavar="doc_length", dest="doc_length", type=int, default=1000,
+                        help="average number of words of the documents")
+    parser.add_argument("-v", "--vocabulary-size", metavar="vocabulary_size", dest="vocabulary_size", type=int,
+                        default=50000, help="number of distinct words")
+    parser.add_argument("-p", "--positive-ratio", metavar="positive_ratio", dest="positive_ratio", type=float,
+                        default=0.5, help="fraction of positive documents")
+    parser.add_argument("-s", "--seed", metavar="seed", dest="seed", type=int, default=0,
+                        help="seed of the random generator")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=1,
+                        help="number of worker processes used to write the documents (-1 to use all the available "
+                             "cpus)")
+    args = parser.parse_args()
+
+    start_time = time.perf_counter()
+    generator = SyntheticCorpusGenerator(vocabulary_size=args.vocabulary_size, doc_length=args.doc_length,
+                                         seed=args.seed)
+    generator.generate_corpus(args.output_dir, args.num_docs, args.file_type, positive_ratio=args.positive_ratio,
+                              n_jobs=args.n_jobs)
+    print("documents:", args.num_docs, "time:", "{:.2f}".format(time.perf_counter() - start_time))
+
+
+if __name__ == '__main__':
+    main()
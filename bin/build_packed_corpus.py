@@ -0,0 +1,35 @@
+#!/usr/bin/env python3
+
+"""Pack a directory tree of Textpresso CAS files into an indexed corpus of shard files"""
+
+import argparse
+
+from textpresso_classifiers.corpus import build_packed_corpus, DEFAULT_MAX_SHARD_SIZE
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack a directory tree of compressed CAS files, with one "
+                                                 "sub-directory per paper, into a set of shard files indexed by paper "
+                                                 "id that can be used in place of the directory by the other programs "
+                                                 "of the package")
+    parser.add_argument("-s", "--supplementals-dir", metavar="supplementals_dir", dest="supplementals_dir", type=str,
+                        default=None, help="directory containing the supplemental files of the papers, in "
+                                           "sub-directories whose names start with the paper id followed by a dot")
+    parser.add_argument("-m", "--max-shard-size", metavar="max_shard_size", dest="max_shard_size", type=int,
+                        default=DEFAULT_MAX_SHARD_SIZE // 1024 ** 2, help="maximum size of each shard file in MB")
+    parser.add_argument("input_dir", metavar="input_dir", type=str, help="directory containing the papers")
+    parser.add_argument("output_dir", metavar="output_dir", type=str,
+                        help="directory where to write the packed corpus")
+    args = parser.parse_args()
+    num_papers = build_packed_corpus(input_dir=args.input_dir, output_dir=args.output_dir,
+                                     supplementals_dir=args.supplementals_dir,
+                                     max_shard_size=args.max_shard_size * 1024 ** 2)
+    print("packed", num_papers, "papers")
+
+
+if __name__ == '__main__':
+    main()
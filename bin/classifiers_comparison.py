@@ -3,23 +3,12 @@
 """Classify Textpresso documents into categories using a svm classifier"""
 
 import argparse
+import sys
 
 import numpy as np
-from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
-
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.gaussian_process import GaussianProcessClassifier
-from sklearn.gaussian_process.kernels import RBF
-from sklearn.linear_model import LogisticRegression, SGDClassifier
-from sklearn.naive_bayes import GaussianNB
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.neural_network import MLPClassifier
-from sklearn.tree import DecisionTreeClassifier
-
-from textpresso_classifiers import TextpressoDocumentClassifier, CasType
-from sklearn.svm import SVC
-
-from textpresso_classifiers.classifiers import TokenizerType
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.features import FeatureMatrixCache
+from textpresso_classifiers.fileutils import add_text_cache_arguments, set_text_cache_from_args, print_text_cache_stats
 
 __author__ = "Valerio Arnaboldi"
 
@@ -42,21 +31,38 @@ def main():
     parser.add_argument("-l", "--lemmatize-words", dest="lemmatize", action="store_true", default=False,
                         help="apply lemmatization to text before the analysis "
                              "(https://en.wikipedia.org/wiki/Lemmatisation)")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=1,
+                        help="number of worker processes used to extract the text from the documents and to "
+                             "lemmatize it (-1 to use all the available cpus)")
     parser.add_argument("positive_dataset_dir", metavar="positive_dataset_dir", type=str,
                         help="directory containing the CAS files from which to get data for positive observations")
     parser.add_argument("negative_dataset_dir", metavar="negative_dataset_dir", type=str,
                         help="directory containing the CAS files from which to get data for negative observations")
+    add_text_cache_arguments(parser)
+
     args = parser.parse_args()
+    set_text_cache_from_args(args)
 
     classifier = TextpressoDocumentClassifier()
     classifier.add_classified_docs_to_dataset(dir_path=args.positive_dataset_dir, recursive=True,
-                                              file_type=args.file_type, category=1)
+                                              file_type=args.file_type, category=1, n_jobs=args.n_jobs)
     classifier.add_classified_docs_to_dataset(dir_path=args.negative_dataset_dir, recursive=True,
-                                              file_type=args.file_type, category=0)
+                                              file_type=args.file_type, category=0, n_jobs=args.n_jobs)
     precision = []
     recall = []
     accuracy = []
 
+    # the modules of the models are imported only after parsing the arguments, so that the help is printed quickly
+    from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
+    from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
+    from sklearn.gaussian_process import GaussianProcessClassifier
+    from sklearn.gaussian_process.kernels import RBF
+    from sklearn.naive_bayes import GaussianNB
+    from sklearn.neighbors import KNeighborsClassifier
+    from sklearn.neural_network import MLPClassifier
+    from sklearn.svm import SVC
+    from sklearn.tree import DecisionTreeClassifier
+
     sparse_models = [KNeighborsClassifier(3), SVC(kernel="linear"), SVC(gamma=0.05),
                      DecisionTreeClassifier(), RandomForestClassifier(), MLPClassifier(alpha=1)]
 
@@ -66,19 +72,24 @@ def main():
     models_names = ["knn", "linear svm", "svm", "decision tree", "random forest", "mlp", "naive bayes",
                     "gaussian process", "quad disc analysis", "xgboost"]
 
+    # all the models are trained and tested on the same 10 splits, whose features are extracted only once
+    feature_cache = FeatureMatrixCache()
+
     def train_model(model, densify):
         precision.append([])
         recall.append([])
         accuracy.append([])
-        for _ in range(10):
-            classifier.generate_training_and_test_sets(percentage_training=0.8)
+        for split_seed in range(10):
+            classifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=split_seed)
             if args.tokenizer_type == "BOW":
                 tokenizer_type = TokenizerType.BOW
             else:
                 tokenizer_type = TokenizerType.TFIDF
+            # fit a new vocabulary on each training set
+            classifier.vocabulary = None
             classifier.extract_features(ngram_range=(1, args.ngram_size), lemmatization=args.lemmatize,
                                         stop_words="english", top_n_feat=args.best_features_size,
-                                        tokenizer_type=tokenizer_type)
+                                        tokenizer_type=tokenizer_type, n_jobs=args.n_jobs, feature_cache=feature_cache)
             classifier.train_classifier(model=model, dense=densify)
             test_res = classifier.test_classifier(dense=densify)
             precision[-1].append(test_res.precision)
@@ -98,6 +109,9 @@ def main():
         print("avg accuracy:", np.mean(accuracy[i]), "var:", np.var(accuracy[i]), sep=" ")
         print()
 
+    print("feature matrix cache hits:", feature_cache.hits, "misses:", feature_cache.misses, file=sys.stderr)
+    print_text_cache_stats()
+
 
 if __name__ == '__main__':
     main()
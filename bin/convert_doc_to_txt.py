@@ -1,35 +1,190 @@
 #!/usr/bin/env python3
 
-"""Classify Textpresso documents into categories using a svm classifier"""
+"""Convert Textpresso documents from pdf or CAS format to plain text"""
 
 import argparse
+import os
+import sys
+import time
 import textpresso_classifiers.fileutils
-from textpresso_classifiers import CasType
 
 __author__ = "Valerio Arnaboldi"
 
 __version__ = "1.0.1"
 
 
+CAS_FILE_EXTENSION = ".tpcas.gz"
+
+
+def get_output_name(file_path: str):
+    """get the name of the text file of a converted document, replacing the extension of the document with .txt
+
+    :param file_path: the path to the document, relative to the input directory that contains it
+    :type file_path: str
+    :return: the relative path to the text file
+    :rtype: str
+    """
+    if file_path.endswith(CAS_FILE_EXTENSION):
+        return file_path[:-len(CAS_FILE_EXTENSION)] + ".txt"
+    return os.path.splitext(file_path)[0] + ".txt"
+
+
+def disambiguate_output_names(file_paths):
+    """give distinct text files to the documents whose text files have the same relative path (e.g., documents with
+    the same name in different directories), by replacing their relative paths with the paths of the documents
+    relative to the deepest directory that contains all of them
+
+    :param file_paths: the paths to the documents with the relative paths of their text files
+    :return: the paths to the documents with distinct relative paths of their text files
+    :rtype: List[Tuple[str, str]]
+    :raise: Exception in case the text files of different documents still have the same relative path
+    """
+    docs_by_output_name = {}
+    for file_path, output_name in file_paths:
+        docs_by_output_name.setdefault(output_name, []).append(file_path)
+    output_names = {}
+    for output_name, doc_paths in docs_by_output_name.items():
+        if len(doc_paths) == 1:
+            output_names[doc_paths[0]] = output_name
+        else:
+            common_dir = os.path.commonpath([os.path.abspath(doc_path) for doc_path in doc_paths])
+            for doc_path in doc_paths:
+                output_names[doc_path] = get_output_name(os.path.relpath(os.path.abspath(doc_path), common_dir))
+    file_paths = [(file_path, output_names[file_path]) for file_path, _ in file_paths]
+    if len(set(output_name for _, output_name in file_paths)) < len(file_paths):
+        raise Exception('documents with the same name cannot be written to the same output directory')
+    return file_paths
+
+
+def list_input_files(inputs, manifest_file: str = None):
+    """list the documents to convert, with the relative paths of their text files. Documents listed more than once are
+    converted once, and documents whose text files would have the same relative path are given distinct paths (see
+    :func:`disambiguate_output_names`)
+
+    :param inputs: the paths to files or directories. Directories are scanned recursively, and the text files of their
+        documents keep the same relative paths
+    :param manifest_file: the path to a file listing the paths to the documents, one per line
+    :type manifest_file: str
+    :return: the paths to the documents with the relative paths of their text files
+    :rtype: List[Tuple[str, str]]
+    """
+    file_paths = []
+    if manifest_file is not None:
+        with open(manifest_file) as manifest:
+            inputs = list(inputs) + [line.strip() for line in manifest if line.strip()]
+    for input_path in inputs:
+        if os.path.isdir(input_path):
+            file_paths.extend((file_path, get_output_name(os.path.relpath(file_path, input_path))) for file_path in
+                              sorted(textpresso_classifiers.fileutils.list_files(input_path, recursive=True)))
+        else:
+            file_paths.append((input_path, get_output_name(os.path.basename(input_path))))
+    listed_paths = set()
+    unique_file_paths = []
+    for file_path, output_name in file_paths:
+        if os.path.abspath(file_path) not in listed_paths:
+            listed_paths.add(os.path.abspath(file_path))
+            unique_file_paths.append((file_path, output_name))
+    return disambiguate_output_names(unique_file_paths)
+
+
+def extract_batch(file_paths, file_type: str, n_jobs: int):
+    """extract the text of a batch of documents. If the conversion of the batch fails, the documents are converted one
+    by one, so that a single broken file does not cause the failure of the other files
+
+    :param file_paths: the paths to the documents
+    :param file_type: the type of the documents
+    :type file_type: str
+    :param n_jobs: the number of worker processes
+    :type n_jobs: int
+    :return: the text of each document, or None for the documents that cannot be converted
+    :rtype: List[str]
+    """
+    try:
+        return textpresso_classifiers.fileutils.extract_text_from_files(file_paths, file_type=file_type, n_jobs=n_jobs)
+    except Exception:
+        fulltexts = []
+        for file_path in file_paths:
+            try:
+                fulltexts.append(textpresso_classifiers.fileutils.extract_text_from_file(file_path,
+                                                                                         file_type=file_type))
+            except Exception:
+                fulltexts.append(None)
+        return fulltexts
+
+
+def convert_files(file_paths, output_dir: str, file_type: str, n_jobs: int, batch_size: int):
+    """convert a list of documents to text, in batches distributed over a pool of worker processes, and write the text
+    of each document to the output directory, or to stdout if the output directory is None
+
+    :param file_paths: the paths to the documents with the relative paths of their text files
+    :param output_dir: the directory where the text files are written
+    :type output_dir: str
+    :param file_type: the type of the documents
+    :type file_type: str
+    :param n_jobs: the number of worker processes
+    :type n_jobs: int
+    :param batch_size: the number of documents converted at a time
+    :type batch_size: int
+    :return: the paths to the documents that cannot be converted
+    :rtype: List[str]
+    """
+    failures = []
+    for batch_start in range(0, len(file_paths), batch_size):
+        batch = file_paths[batch_start:batch_start + batch_size]
+        fulltexts = extract_batch([file_path for file_path, _ in batch], file_type, n_jobs)
+        for (file_path, output_name), fulltext in zip(batch, fulltexts):
+            if fulltext is None:
+                failures.append(file_path)
+            elif output_dir is None:
+                print(fulltext)
+            else:
+                output_path = os.path.join(output_dir, output_name)
+                os.makedirs(os.path.dirname(output_path), exist_ok=True)
+                with open(output_path, "w") as output_file:
+                    output_file.write(fulltext + "\n")
+    return failures
+
+
 def main():
-    parser = argparse.ArgumentParser(description="Convert documents from pdf or CAS format to plain text")
+    parser = argparse.ArgumentParser(description="Convert documents from pdf or CAS format to plain text. A single "
+                                                 "input file is printed to stdout. Multiple files, directories or a "
+                                                 "manifest are converted in batches by a pool of worker processes and "
+                                                 "written to the output directory")
     parser.add_argument("-f", "--from", metavar="type_from", dest="type_from", type=str, default="pdf",
                         choices=["pdf", "cas_pdf", "cas_xml"], help="type of files to be processed")
-    parser.add_argument('input_file', help='single document file to be converted')
+    parser.add_argument('input_files', nargs="*", help='document files or directories of documents to be converted')
+    parser.add_argument("-m", "--manifest", metavar="manifest_file", dest="manifest_file", type=str, default=None,
+                        help="file containing the paths to the documents to be converted, one per line")
+    parser.add_argument("-o", "--output-dir", metavar="output_dir", dest="output_dir", type=str, default=None,
+                        help="directory where the text of each document is written, in a file with the same name of "
+                             "the document and .txt extension. Documents in input directories keep their relative "
+                             "paths, and documents with the same name keep their paths relative to the deepest "
+                             "directory that contains all of them. The text is printed to stdout if not specified")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=1,
+                        help="number of worker processes used to convert the documents (-1 to use all the available "
+                             "cpus)")
+    parser.add_argument("--batch-size", metavar="batch_size", dest="batch_size", type=int, default=1000,
+                        help="number of documents converted at a time")
+    textpresso_classifiers.fileutils.add_text_cache_arguments(parser)
 
     args = parser.parse_args()
-    if args.type_from == "pdf":
-        print(textpresso_classifiers.fileutils.extract_text_from_pdf(args.input_file))
-    elif args.type_from == "cas_pdf" or args.type_from == "cas_xml":
-        if args.type_from == "cas_pdf":
-            cas_type = CasType.PDF
-        else:
-            cas_type = CasType.XML
-        print(textpresso_classifiers.fileutils.extract_text_from_cas_content(textpresso_classifiers.fileutils.read_compressed_cas_content(
-            args.input_file), cas_type=cas_type))
-
+    if len(args.input_files) == 0 and args.manifest_file is None:
+        parser.error("at least one input file, directory or manifest is required")
+    textpresso_classifiers.fileutils.set_text_cache_from_args(args)
+    if len(args.input_files) == 1 and os.path.isfile(args.input_files[0]) and args.manifest_file is None and \
+            args.output_dir is None:
+        print(textpresso_classifiers.fileutils.extract_text_from_file(args.input_files[0], file_type=args.type_from))
     else:
-        raise Exception("wrong input file format")
+        start_time = time.perf_counter()
+        file_paths = list_input_files(args.input_files, args.manifest_file)
+        failures = convert_files(file_paths, args.output_dir, args.type_from, args.n_jobs, args.batch_size)
+        elapsed_time = time.perf_counter() - start_time
+        print("files:", len(file_paths), "converted:", len(file_paths) - len(failures), "failed:", len(failures),
+              "time:", "{:.2f}".format(elapsed_time), "files/s:",
+              "{:.2f}".format(len(file_paths) / elapsed_time if elapsed_time > 0 else float("inf")), file=sys.stderr)
+        for file_path in failures:
+            print("cannot convert file", file_path, file=sys.stderr)
+    textpresso_classifiers.fileutils.print_text_cache_stats()
 
 
 if __name__ == '__main__':
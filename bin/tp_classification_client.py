@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+"""Classify Textpresso documents with the classifiers of a running classification service"""
+
+import argparse
+import os
+import sys
+
+from textpresso_classifiers.fileutils import list_files
+from textpresso_classifiers.service import ClassificationClient
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Send the documents in a directory to a running classification "
+                                                 "service (tp_classification_service.py) and print the predictions. "
+                                                 "The output contains a row for each document and a column for each "
+                                                 "classifier, as the output of tp_multi_doc_classifier.py")
+    parser.add_argument("-p", "--predict", metavar="prediction_dir", dest="prediction_dir", type=str, required=True,
+                        help="classify papers in the specified directory. The files are read by the service")
+    parser.add_argument("-f", "--file-type", metavar="file_type", dest="file_type", type=str, default="pdf",
+                        choices=["pdf", "cas_pdf", "cas_xml", "txt"], help="type of files to be processed")
+    parser.add_argument("-H", "--host", metavar="host", dest="host", type=str, default="127.0.0.1",
+                        help="host name or address of the service")
+    parser.add_argument("-P", "--port", metavar="port", dest="port", type=int, default=8795,
+                        help="TCP port of the service")
+    parser.add_argument("-u", "--unix-socket", metavar="unix_socket", dest="unix_socket", type=str, default=None,
+                        help="path to the Unix socket of the service, used instead of the TCP port")
+    parser.add_argument("--batch-size", metavar="batch_size", dest="batch_size", type=int, default=64,
+                        help="number of documents sent in each request")
+
+    args = parser.parse_args()
+    client = ClassificationClient(host=args.host, port=args.port, unix_socket=args.unix_socket)
+    model_names = client.get_model_names()
+    print("paper", *model_names, sep="\t", flush=True)
+    file_paths = list_files(args.prediction_dir, recursive=False)
+    for batch_start in range(0, len(file_paths), args.batch_size):
+        batch_file_paths = file_paths[batch_start:batch_start + args.batch_size]
+        for file_path, predictions in zip(batch_file_paths, client.predict_files(batch_file_paths,
+                                                                                 file_type=args.file_type)):
+            if predictions is None:
+                print("cannot convert file", os.path.basename(file_path), file=sys.stderr)
+                continue
+            scores = [1 if predictions[model_name] > 0.4 else 0 for model_name in model_names]
+            print(os.path.basename(file_path), *scores, sep="\t", flush=True)
+    client.close()
+
+
+if __name__ == '__main__':
+    main()
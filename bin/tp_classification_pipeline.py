@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+"""Classify the papers of a Textpresso data directory into multiple data types, resuming from the papers already
+processed by previous runs"""
+
+import argparse
+import os
+import sys
+
+from textpresso_classifiers.fileutils import add_text_cache_arguments, set_text_cache_from_args
+from textpresso_classifiers.multimodel import MultiModelClassifier
+from textpresso_classifiers.pipeline import ClassificationPipeline, WorkLog, WORK_LOG_FILE_NAME
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Classify the cas files of the papers in a data directory into "
+                                                 "different data types. The processed papers are recorded in an "
+                                                 "indexed work log in the output directory, so that the program can "
+                                                 "be run periodically or after an interruption and only classifies "
+                                                 "the new papers")
+    parser.add_argument("models_dir", metavar="models_dir", type=str,
+                        help="directory containing a model for each data type, named <datatype>_<model_type>.pkl "
+                             "(e.g., geneint_SVM_LINEAR.pkl) or saved in the inference format")
+    parser.add_argument("data_dir", metavar="data_dir", type=str,
+                        help="directory containing a sub-directory for each file type (e.g., 'C. elegans'), with a "
+                             "sub-directory of cas files for each paper")
+    parser.add_argument("output_dir", metavar="output_dir", type=str,
+                        help="directory where the predictions are written, in a sub-directory for each file type and "
+                             "week, with a file for each data type")
+    parser.add_argument("-t", "--file-types", metavar="file_types", dest="file_types", type=str, default="C. elegans",
+                        help="comma separated list of the file types to classify. The cas files of 'C. elegans' papers "
+                             "and of their supplementary materials in 'C. elegans Supplementals' are of type cas_pdf, "
+                             "the others of type cas_xml")
+    parser.add_argument("-D", "--datatypes", metavar="datatypes", dest="datatypes", type=str, default=None,
+                        help="comma separated list of datatypes to classify. All the models in the models dir are "
+                             "applied if not specified")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=1,
+                        help="number of worker processes used to extract the text from the documents (-1 to use all "
+                             "the available cpus)")
+    parser.add_argument("--batch-size", metavar="batch_size", dest="batch_size", type=int, default=1000,
+                        help="number of papers classified at a time. The results are written and recorded in the work "
+                             "log after each batch")
+    parser.add_argument("--prefetch", metavar="prefetch", dest="prefetch", type=int, default=0,
+                        help="number of batches of papers to read and convert in background while classifying the "
+                             "current batch")
+    parser.add_argument("--max-papers", metavar="max_papers", dest="max_papers", type=int, default=None,
+                        help="maximum number of papers of each file type processed in this run")
+    parser.add_argument("--print-stats", dest="print_stats", action="store_true", default=False,
+                        help="print the number of processed papers and the time spent in each stage to stderr")
+    add_text_cache_arguments(parser)
+
+    args = parser.parse_args()
+    set_text_cache_from_args(args)
+
+    datatypes = None
+    if args.datatypes is not None:
+        datatypes = [datatype.strip() for datatype in args.datatypes.split(",")]
+    multi_classifier = MultiModelClassifier.load_from_dir(args.models_dir, datatypes=datatypes)
+    for filetype in [filetype.strip() for filetype in args.file_types.split(",")]:
+        filetype_output_dir = os.path.join(args.output_dir, filetype)
+        os.makedirs(filetype_output_dir, exist_ok=True)
+        work_log_path = os.path.join(filetype_output_dir, WORK_LOG_FILE_NAME)
+        new_work_log = not os.path.exists(work_log_path)
+        work_log = WorkLog(work_log_path)
+        classified_list_path = os.path.join(filetype_output_dir, "already_classified.txt")
+        if new_work_log and os.path.exists(classified_list_path):
+            # papers classified by the shell pipeline
+            with open(classified_list_path) as classified_list:
+                work_log.add_processed(line.strip() for line in classified_list if line.strip())
+        pipeline = ClassificationPipeline(multi_classifier, data_dir=os.path.join(args.data_dir, filetype),
+                                          output_dir=filetype_output_dir, work_log=work_log,
+                                          file_type="cas_pdf" if filetype == "C. elegans" else "cas_xml",
+                                          supplementals_dir=os.path.join(args.data_dir, filetype + " Supplementals"))
+        num_papers = pipeline.run(batch_size=args.batch_size, n_jobs=args.n_jobs, prefetch=args.prefetch,
+                                  max_papers=args.max_papers)
+        if args.print_stats:
+            stats = pipeline.prediction_stats
+            print(filetype, "papers:", num_papers, "classified:", stats.num_docs, "failed:", stats.num_failed,
+                  "wall time:", stats.wall_time, "extraction time:", stats.extraction_time, "extraction wait time:",
+                  stats.extraction_wait_time, "prediction time:", stats.prediction_time, "work log:",
+                  work_log.get_counts(), file=sys.stderr)
+        work_log.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,66 @@
+#!/usr/bin/env python3
+
+"""Run a resident service that holds a set of Textpresso document classifiers in memory and classifies the documents
+sent by its clients"""
+
+import argparse
+import signal
+import sys
+
+from textpresso_classifiers.fileutils import add_text_cache_arguments, set_text_cache_from_args
+from textpresso_classifiers.service import ClassificationService, DEFAULT_MAX_BATCH_SIZE, DEFAULT_MAX_WAIT
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load a set of trained classifiers once and serve predictions for the "
+                                                 "documents or paths sent over a local TCP port or Unix socket. "
+                                                 "Concurrent requests are classified together in batches")
+    parser.add_argument("-d", "--models-dir", metavar="models_dir", dest="models_dir", type=str, required=True,
+                        help="directory containing the classifiers, saved as pickle files named "
+                             "<datatype>_<model_type>.pkl (e.g., geneint_SVM_LINEAR.pkl) or in the inference format as "
+                             "<datatype>_<model_type>.npz files or <datatype>_<model_type>.mmap directories")
+    parser.add_argument("-D", "--datatypes", metavar="datatypes", dest="datatypes", type=str, default=None,
+                        help="comma separated list of datatypes to serve. All the classifiers in the models dir are "
+                             "loaded if not specified")
+    parser.add_argument("-H", "--host", metavar="host", dest="host", type=str, default="127.0.0.1",
+                        help="host name or address on which the service listens")
+    parser.add_argument("-P", "--port", metavar="port", dest="port", type=int, default=8795,
+                        help="TCP port on which the service listens")
+    parser.add_argument("-u", "--unix-socket", metavar="unix_socket", dest="unix_socket", type=str, default=None,
+                        help="path to a Unix socket on which the service listens instead of the TCP port")
+    parser.add_argument("--max-batch-size", metavar="max_batch_size", dest="max_batch_size", type=int,
+                        default=DEFAULT_MAX_BATCH_SIZE,
+                        help="maximum number of documents of concurrent requests classified together")
+    parser.add_argument("--max-wait-ms", metavar="max_wait_ms", dest="max_wait_ms", type=float,
+                        default=DEFAULT_MAX_WAIT * 1000,
+                        help="maximum time in milliseconds that a request waits for other requests to fill its batch")
+    add_text_cache_arguments(parser, "the files sent by path")
+    parser.add_argument("-v", "--verbose", dest="verbose", action="store_true", default=False,
+                        help="log the requests to stderr")
+
+    args = parser.parse_args()
+    set_text_cache_from_args(args)
+
+    datatypes = None
+    if args.datatypes is not None:
+        datatypes = [datatype.strip() for datatype in args.datatypes.split(",")]
+    # the models are imported only after parsing the arguments, so that the help is printed quickly
+    from textpresso_classifiers.multimodel import MultiModelClassifier
+    multi_classifier = MultiModelClassifier.load_from_dir(args.models_dir, datatypes=datatypes)
+    service = ClassificationService(multi_classifier, max_batch_size=args.max_batch_size,
+                                    max_wait=args.max_wait_ms / 1000, verbose=args.verbose)
+    address = service.start(host=args.host, port=args.port, unix_socket=args.unix_socket)
+    print("serving", ", ".join(multi_classifier.get_model_names()), "on", address, file=sys.stderr, flush=True)
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
+    try:
+        service.wait()
+    except (KeyboardInterrupt, SystemExit):
+        service.stop()
+
+
+if __name__ == '__main__':
+    main()
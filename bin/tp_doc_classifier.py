@@ -5,24 +5,22 @@
 import argparse
 
 import os
+import sys
 
 import pickle
-from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
-from sklearn.ensemble import RandomForestClassifier, GradientBoostingClassifier
-from sklearn.gaussian_process import GaussianProcessClassifier
-from sklearn.gaussian_process.kernels import RBF
-from sklearn.naive_bayes import GaussianNB
-from sklearn.neighbors import KNeighborsClassifier
-from sklearn.neural_network import MLPClassifier
-from sklearn.tree import DecisionTreeClassifier
-from sklearn.svm import NuSVR, SVC
-from textpresso_classifiers import TextpressoDocumentClassifier, CasType
-from textpresso_classifiers.classifiers import TokenizerType
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.fileutils import add_text_cache_arguments, set_text_cache_from_args, print_text_cache_stats
+from textpresso_classifiers.models import MODEL_TYPES, create_model, is_dense_model
+from textpresso_classifiers.selection import FeatureScorer
 
 __author__ = "Valerio Arnaboldi"
 
 __version__ = "1.0.1"
 
+# the vectorizer compiled with the exact norm looks up every term of the documents twice, and it is faster than the
+# original vectorizer only on small batches of documents (see benchmarks/bench_compiled_vectorizer.py)
+COMPILED_EXACT_NORM_MAX_BATCH_SIZE = 8
+
 
 def main():
     parser = argparse.ArgumentParser(description="Train a binary classifier and use it to classify Textpresso documents"
@@ -40,22 +38,45 @@ def main():
     parser.add_argument("-c", "--config", metavar="config_file", dest="config_file", type=str,
                         help="path to file where to save the classifier (in case the train option -t is activated) or "
                              "from which to load a previously saved one")
+    parser.add_argument("-s", "--save-for-inference", metavar="inference_model_file", dest="inference_model_file",
+                        type=str, default=None,
+                        help="save the trained classifier also to the specified file in the compact inference format, "
+                             "which can be loaded with -c to classify papers. The file stores the weights of all the "
+                             "terms of the vocabulary to normalize the feature vectors exactly, and it is about half "
+                             "the size of the file of option -c and loads in about the same time. With "
+                             "--selected-norm, only the selected features are stored and the file is much smaller "
+                             "and faster to load (about 30 times smaller and 9 times faster for 1000 features, see "
+                             "benchmarks/bench_model_loading.py)")
+    parser.add_argument("--mmap", dest="mmap", action="store_true", default=False,
+                        help="save the classifier of option -s as a directory of arrays that are memory-mapped "
+                             "read-only when loaded, so that concurrent processes loading the same classifier share "
+                             "its memory. Vectorization is about 1.5 times slower with the memory-mapped classifier, "
+                             "so this only pays off when memory matters more than latency")
     parser.add_argument("-f", "--file-type", metavar="file_type", dest="file_type", type=str, default="pdf",
                         choices=["pdf", "cas_pdf", "cas_xml", "txt"], help="type of files to be processed")
     parser.add_argument("-m", "--model", metavar="model", dest="model", type=str, default="SVM_LINEAR",
-                        choices=["KNN", "SVM_LINEAR", "SVM_NONLINEAR", "TREE", "RF", "MLP", "NAIVEB", "GAUSS", "LDA",
-                                 "XGBOOST"], help="type of model to use")
+                        choices=MODEL_TYPES,
+                        help="type of model to use. Only SGD can be trained with the HASHING tokenizer")
     parser.add_argument("-z", "--tokenizer-type", dest="tokenizer_type", metavar="tokenizer_type", type=str,
-                        default="TFIDF", choices=["BOW", "TFIDF"], help="type of tokenizer to use for feature "
-                                                                        "extraction")
+                        default="TFIDF", choices=["BOW", "TFIDF", "HASHING"],
+                        help="type of tokenizer to use for feature extraction. HASHING trains the model out of core, "
+                             "reading the training documents in batches of --batch-size documents without keeping "
+                             "them in memory")
     parser.add_argument("-n", "--ngram-size", metavar="ngram_size", dest="ngram_size", type=int, default=1,
                         help="number of consecutive words to be considered as a single feature")
     parser.add_argument("-b", "--best-features-num", metavar="best_features_size", dest="best_features_size", type=int,
                         default=20000, help="number of top features to be included in the model after feature "
                                             "selection")
+    parser.add_argument("--feature-scorer", metavar="feature_scorer", dest="feature_scorer", type=str, default="CHI2",
+                        choices=["CHI2", "ANOVA_F", "MUTUAL_INFO"],
+                        help="function used to score the features during feature selection: chi-squared test, ANOVA "
+                             "F-value or mutual information between the presence of the features and the classes")
     parser.add_argument("-l", "--lemmatize-words", dest="lemmatize", action="store_true", default=False,
                         help="apply lemmatization to text before the analysis "
                              "(https://en.wikipedia.org/wiki/Lemmatisation)")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=1,
+                        help="number of worker processes used to extract the text from the documents and to "
+                             "tokenize it (-1 to use all the available cpus)")
     parser.add_argument("-e", "--exclude-words", metavar="exclude_words", dest="exclude_words", type=str, default=None,
                         help="exclude words contained in the provided file (separated by newline) from the vocabulary "
                              "used for feature extraction")
@@ -66,47 +87,88 @@ def main():
                         default=None, help="save the vocabulary of the classifier (the set of textual features along "
                                            "with the feature scores) to the specified file path. Each line will contain"
                                            " the text of the feature and the score separated by tab")
+    parser.add_argument("--batch-size", metavar="batch_size", dest="batch_size", type=int, default=1000,
+                        help="number of documents classified at a time. Results are printed after each batch and "
+                             "memory usage grows with the size of the batches")
+    parser.add_argument("--dense-chunk-size", metavar="dense_chunk_size", dest="dense_chunk_size", type=int,
+                        default=1000, help="number of documents whose features are converted to dense vectors at a "
+                                           "time for the models that require them (NAIVEB, GAUSS, LDA and XGBOOST). "
+                                           "NAIVEB is also trained one chunk at a time")
+    parser.add_argument("--selected-norm", dest="selected_norm", action="store_true", default=False,
+                        help="normalize the TF-IDF feature vectors of the documents to classify (and of the "
+                             "classifier saved with -s) on the selected features only, which makes vectorization "
+                             "faster but scales the vectors differently from the ones used for training (by about 4 "
+                             "times on average with 20000 features selected out of 500000, see "
+                             "benchmarks/bench_compiled_vectorizer.py), and can change the predictions")
+    parser.add_argument("--prefetch", metavar="prefetch", dest="prefetch", type=int, default=0,
+                        help="number of batches of documents to read and convert in background while classifying the "
+                             "current batch")
+    parser.add_argument("--print-stats", dest="print_stats", action="store_true", default=False,
+                        help="print the time spent and the throughput of each stage of classification to stderr")
+    add_text_cache_arguments(parser)
 
     args = parser.parse_args()
+    set_text_cache_from_args(args)
 
     tokenizer = TokenizerType.TFIDF
     if args.tokenizer_type == "BOW":
         tokenizer = TokenizerType.BOW
+    elif args.tokenizer_type == "HASHING":
+        tokenizer = TokenizerType.HASHING
+        if args.test:
+            parser.error("testing is not supported with the HASHING tokenizer")
+        if args.inference_model_file is not None:
+            parser.error("classifiers based on the HASHING tokenizer cannot be saved in the inference format")
 
-    models = {"KNN": (False, KNeighborsClassifier(3)), "SVM_LINEAR": (False, SVC(kernel="linear")),
-              "SVM_NONLINEAR": (False, NuSVR(kernel='sigmoid', gamma=0.05)), "TREE": (False, DecisionTreeClassifier()),
-              "RF": (False, RandomForestClassifier()), "MLP": (False, MLPClassifier(alpha=1)),
-              "NAIVEB": (True, GaussianNB()),
-              "GAUSS": (True, GaussianProcessClassifier(1.0 * RBF(1.0), warm_start=True)),
-              "LDA": (True, QuadraticDiscriminantAnalysis()), "XGBOOST": (True, GradientBoostingClassifier())}
+    # only the module of the selected model is imported
+    dense = is_dense_model(args.model)
 
     classifier = None
-    if args.training_dir is not None:
+    if args.training_dir is not None and tokenizer == TokenizerType.HASHING:
+        classifier = TextpressoDocumentClassifier()
+        classifier.train_classifier_out_of_core(model=create_model(args.model),
+                                                classified_dirs=[(os.path.join(args.training_dir, "positive"), 1),
+                                                                 (os.path.join(args.training_dir, "negative"), 0)],
+                                                file_type=args.file_type, batch_size=args.batch_size,
+                                                ngram_range=(1, args.ngram_size), lemmatization=args.lemmatize,
+                                                n_jobs=args.n_jobs, prefetch=args.prefetch)
+        if args.config_file is not None:
+            classifier.save_to_file(args.config_file)
+    elif args.training_dir is not None:
         classifier = TextpressoDocumentClassifier()
         classifier.add_classified_docs_to_dataset(dir_path=os.path.join(args.training_dir, "positive"), recursive=True,
-                                                  file_type=args.file_type, category=1)
+                                                  file_type=args.file_type, category=1, n_jobs=args.n_jobs)
         classifier.add_classified_docs_to_dataset(dir_path=os.path.join(args.training_dir, "negative"), recursive=True,
-                                                  file_type=args.file_type, category=0)
+                                                  file_type=args.file_type, category=0, n_jobs=args.n_jobs)
         if args.test:
             classifier.generate_training_and_test_sets(percentage_training=0.8)
         else:
             classifier.generate_training_and_test_sets(percentage_training=1)
         classifier.extract_features(tokenizer_type=tokenizer, ngram_range=(1, args.ngram_size),
                                     lemmatization=args.lemmatize, stop_words="english",
-                                    top_n_feat=args.best_features_size)
+                                    top_n_feat=args.best_features_size, n_jobs=args.n_jobs,
+                                    feature_scorer=FeatureScorer[args.feature_scorer])
+        features_updated = True
         if args.include_words is not None:
             words = [word.strip() for word in open(args.include_words)]
-            classifier.add_features(words)
+            features_updated &= classifier.add_features(words)
         if args.exclude_words is not None:
             words = [word.strip() for word in open(args.exclude_words)]
-            classifier.add_features(words)
-        classifier.extract_features(tokenizer_type=tokenizer, ngram_range=(1, args.ngram_size),
-                                    lemmatization=args.lemmatize, stop_words="english",
-                                    top_n_feat=args.best_features_size)
-        classifier.train_classifier(model=models[args.model][1], dense=models[args.model][0])
+            features_updated &= classifier.remove_features(words)
+        if not features_updated:
+            classifier.extract_features(tokenizer_type=tokenizer, ngram_range=(1, args.ngram_size),
+                                        lemmatization=args.lemmatize, stop_words="english",
+                                        top_n_feat=args.best_features_size, n_jobs=args.n_jobs,
+                                        feature_scorer=FeatureScorer[args.feature_scorer])
+        classifier.train_classifier(model=create_model(args.model), dense=dense,
+                                    dense_chunk_size=args.dense_chunk_size)
         if args.test:
-            test_res = classifier.test_classifier(dense=models[args.model][0])
+            test_res = classifier.test_classifier(dense=dense,
+                                                  dense_chunk_size=args.dense_chunk_size)
             print(test_res.precision, test_res.recall, test_res.accuracy, sep="\t")
+        if args.inference_model_file is not None:
+            classifier.save_for_inference(args.inference_model_file, exact_norm=not args.selected_norm,
+                                          mmap=args.mmap)
         if args.config_file is not None:
             classifier.save_to_file(args.config_file)
 
@@ -115,14 +177,30 @@ def main():
 
     if classifier is not None:
         if args.prediction_dir is not None:
-            results = classifier.predict_files(dir_path=args.prediction_dir, file_type=args.file_type,
-                                               dense=models[args.model][0])
-            for i in range(len(results[0])):
-                if results[1][i] > 0.4:
+            if args.selected_norm or args.batch_size <= COMPILED_EXACT_NORM_MAX_BATCH_SIZE:
+                classifier.compile_for_inference(exact_norm=not args.selected_norm)
+            for filename, prediction in classifier.iter_predict_files(dir_path=args.prediction_dir,
+                                                                      file_type=args.file_type,
+                                                                      dense=dense, n_jobs=args.n_jobs,
+                                                                      chunk_size=args.batch_size,
+                                                                      prefetch=args.prefetch,
+                                                                      dense_chunk_size=args.dense_chunk_size):
+                if prediction is None:
+                    print("cannot convert file", filename, file=sys.stderr)
+                    continue
+                if prediction > 0.4:
                     score = 1
                 else:
                     score = 0
-                print(results[0][i], score, sep="\t")
+                print(filename, score, sep="\t", flush=True)
+            if args.print_stats:
+                stats = classifier.prediction_stats
+                print("documents:", stats.num_docs, "failed:", stats.num_failed, "wall time:", stats.wall_time,
+                      "extraction time:", stats.extraction_time, "extraction wait time:", stats.extraction_wait_time,
+                      "vectorization time:", stats.vectorization_time, "prediction time:", stats.prediction_time,
+                      file=sys.stderr)
+                for stage, throughput in stats.get_throughput().items():
+                    print(stage, "throughput (docs/s):", throughput, file=sys.stderr)
 
         if args.vocabulary_file is not None:
             feature_list = classifier.get_features_with_importance()
@@ -130,6 +208,8 @@ def main():
             for feature in feature_list:
                 vocabulary_file.write(feature[0] + "\t" + str(feature[1]) + "\n")
 
+    print_text_cache_stats()
+
 
 if __name__ == '__main__':
     main()
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+
+"""Classify Textpresso documents into multiple categories by applying a set of classifiers in a single pass"""
+
+import argparse
+import sys
+
+from textpresso_classifiers.fileutils import add_text_cache_arguments, set_text_cache_from_args, print_text_cache_stats
+from textpresso_classifiers.multimodel import MultiModelClassifier
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Apply a set of trained classifiers to Textpresso documents in pdf or "
+                                                 "CAS format, reading and analyzing each document only once. The "
+                                                 "output contains a row for each document and a column for each "
+                                                 "classifier")
+    parser.add_argument("-d", "--models-dir", metavar="models_dir", dest="models_dir", type=str, required=True,
+                        help="directory containing the classifiers, saved as pickle files named "
+                             "<datatype>_<model_type>.pkl (e.g., geneint_SVM_LINEAR.pkl) or in the inference format as "
+                             "<datatype>_<model_type>.npz files or <datatype>_<model_type>.mmap directories")
+    parser.add_argument("-p", "--predict", metavar="prediction_dir", dest="prediction_dir", type=str, required=True,
+                        help="classify papers in the specified directory or packed corpus")
+    parser.add_argument("-D", "--datatypes", metavar="datatypes", dest="datatypes", type=str, default=None,
+                        help="comma separated list of datatypes to classify. All the classifiers in the models dir "
+                             "are applied if not specified")
+    parser.add_argument("-f", "--file-type", metavar="file_type", dest="file_type", type=str, default="pdf",
+                        choices=["pdf", "cas_pdf", "cas_xml", "txt"], help="type of files to be processed")
+    parser.add_argument("-j", "--jobs", metavar="n_jobs", dest="n_jobs", type=int, default=1,
+                        help="number of worker processes used to extract the text from the documents (-1 to use all "
+                             "the available cpus)")
+    parser.add_argument("--batch-size", metavar="batch_size", dest="batch_size", type=int, default=1000,
+                        help="number of documents classified at a time. Results are printed after each batch and "
+                             "memory usage grows with the size of the batches")
+    parser.add_argument("--prefetch", metavar="prefetch", dest="prefetch", type=int, default=0,
+                        help="number of batches of documents to read and convert in background while classifying the "
+                             "current batch")
+    parser.add_argument("--print-stats", dest="print_stats", action="store_true", default=False,
+                        help="print the time spent and the throughput of each stage of classification to stderr")
+    add_text_cache_arguments(parser)
+
+    args = parser.parse_args()
+    set_text_cache_from_args(args)
+
+    datatypes = None
+    if args.datatypes is not None:
+        datatypes = [datatype.strip() for datatype in args.datatypes.split(",")]
+    multi_classifier = MultiModelClassifier.load_from_dir(args.models_dir, datatypes=datatypes)
+    model_names = multi_classifier.get_model_names()
+    print("paper", *model_names, sep="\t", flush=True)
+    for filename, predictions in multi_classifier.iter_predict_files(dir_path=args.prediction_dir,
+                                                                     file_type=args.file_type, n_jobs=args.n_jobs,
+                                                                     chunk_size=args.batch_size,
+                                                                     prefetch=args.prefetch):
+        if predictions is None:
+            print("cannot convert file", filename, file=sys.stderr)
+            continue
+        scores = [1 if predictions[model_name] > 0.4 else 0 for model_name in model_names]
+        print(filename, *scores, sep="\t", flush=True)
+    if args.print_stats:
+        stats = multi_classifier.prediction_stats
+        print("documents:", stats.num_docs, "failed:", stats.num_failed, "wall time:", stats.wall_time,
+              "extraction time:", stats.extraction_time, "extraction wait time:", stats.extraction_wait_time,
+              "prediction time:", stats.prediction_time, file=sys.stderr)
+        for stage, throughput in stats.get_throughput().items():
+            print(stage, "throughput (docs/s):", throughput, file=sys.stderr)
+
+    print_text_cache_stats()
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,8 @@ setup(name='textpresso_classifiers',
           'nltk'
       ],
       scripts=['bin/tp_doc_classifier.py', 'bin/classifiers_comparison.py', 'bin/convert_doc_to_txt.py',
+               'bin/build_packed_corpus.py', 'bin/tp_multi_doc_classifier.py', 'bin/tp_classification_service.py',
+               'bin/tp_classification_client.py', 'bin/tp_classification_pipeline.py',
                'wormbase_tools/tp_classification_pipeline.sh'],
       test_suite='nose.collector',
       tests_require=['nose'],
@@ -1,15 +1,36 @@
 """Unit tests for Textpresso document classifiers"""
 
 import unittest
+import copy
 import os
-from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, CasType, TokenizerType
+import pickle
+import shutil
+import tempfile
+import numpy as np
+from unittest import mock
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, CasType, TokenizerType, LemmaTokenizer, \
+    count_terms_parallel, densify, predict_dense
+from textpresso_classifiers.corpus import build_packed_corpus
 from sklearn import svm
+from sklearn.linear_model import SGDClassifier
 from sklearn.naive_bayes import GaussianNB
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
 
 __author__ = "Valerio Arnaboldi"
 __version__ = "1.0.1"
 
 
+class SuffixLemmatizer(object):
+    """lemmatizer that removes the plural suffix of words and counts its calls"""
+
+    def __init__(self):
+        self.num_calls = 0
+
+    def lemmatize(self, word):
+        self.num_calls += 1
+        return word[:-1] if word.endswith("s") else word
+
+
 class TestTextpressoDocumentClassifier(unittest.TestCase):
 
     def setUp(self):
@@ -27,6 +48,43 @@ class TestTextpressoDocumentClassifier(unittest.TestCase):
         self.assertTrue(len(self.tpDocClassifier.dataset.data) == 12)
         self.assertTrue(len(self.tpDocClassifier.dataset.target) == 12)
 
+    def test_add_classified_docs_to_dataset_parallel(self):
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas"),
+                                                            file_type="cas_pdf", category=1)
+        parallel_classifier = TextpressoDocumentClassifier()
+        parallel_classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas"),
+                                                           file_type="cas_pdf", category=1, n_jobs=2)
+        self.assertEqual(len(parallel_classifier.dataset.data), 10)
+        self.assertEqual(self.tpDocClassifier.dataset.filenames, parallel_classifier.dataset.filenames)
+        self.assertEqual(self.tpDocClassifier.dataset.data, parallel_classifier.dataset.data)
+
+    def test_add_classified_docs_from_packed_corpus(self):
+        corpus_dir_path = tempfile.mkdtemp()
+        build_packed_corpus(os.path.join(self.training_dir_path, "cas", "c_elegans"), corpus_dir_path)
+        self.tpDocClassifier.add_classified_docs_to_dataset(corpus_dir_path, file_type="cas_pdf", category=1)
+        self.assertEqual(len(self.tpDocClassifier.dataset.data), 5)
+        self.assertIn("WBPaper00035071", self.tpDocClassifier.dataset.filenames)
+        shutil.rmtree(corpus_dir_path)
+
+    @mock.patch("textpresso_classifiers.classifiers.word_tokenize", str.split)
+    def test_lemma_tokenizer(self):
+        tokenizer = LemmaTokenizer(max_cache_size=3)
+        tokenizer.wnl = SuffixLemmatizer()
+        self.assertEqual(tokenizer("genes and worms and genes"), ["gene", "and", "worm", "and", "gene"])
+        self.assertEqual(tokenizer.wnl.num_calls, 3)
+        self.assertEqual(tokenizer("cells"), ["cell"])
+        self.assertEqual(list(tokenizer.lemma_cache.keys()), ["and", "worms", "cells"])
+        docs = ["alleles of genes", "genes in cells", "mutant worms"]
+        tokenizer.prime(docs, n_jobs=2)
+        num_calls = tokenizer.wnl.num_calls
+        self.assertEqual([tokenizer(doc) for doc in docs], [["allele", "of", "gene"], ["gene", "in", "cell"],
+                                                             ["mutant", "worm"]])
+        self.assertEqual(tokenizer.wnl.num_calls, num_calls)
+        self.assertEqual(len(tokenizer.lemma_cache), 3)
+        tokenizer.clear_primed()
+        unpickled_tokenizer = pickle.loads(pickle.dumps(tokenizer))
+        self.assertEqual(unpickled_tokenizer.lemma_cache, tokenizer.lemma_cache)
+
     def test_generate_training_and_test_sets(self):
         self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
                                                             file_type="cas_pdf", category=1)
@@ -38,6 +96,43 @@ class TestTextpressoDocumentClassifier(unittest.TestCase):
         # call the function twice to re-generate dataset from previously split sets
         self.tpDocClassifier.generate_training_and_test_sets(percentage_training=0.8)
         self.assertGreater(len(self.tpDocClassifier.training_set.data), len(self.tpDocClassifier.test_set.data))
+        self.tpDocClassifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=3)
+        training_filenames = list(self.tpDocClassifier.training_set.filenames)
+        self.tpDocClassifier.generate_training_and_test_sets(percentage_training=0.8)
+        self.tpDocClassifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=3)
+        self.assertEqual(self.tpDocClassifier.training_set.filenames, training_filenames)
+
+    def test_build_corpus(self):
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        corpus = None
+        for random_seed in range(3):
+            self.tpDocClassifier.generate_training_and_test_sets(percentage_training=0.7, random_seed=random_seed)
+            self.tpDocClassifier.vocabulary = None
+            self.tpDocClassifier.extract_features(tokenizer_type=TokenizerType.TFIDF, max_df=0.8, max_features=200)
+            if corpus is not None:
+                # the documents are tokenized only once for all the splits
+                self.assertIs(self.tpDocClassifier.corpus, corpus)
+            corpus = self.tpDocClassifier.corpus
+            vectorizer = TfidfVectorizer(stop_words="english", max_df=0.8, max_features=200)
+            training_features = vectorizer.fit_transform(self.tpDocClassifier.training_set.data)
+            self.assertEqual(self.tpDocClassifier.vectorizer.vocabulary_, vectorizer.vocabulary_)
+            self.assertAlmostEqual(abs(self.tpDocClassifier.training_set.tr_features - training_features).max(), 0)
+            self.assertAlmostEqual(abs(self.tpDocClassifier.test_set.tr_features -
+                                       vectorizer.transform(self.tpDocClassifier.test_set.data)).max(), 0)
+
+    def test_count_terms_parallel(self):
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        docs = self.tpDocClassifier.dataset.data + ["the and of"]
+        vectorizer = CountVectorizer(stop_words="english", ngram_range=(1, 2))
+        counts = vectorizer.fit_transform(docs)
+        parallel_counts, terms = count_terms_parallel(CountVectorizer(stop_words="english", ngram_range=(1, 2)), docs,
+                                                      n_jobs=3)
+        self.assertEqual(terms, sorted(vectorizer.vocabulary_.keys()))
+        self.assertEqual((parallel_counts != counts).nnz, 0)
 
     def test_extract_features(self):
         self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
@@ -83,6 +178,60 @@ class TestTextpressoDocumentClassifier(unittest.TestCase):
         model = GaussianNB()
         self.tpDocClassifier.train_classifier(model=model, dense=True)
 
+    def test_train_classifier_dense_chunks(self):
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        self.tpDocClassifier.generate_training_and_test_sets(percentage_training=0.7, random_seed=0)
+        self.tpDocClassifier.extract_features(tokenizer_type=TokenizerType.TFIDF, top_n_feat=100)
+        self.tpDocClassifier.train_classifier(model=GaussianNB(var_smoothing=1e-3), dense=True)
+        predictions = self.tpDocClassifier.classifier.predict(
+            self.tpDocClassifier.test_set.tr_features.toarray()).tolist()
+        chunked_classifier = TextpressoDocumentClassifier()
+        chunked_classifier.training_set = self.tpDocClassifier.training_set
+        chunked_classifier.test_set = self.tpDocClassifier.test_set
+        # GaussianNB supports incremental learning and is fitted one chunk of rows at a time
+        chunked_classifier.train_classifier(model=GaussianNB(var_smoothing=1e-3), dense=True, dense_chunk_size=2)
+        self.assertEqual(chunked_classifier.classifier.class_count_.tolist(),
+                         self.tpDocClassifier.classifier.class_count_.tolist())
+        # the variance smoothing is computed on the full training set, as done by fit
+        self.assertTrue(np.isclose(chunked_classifier.classifier.epsilon_, self.tpDocClassifier.classifier.epsilon_))
+        self.assertTrue(np.allclose(chunked_classifier.classifier.theta_, self.tpDocClassifier.classifier.theta_,
+                                    atol=1e-6))
+        self.assertTrue(np.allclose(chunked_classifier.classifier.var_, self.tpDocClassifier.classifier.var_,
+                                    atol=1e-6))
+        self.assertEqual(chunked_classifier.classifier.var_smoothing, 1e-3)
+        self.assertEqual(predict_dense(chunked_classifier.classifier, self.tpDocClassifier.test_set.tr_features,
+                                       chunk_size=2).tolist(), predictions)
+        self.assertEqual(densify(self.tpDocClassifier.test_set.tr_features, chunk_size=2).dtype, np.float32)
+
+    def test_train_classifier_out_of_core(self):
+        exception_caught = False
+        try:
+            self.tpDocClassifier.train_classifier_out_of_core(svm.SVC(), [(os.path.join(self.training_dir_path, "cas",
+                                                                                        "c_elegans"), 1)])
+        except Exception:
+            exception_caught = True
+        self.assertTrue(exception_caught)
+        num_docs = self.tpDocClassifier.train_classifier_out_of_core(
+            SGDClassifier(random_state=0), [(os.path.join(self.training_dir_path, "cas", "c_elegans"), 1),
+                                            (os.path.join(self.training_dir_path, "cas", "animals"), 2)],
+            file_type="cas_pdf", batch_size=3, n_features=2 ** 16, n_epochs=2, prefetch=1, random_seed=0)
+        self.assertEqual(num_docs, 10)
+        self.assertIsNone(self.tpDocClassifier.vocabulary)
+        predictions = self.tpDocClassifier.predict_files(dir_path=os.path.join(self.training_dir_path, "cas",
+                                                                               "animals"), file_type="cas_pdf")
+        self.assertEqual(len(predictions[1]), 5)
+        self.assertTrue(all(predictions[1]))
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        self.tpDocClassifier.generate_training_and_test_sets()
+        self.tpDocClassifier.extract_features(tokenizer_type=TokenizerType.HASHING, top_n_feat=50)
+        self.assertEqual(self.tpDocClassifier.training_set.tr_features.shape[1], 50)
+
     def test_test_classifier(self):
         model = svm.SVC()
         self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
@@ -175,6 +324,63 @@ class TestTextpressoDocumentClassifier(unittest.TestCase):
                                                          dense=True)
         self.assertTrue(all(predictions[1]))
 
+    def test_prediction_multiple_files_prefetch(self):
+        model = svm.SVC(gamma=0.1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        self.tpDocClassifier.generate_training_and_test_sets()
+        self.tpDocClassifier.extract_features(ngram_range=(1, 1), top_n_feat=50)
+        self.tpDocClassifier.train_classifier(model=model)
+        predictions = self.tpDocClassifier.predict_files(dir_path=os.path.join(self.training_dir_path, "cas",
+                                                                               "c_elegans"), file_type="cas_pdf")
+        prefetched_predictions = self.tpDocClassifier.predict_files(
+            dir_path=os.path.join(self.training_dir_path, "cas", "c_elegans"), file_type="cas_pdf", batch_size=2,
+            prefetch=2)
+        self.assertEqual(predictions, prefetched_predictions)
+        self.assertEqual(self.tpDocClassifier.prediction_stats.num_docs, 5)
+        self.assertGreater(self.tpDocClassifier.prediction_stats.get_throughput()["extraction"], 0)
+
+    def test_iter_predict_files(self):
+        model = svm.SVC(gamma=0.1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        self.tpDocClassifier.generate_training_and_test_sets()
+        self.tpDocClassifier.extract_features(ngram_range=(1, 1), top_n_feat=50)
+        self.tpDocClassifier.train_classifier(model=model)
+        predictions = self.tpDocClassifier.predict_files(dir_path=os.path.join(self.training_dir_path, "cas",
+                                                                               "animals"), file_type="cas_xml")
+        iter_predictions = self.tpDocClassifier.iter_predict_files(
+            dir_path=os.path.join(self.training_dir_path, "cas", "animals"), file_type="cas_xml", chunk_size=2)
+        first_prediction = next(iter_predictions)
+        self.assertEqual(self.tpDocClassifier.prediction_stats.num_docs, 2)
+        self.assertEqual([first_prediction] + list(iter_predictions), list(zip(*predictions)))
+
+    def test_compile_for_inference(self):
+        model = svm.SVC(gamma=0.1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        self.tpDocClassifier.generate_training_and_test_sets()
+        self.tpDocClassifier.extract_features(tokenizer_type=TokenizerType.TFIDF, ngram_range=(1, 2), top_n_feat=50)
+        self.tpDocClassifier.train_classifier(model=model)
+        tr_features = self.tpDocClassifier.vectorizer.transform(self.tpDocClassifier.training_set.data)[
+                      :, self.tpDocClassifier._get_best_features_idx()]
+        predictions = self.tpDocClassifier.predict_files(dir_path=os.path.join(self.training_dir_path, "cas",
+                                                                               "animals"), file_type="cas_xml")
+        self.tpDocClassifier.compile_for_inference()
+        compiled_tr_features = self.tpDocClassifier.compiled_vectorizer.transform(
+            self.tpDocClassifier.training_set.data)
+        self.assertEqual(compiled_tr_features.shape, (len(self.tpDocClassifier.training_set.data), 50))
+        self.assertAlmostEqual(abs(compiled_tr_features - tr_features).max(), 0.0)
+        self.assertEqual(self.tpDocClassifier.predict_files(dir_path=os.path.join(self.training_dir_path, "cas",
+                                                                                  "animals"), file_type="cas_xml"),
+                         predictions)
+
     def test_get_features_with_importance(self):
         self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
                                                             file_type="cas_pdf", category=1)
@@ -194,6 +400,28 @@ class TestTextpressoDocumentClassifier(unittest.TestCase):
         self.tpDocClassifier.save_to_file("/tmp/classifier.pkl")
         self.assertTrue(os.path.isfile("/tmp/classifier.pkl"))
 
+    def test_save_for_inference(self):
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        self.tpDocClassifier.generate_training_and_test_sets()
+        self.tpDocClassifier.extract_features(tokenizer_type=TokenizerType.TFIDF, ngram_range=(1, 2), top_n_feat=50)
+        self.tpDocClassifier.train_classifier(model=svm.SVC(gamma=0.1))
+        predictions = self.tpDocClassifier.predict_files(dir_path=os.path.join(self.training_dir_path, "cas",
+                                                                               "animals"), file_type="cas_xml")
+        models_dir_path = tempfile.mkdtemp()
+        self.tpDocClassifier.save_for_inference(os.path.join(models_dir_path, "classifier.npz"))
+        inference_classifier = TextpressoDocumentClassifier.load_from_file(os.path.join(models_dir_path,
+                                                                                        "classifier.npz"))
+        shutil.rmtree(models_dir_path)
+        self.assertEqual(len(inference_classifier.get_features_with_importance()), 50)
+        self.assertAlmostEqual(abs(inference_classifier._transform_for_prediction(
+            self.tpDocClassifier.test_set.data) - self.tpDocClassifier.test_set.tr_features).max(), 0.0)
+        self.assertEqual(inference_classifier.predict_files(dir_path=os.path.join(self.training_dir_path, "cas",
+                                                                                  "animals"), file_type="cas_xml"),
+                         predictions)
+
     def test_add_features(self):
         model = svm.SVC()
         self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
@@ -208,6 +436,44 @@ class TestTextpressoDocumentClassifier(unittest.TestCase):
         self.assertEqual(len(self.tpDocClassifier.classifier.predict(self.tpDocClassifier.test_set.tr_features)),
                          len(self.tpDocClassifier.test_set.data))
 
+    def test_edit_features_incrementally(self):
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                            file_type="cas_pdf", category=1)
+        self.tpDocClassifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                            file_type="cas_xml", category=2)
+        self.tpDocClassifier.generate_training_and_test_sets(percentage_training=0.8)
+        self.tpDocClassifier.extract_features(tokenizer_type=TokenizerType.TFIDF, top_n_feat=30)
+        uncached_classifier = copy.deepcopy(self.tpDocClassifier)
+        uncached_classifier.corpus = None
+        corpus = self.tpDocClassifier.corpus
+        old_vocabulary = dict(self.tpDocClassifier.vocabulary)
+        old_features = sorted(old_vocabulary.keys(), key=old_vocabulary.get)
+        for classifier in [self.tpDocClassifier, uncached_classifier]:
+            self.assertTrue(classifier.add_features(["test", "zebrafish"]))
+            self.assertTrue(classifier.remove_features(old_features[:2]))
+        # the feature matrices are updated from the counts of the corpus, without tokenizing the documents again
+        self.assertIs(self.tpDocClassifier.corpus, corpus)
+        for classifier in [self.tpDocClassifier, uncached_classifier]:
+            # the ids of the remaining features do not change and the new features are appended
+            for feature in old_features[2:]:
+                self.assertEqual(classifier.vocabulary[feature], old_vocabulary[feature])
+            self.assertEqual([classifier.vocabulary["test"], classifier.vocabulary["zebrafish"]], [30, 31])
+            self.assertEqual(len(classifier.vocabulary), 32)
+            self.assertEqual(classifier.top_n_feat, 32)
+            for feature in old_features[:2]:
+                self.assertNotIn(feature, classifier.vocabulary)
+                self.assertEqual(classifier.training_set.tr_features[:, old_vocabulary[feature]].nnz, 0)
+            self.assertNotIn(old_features[0], [feature for feature, _ in classifier.get_features_with_importance()])
+            # the matrices are the ones extracted with the edited vocabulary, restricted to the selected features
+            vectorizer = TfidfVectorizer(**dict(classifier.vectorizer.get_params()))
+            vectorizer.fit(classifier.training_set.data)
+            best_features_idx = classifier._get_best_features_idx()
+            self.assertAlmostEqual(abs(classifier.training_set.tr_features - vectorizer.transform(
+                classifier.training_set.data)[:, best_features_idx]).max(), 0)
+            self.assertAlmostEqual(abs(classifier.test_set.tr_features - vectorizer.transform(
+                classifier.test_set.data)[:, best_features_idx]).max(), 0)
+        self.assertEqual(self.tpDocClassifier.vocabulary, uncached_classifier.vocabulary)
+
 
 if __name__ == "__main__":
     unittest.main()
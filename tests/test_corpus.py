@@ -0,0 +1,77 @@
+"""Unit tests for packed corpora"""
+
+import unittest
+import os
+import pickle
+import shutil
+import tempfile
+from textpresso_classifiers.corpus import *
+from textpresso_classifiers.fileutils import CasType, extract_text_from_compressed_cas
+
+
+__author__ = "Valerio Arnaboldi"
+__license__ = "MIT"
+__version__ = "1.0.1"
+
+
+class TestPackedCorpus(unittest.TestCase):
+
+    def setUp(self):
+        this_dir, this_filename = os.path.split(__file__)
+        self.cas_dir_path = os.path.join(this_dir, "datasets", "cas", "c_elegans")
+        self.corpus_dir_path = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.corpus_dir_path)
+
+    def test_build_packed_corpus(self):
+        num_papers = build_packed_corpus(self.cas_dir_path, self.corpus_dir_path, max_shard_size=1024 ** 2)
+        self.assertEqual(num_papers, 5)
+        self.assertTrue(is_packed_corpus(self.corpus_dir_path))
+        self.assertFalse(is_packed_corpus(self.cas_dir_path))
+        self.assertGreater(len([file for file in os.listdir(self.corpus_dir_path) if
+                                file.endswith(SHARD_DATA_EXTENSION)]), 1)
+
+    def test_extract_text(self):
+        build_packed_corpus(self.cas_dir_path, self.corpus_dir_path, max_shard_size=1024 ** 2)
+        corpus = PackedCorpus(self.corpus_dir_path)
+        self.assertEqual(len(corpus), 5)
+        self.assertIn("WBPaper00035071", corpus)
+        self.assertEqual(corpus.extract_text("WBPaper00035071", file_type="cas_pdf"),
+                         extract_text_from_compressed_cas(os.path.join(self.cas_dir_path, "WBPaper00035071.tpcas.gz"),
+                                                          cas_type=CasType.PDF))
+        unpickled_corpus = pickle.loads(pickle.dumps(corpus))
+        self.assertEqual(unpickled_corpus.get_files("WBPaper00050657"), corpus.get_files("WBPaper00050657"))
+        corpus.close()
+        paper_ids, fulltexts = extract_text_from_packed_corpus(self.corpus_dir_path, file_type="cas_pdf")
+        self.assertEqual(extract_text_from_packed_corpus(self.corpus_dir_path, file_type="cas_pdf", n_jobs=2),
+                         (paper_ids, fulltexts))
+
+    def test_get_packed_corpus_after_rebuild(self):
+        build_packed_corpus(self.cas_dir_path, self.corpus_dir_path)
+        corpus = get_packed_corpus(self.corpus_dir_path)
+        self.assertIs(get_packed_corpus(self.corpus_dir_path), corpus)
+        self.assertEqual(len(corpus), 5)
+        old_files = corpus.get_files("WBPaper00050657")
+        cas_dir_path = os.path.join(self.corpus_dir_path, "input")
+        os.makedirs(cas_dir_path)
+        shutil.copy(os.path.join(self.cas_dir_path, "WBPaper00050657.tpcas.gz"), cas_dir_path)
+        build_packed_corpus(cas_dir_path, self.corpus_dir_path)
+        # the previous reader can still be used, and new readers see the re-built corpus
+        self.assertEqual(corpus.get_files("WBPaper00050657"), old_files)
+        self.assertIs(get_packed_corpus(self.corpus_dir_path), corpus)
+        new_corpus = get_packed_corpus(self.corpus_dir_path, refresh=True)
+        self.assertIsNot(new_corpus, corpus)
+        self.assertEqual(new_corpus.get_paper_ids(), ["WBPaper00050657"])
+        self.assertEqual(extract_text_from_packed_corpus(self.corpus_dir_path)[0], ["WBPaper00050657"])
+
+    def test_rebuild_with_fewer_shards(self):
+        build_packed_corpus(self.cas_dir_path, self.corpus_dir_path, max_shard_size=1024 ** 2)
+        build_packed_corpus(self.cas_dir_path, self.corpus_dir_path)
+        self.assertEqual(sorted(file for file in os.listdir(self.corpus_dir_path) if file.startswith("shard-")),
+                         ["shard-00000" + SHARD_DATA_EXTENSION, "shard-00000" + SHARD_INDEX_EXTENSION])
+        self.assertEqual(len(PackedCorpus(self.corpus_dir_path)), 5)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,67 @@
+"""Unit tests for the cache of feature matrices"""
+
+import unittest
+import os
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.features import FeatureMatrixCache
+
+__author__ = "Valerio Arnaboldi"
+__version__ = "1.0.1"
+
+
+class TestFeatureMatrixCache(unittest.TestCase):
+
+    def setUp(self):
+        this_dir = os.path.split(__file__)[0]
+        self.training_dir_path = os.path.join(this_dir, "datasets")
+
+    def get_classifier(self):
+        classifier = TextpressoDocumentClassifier()
+        classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                  file_type="cas_pdf", category=1)
+        classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                  file_type="cas_xml", category=2)
+        return classifier
+
+    def test_extract_features_with_cache(self):
+        feature_cache = FeatureMatrixCache(max_entries=2)
+        first_classifier = self.get_classifier()
+        second_classifier = self.get_classifier()
+        for classifier in [first_classifier, second_classifier]:
+            classifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=1)
+            classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, top_n_feat=50,
+                                        feature_cache=feature_cache)
+        self.assertEqual(feature_cache.misses, 1)
+        self.assertEqual(feature_cache.hits, 1)
+        self.assertIs(first_classifier.training_set.tr_features, second_classifier.training_set.tr_features)
+        self.assertEqual(first_classifier.vocabulary, second_classifier.vocabulary)
+        self.assertIsNot(first_classifier.vocabulary, second_classifier.vocabulary)
+        second_classifier.extract_features(tokenizer_type=TokenizerType.BOW, top_n_feat=50,
+                                           feature_cache=feature_cache)
+        second_classifier.vocabulary = None
+        second_classifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=2)
+        second_classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, top_n_feat=50,
+                                           feature_cache=feature_cache)
+        self.assertEqual(feature_cache.misses, 3)
+        self.assertEqual(len(feature_cache), 2)
+        feature_cache.clear()
+        self.assertEqual(len(feature_cache), 0)
+
+    def test_get_key(self):
+        feature_cache = FeatureMatrixCache()
+        classifier = self.get_classifier()
+        num_docs = len(classifier.dataset.data)
+        keys = []
+        for split_seed in [1, 2, 1]:
+            classifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=split_seed)
+            keys.append(feature_cache.get_key(classifier.training_set, classifier.test_set, {}))
+        self.assertNotEqual(keys[0], keys[1])
+        self.assertEqual(keys[0], keys[2])
+        # the text of each document is hashed once for all the splits
+        self.assertEqual(len(feature_cache._text_digests), num_docs)
+        classifier.training_set.data[0] += " changed"
+        self.assertNotEqual(feature_cache.get_key(classifier.training_set, classifier.test_set, {}), keys[2])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,7 +1,12 @@
 """Unit tests for cas utils"""
 
+import errno
 import unittest
 import os
+import tempfile
+import time
+from unittest import mock
+import textpresso_classifiers.fileutils
 from textpresso_classifiers.fileutils import *
 
 
@@ -31,6 +36,24 @@ class TestCasUtils(unittest.TestCase):
         fulltext = extract_text_from_cas_content(cas_content=cas_content, cas_type=CasType.XML)
         self.assertTrue(len(fulltext) > 0)
 
+    def test_iter_text_from_compressed_cas(self):
+        file_path = os.path.join(self.training_dir_path, "cas", "c_elegans", "WBPaper00035071.tpcas.gz")
+        fulltext = extract_text_from_cas_content(read_compressed_cas_content(file_path), cas_type=CasType.PDF)
+        self.assertEqual("".join(iter_text_from_compressed_cas(file_path, cas_type=CasType.PDF, chunk_size=17)),
+                         fulltext)
+        self.assertEqual(extract_text_from_compressed_cas(file_path, cas_type=CasType.PDF), fulltext)
+        file_path = os.path.join(self.training_dir_path, "cas", "animals", "animals-03-00606.tpcas.gz")
+        fulltext = extract_text_from_cas_content(read_compressed_cas_content(file_path), cas_type=CasType.XML)
+        self.assertEqual(extract_text_from_compressed_cas(file_path, cas_type=CasType.XML), fulltext)
+
+    def test_iter_text_from_article_xml(self):
+        article_xml = "<article><front><p>title</p></front><body>first <sec><p>second <b>third</b> fourth</p>" \
+                      "</sec> fifth<!-- comment --></body><back><body>references</body></back></article>"
+        self.assertEqual("".join(iter_text_from_article_xml([article_xml[i:i + 5] for i in
+                                                             range(0, len(article_xml), 5)])),
+                         extract_text_from_article_xml(article_xml))
+        self.assertEqual("".join(iter_text_from_article_xml(["<article><front>title</front></article>"])), "")
+
     def test_extract_text_from_pdf(self):
         fulltext = extract_text_from_pdf(os.path.join(self.training_dir_path, "pdf", "c_elegans",
                                                       "WBPaper00000003.pdf"))
@@ -39,5 +62,87 @@ class TestCasUtils(unittest.TestCase):
                                                       "WBPaper00000008.pdf"))
         self.assertTrue(len(fulltext) > 0)
 
+    def test_pdf_extraction_engine(self):
+        file_paths = list_files(os.path.join(self.training_dir_path, "pdf", "c_elegans"))
+        slow_file_path = file_paths[0]
+
+        def extract_text(file_path, max_pages=None):
+            if file_path == slow_file_path:
+                time.sleep(60)
+            return "fulltext"
+
+        failures_file_path = os.path.join(tempfile.mkdtemp(), "failures.txt")
+        with mock.patch.object(textpresso_classifiers.fileutils, "_parse_pdf", extract_text):
+            with PdfExtractionEngine(n_jobs=2, timeout=1, failures_file_path=failures_file_path) as engine:
+                start_time = time.time()
+                fulltexts = engine.extract(file_paths)
+                self.assertLess(time.time() - start_time, 30)
+                self.assertIsNone(fulltexts[0])
+                self.assertEqual(fulltexts[1:], ["fulltext"] * (len(file_paths) - 1))
+                self.assertTrue(engine.is_known_failure(slow_file_path))
+            with PdfExtractionEngine(timeout=1, failures_file_path=failures_file_path) as engine:
+                self.assertTrue(engine.is_known_failure(slow_file_path))
+                self.assertIsNone(engine.extract([slow_file_path])[0])
+
+    def test_pdf_extraction_engine_failure_ttl(self):
+        file_paths = list_files(os.path.join(self.training_dir_path, "pdf", "c_elegans"))[:3]
+        broken_file_path, unreadable_file_path, unopenable_file_path = file_paths
+
+        def extract_text(file_path, max_pages=None):
+            if file_path == unreadable_file_path:
+                raise MemoryError()
+            elif file_path == unopenable_file_path:
+                raise OSError(errno.EMFILE, "Too many open files")
+            raise ValueError("malformed pdf")
+
+        failures_file_path = os.path.join(tempfile.mkdtemp(), "failures.txt")
+        with mock.patch.object(textpresso_classifiers.fileutils, "_parse_pdf", extract_text):
+            with PdfExtractionEngine(failure_ttl=0, failures_file_path=failures_file_path) as engine:
+                self.assertEqual(engine.extract(file_paths), [None, None, None])
+                # only the file that cannot be parsed is skipped in later conversions
+                self.assertTrue(engine.is_known_failure(broken_file_path))
+                self.assertFalse(engine.is_known_failure(unreadable_file_path))
+                self.assertFalse(engine.is_known_failure(unopenable_file_path))
+            with PdfExtractionEngine(failures_file_path=failures_file_path) as engine:
+                self.assertTrue(engine.is_known_failure(broken_file_path))
+                self.assertFalse(engine.is_known_failure(unreadable_file_path))
+                self.assertFalse(engine.is_known_failure(unopenable_file_path))
+            self.assertIsNone(extract_text_from_pdf(unopenable_file_path))
+
+    def test_pdf_extraction_engine_dead_worker(self):
+        file_paths = list_files(os.path.join(self.training_dir_path, "pdf", "c_elegans"))
+        with mock.patch.object(textpresso_classifiers.fileutils, "_parse_pdf",
+                               lambda file_path, max_pages=None: "fulltext"):
+            with PdfExtractionEngine() as engine:
+                self.assertEqual(engine.extract(file_paths[:1]), ["fulltext"])
+                # the idle worker dies between two conversions
+                engine._workers[0][0].kill()
+                engine._workers[0][0].join()
+                self.assertEqual(engine.extract(file_paths), ["fulltext"] * len(file_paths))
+
+    def test_get_pdf_extraction_engine(self):
+        file_paths = list_files(os.path.join(self.training_dir_path, "pdf", "c_elegans"))
+        with mock.patch.object(textpresso_classifiers.fileutils, "_parse_pdf",
+                               lambda file_path, max_pages=None: "fulltext"), \
+                mock.patch.object(textpresso_classifiers.fileutils, "_pdf_extraction_engine", None):
+            engine = get_pdf_extraction_engine(n_jobs=2)
+            self.assertEqual(extract_text_from_files(file_paths, file_type="pdf", n_jobs=2),
+                             ["fulltext"] * len(file_paths))
+            worker_pids = [process.pid for process, _ in engine._workers]
+            self.assertEqual(len(worker_pids), 2)
+            self.assertEqual(extract_text_from_file(file_paths[0], file_type="pdf"), "fulltext")
+            self.assertIs(get_pdf_extraction_engine(), engine)
+            self.assertEqual([process.pid for process, _ in engine._workers], worker_pids)
+            engine.close()
+
+    def test_extract_text_from_files(self):
+        file_paths = list_files(os.path.join(self.training_dir_path, "cas", "c_elegans"))
+        self.assertEqual(len(file_paths), 5)
+        fulltexts = extract_text_from_files(file_paths, file_type="cas_pdf")
+        self.assertEqual(fulltexts, extract_text_from_files(file_paths, file_type="cas_pdf", n_jobs=2))
+        self.assertEqual(fulltexts[0], extract_text_from_cas_content(read_compressed_cas_content(file_paths[0]),
+                                                                     cas_type=CasType.PDF))
+
+
 if __name__ == "__main__":
     unittest.main()
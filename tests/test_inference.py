@@ -0,0 +1,113 @@
+"""Unit tests for the inference model formats"""
+
+import unittest
+import os
+import shutil
+import tempfile
+import numpy as np
+from unittest import mock
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType, LemmaTokenizer
+from textpresso_classifiers.inference import CompiledVectorizer, TermIndex, save_inference_model, \
+    load_inference_model
+from sklearn import svm
+from sklearn.feature_extraction.text import TfidfVectorizer
+
+__author__ = "Valerio Arnaboldi"
+__version__ = "1.0.1"
+
+
+class TestInference(unittest.TestCase):
+
+    def setUp(self):
+        this_dir = os.path.split(__file__)[0]
+        self.training_dir_path = os.path.join(this_dir, "datasets")
+
+    def test_term_index(self):
+        terms = ["gene", "worm", "élégans", "gene expression", ""]
+        term_index = TermIndex.build(terms, values=np.arange(len(terms)) * 0.5)
+        self.assertEqual(len(term_index), 5)
+        self.assertEqual(list(term_index.keys()), terms)
+        self.assertEqual(term_index.lookup(["worm", "cell", "élégans", "", "gene"]).tolist(), [1, -1, 2, 4, 0])
+        self.assertEqual(term_index.get("gene expression"), 1.5)
+        self.assertIsNone(term_index.get("cell"))
+        self.assertIn("worm", term_index)
+
+    def test_save_inference_model_mmap(self):
+        classifier = TextpressoDocumentClassifier()
+        classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                  file_type="cas_pdf", category=1)
+        classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                  file_type="cas_xml", category=2)
+        classifier.generate_training_and_test_sets()
+        classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, ngram_range=(1, 2), top_n_feat=3000)
+        classifier.train_classifier(model=svm.LinearSVC())
+        classifier.compile_for_inference()
+        model_dir_path = os.path.join(tempfile.mkdtemp(), "classifier.mmap")
+        save_inference_model(model_dir_path, classifier.compiled_vectorizer, classifier.classifier, mmap=True)
+        compiled_vectorizer, model, _ = load_inference_model(model_dir_path)
+        self.assertIsInstance(compiled_vectorizer.vocabulary_, TermIndex)
+        # the coefficients of the model are read from the memory-mapped files
+        self.assertFalse(model.coef_.flags.writeable)
+        tr_features = compiled_vectorizer.transform(classifier.test_set.data)
+        self.assertAlmostEqual(abs(tr_features - classifier.test_set.tr_features).max(), 0.0)
+        self.assertEqual(model.predict(tr_features).tolist(),
+                         classifier.classifier.predict(classifier.test_set.tr_features).tolist())
+        shutil.rmtree(os.path.dirname(model_dir_path))
+
+    @mock.patch("textpresso_classifiers.classifiers.word_tokenize", str.split)
+    def test_save_inference_model_lemmas(self):
+        tokenizer = LemmaTokenizer()
+        tokenizer.wnl = mock.Mock(lemmatize=lambda word: word[:-1] if word.endswith("s") else word)
+        vectorizer = TfidfVectorizer(tokenizer=tokenizer).fit(["genes of worms", "cells and genes"])
+        tokenizers = {LemmaTokenizer.__module__ + "." + LemmaTokenizer.__name__: LemmaTokenizer}
+        model_dir_path = tempfile.mkdtemp()
+        for file_name, mmap in [("classifier.npz", False), ("classifier.mmap", True)]:
+            save_inference_model(os.path.join(model_dir_path, file_name), CompiledVectorizer(vectorizer), None,
+                                 mmap=mmap)
+            compiled_vectorizer, _, _ = load_inference_model(os.path.join(model_dir_path, file_name), tokenizers)
+            self.assertEqual(compiled_vectorizer.vectorizer.tokenizer.get_lemmas(), tokenizer.get_lemmas())
+        shutil.rmtree(model_dir_path)
+
+    def test_save_inference_model_replace(self):
+        vectorizer = TfidfVectorizer().fit(["genes of worms", "cells and genes"])
+        model_dir_path = os.path.join(tempfile.mkdtemp(), "classifier.mmap")
+        save_inference_model(model_dir_path, CompiledVectorizer(vectorizer), [np.arange(1024.0), np.arange(2048.0)],
+                             mmap=True)
+        _, model, _ = load_inference_model(model_dir_path)
+        np.save(os.path.join(model_dir_path, "stale.npy"), np.zeros(3))
+        save_inference_model(model_dir_path, CompiledVectorizer(vectorizer), [np.ones(1024)], mmap=True)
+        # the arrays of the previous model are still readable by the processes that loaded it
+        self.assertEqual(model[1].tolist(), list(range(2048)))
+        _, new_model, _ = load_inference_model(model_dir_path)
+        self.assertEqual(new_model[0].tolist(), [1.0] * 1024)
+        self.assertEqual(sorted(file for file in os.listdir(model_dir_path) if file.startswith("model_array")),
+                         ["model_array_0.npy"])
+        self.assertEqual(os.listdir(os.path.dirname(model_dir_path)), ["classifier.mmap"])
+        shutil.rmtree(os.path.dirname(model_dir_path))
+
+    def test_save_inference_model_arrays(self):
+        vectorizer = TfidfVectorizer().fit(["genes of worms", "cells and genes"])
+        shared_array = np.arange(1024.0)
+        model = {"shared": [shared_array, shared_array], "small": np.arange(3), "fortran": np.asfortranarray(
+            np.ones((64, 32)))}
+        model_dir_path = tempfile.mkdtemp()
+        for file_name, mmap in [("classifier.npz", False), ("classifier.mmap", True)]:
+            file_path = os.path.join(model_dir_path, file_name)
+            save_inference_model(file_path, CompiledVectorizer(vectorizer), model, mmap=mmap)
+            _, loaded_model, _ = load_inference_model(file_path)
+            self.assertIs(loaded_model["shared"][0], loaded_model["shared"][1])
+            self.assertEqual(loaded_model["shared"][0].tolist(), shared_array.tolist())
+            self.assertEqual(loaded_model["small"].tolist(), [0, 1, 2])
+            self.assertTrue(loaded_model["fortran"].flags.f_contiguous)
+            # the large arrays are stored as arrays of the file, once each
+            if mmap:
+                array_names = [file[:-len(".npy")] for file in os.listdir(file_path) if file.startswith("model_")]
+            else:
+                with np.load(file_path) as arrays:
+                    array_names = [array_name for array_name in arrays.files if array_name.startswith("model_")]
+            self.assertEqual(sorted(array_names), ["model_array_0", "model_array_1"])
+        shutil.rmtree(model_dir_path)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,45 @@
+"""Unit tests for the creation of models and the lazy imports of the package"""
+
+import unittest
+import os
+import subprocess
+import sys
+from textpresso_classifiers.models import MODEL_TYPES, create_model, is_dense_model
+
+__author__ = "Valerio Arnaboldi"
+__version__ = "1.0.1"
+
+
+class TestModels(unittest.TestCase):
+
+    def test_create_model(self):
+        for model_type in MODEL_TYPES:
+            model = create_model(model_type)
+            self.assertTrue(hasattr(model, "fit"))
+            self.assertIsNot(model, create_model(model_type))
+        self.assertEqual(create_model("KNN").n_neighbors, 3)
+        self.assertEqual(create_model("SVM_LINEAR").kernel, "linear")
+        self.assertRaises(Exception, create_model, "UNKNOWN")
+
+    def test_is_dense_model(self):
+        self.assertEqual([model_type for model_type in MODEL_TYPES if is_dense_model(model_type)],
+                         ["NAIVEB", "GAUSS", "LDA", "XGBOOST"])
+
+    def test_lazy_imports(self):
+        root_dir = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([root_dir] + [path for path in [env.get("PYTHONPATH")] if path])
+        code = "import sys, textpresso_classifiers.fileutils, textpresso_classifiers.models, " \
+               "textpresso_classifiers.service; print(' '.join(sorted(m for m in ['sklearn', 'nltk', 'PyPDF2'] " \
+               "if m in sys.modules)))"
+        output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, env=env, check=True,
+                                universal_newlines=True).stdout
+        self.assertEqual(output.strip(), "")
+        code = "import textpresso_classifiers; print(textpresso_classifiers.TextpressoDocumentClassifier.__name__)"
+        output = subprocess.run([sys.executable, "-c", code], stdout=subprocess.PIPE, env=env, check=True,
+                                universal_newlines=True).stdout
+        self.assertEqual(output.strip(), "TextpressoDocumentClassifier")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Unit tests for multi-model classification"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.multimodel import MultiModelClassifier
+from sklearn import svm
+
+__author__ = "Valerio Arnaboldi"
+__version__ = "1.0.1"
+
+
+class TestMultiModelClassifier(unittest.TestCase):
+
+    def setUp(self):
+        this_dir = os.path.split(__file__)[0]
+        self.training_dir_path = os.path.join(this_dir, "datasets")
+        self.classifiers = {}
+        for name, tokenizer_type, ngram_range in [("tfidf", TokenizerType.TFIDF, (1, 1)),
+                                                  ("bow", TokenizerType.BOW, (1, 1)),
+                                                  ("bigrams", TokenizerType.TFIDF, (1, 2))]:
+            classifier = TextpressoDocumentClassifier()
+            classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                      file_type="cas_pdf", category=1)
+            classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                      file_type="cas_xml", category=2)
+            classifier.generate_training_and_test_sets()
+            classifier.extract_features(tokenizer_type=tokenizer_type, ngram_range=ngram_range, top_n_feat=50)
+            classifier.train_classifier(model=svm.SVC(gamma=0.1))
+            self.classifiers[name] = classifier
+
+    def test_predict_texts(self):
+        multi_classifier = MultiModelClassifier()
+        for name, classifier in self.classifiers.items():
+            multi_classifier.add_classifier(name, classifier)
+        self.assertEqual(multi_classifier.get_model_names(), ["tfidf", "bow", "bigrams"])
+        self.assertEqual(len(multi_classifier._get_groups()), 2)
+        texts = self.classifiers["tfidf"].training_set.data
+        predictions = multi_classifier.predict_texts(texts)
+        for name, classifier in self.classifiers.items():
+            tr_features = classifier.vectorizer.transform(texts)[:, classifier._get_best_features_idx()]
+            self.assertEqual(predictions[name], classifier.classifier.predict(tr_features).tolist())
+
+    def test_predict_texts_inference_models(self):
+        models_dir_path = tempfile.mkdtemp()
+        self.classifiers["tfidf"].save_for_inference(os.path.join(models_dir_path, "tfidf.mmap"), mmap=True)
+        self.classifiers["bow"].save_to_file(os.path.join(models_dir_path, "bow.pkl"))
+        self.classifiers["bigrams"].save_for_inference(os.path.join(models_dir_path, "bigrams.npz"))
+        multi_classifier = MultiModelClassifier.load_from_dir(models_dir_path)
+        # the model loaded from the inference format is grouped with the model with the same analyzer
+        self.assertEqual(sorted(group.model_names for group in multi_classifier._get_groups()),
+                         [["bigrams"], ["bow", "tfidf"]])
+        texts = self.classifiers["tfidf"].test_set.data
+        predictions = multi_classifier.predict_texts(texts)
+        for name, classifier in self.classifiers.items():
+            tr_features = classifier.vectorizer.transform(texts)[:, classifier._get_best_features_idx()]
+            self.assertEqual(predictions[name], classifier.classifier.predict(tr_features).tolist())
+        shutil.rmtree(models_dir_path)
+
+    def test_iter_predict_files(self):
+        models_dir_path = tempfile.mkdtemp()
+        self.classifiers["tfidf"].save_to_file(os.path.join(models_dir_path, "geneint_SVM_LINEAR.pkl"))
+        self.classifiers["bigrams"].save_for_inference(os.path.join(models_dir_path,
+                                                                    "expression_cluster_SVM_LINEAR.npz"))
+        multi_classifier = MultiModelClassifier.load_from_dir(models_dir_path)
+        shutil.rmtree(models_dir_path)
+        self.assertEqual(multi_classifier.get_model_names(), ["expression_cluster", "geneint"])
+        predictions = list(multi_classifier.iter_predict_files(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                               file_type="cas_xml", chunk_size=2))
+        self.assertEqual(multi_classifier.prediction_stats.num_docs, 5)
+        for name, classifier in [("geneint", self.classifiers["tfidf"]),
+                                 ("expression_cluster", self.classifiers["bigrams"])]:
+            self.assertEqual([(filename, prediction[name]) for filename, prediction in predictions],
+                             list(zip(*classifier.predict_files(os.path.join(self.training_dir_path, "cas",
+                                                                             "animals"), file_type="cas_xml"))))
+
+
+if __name__ == "__main__":
+    unittest.main()
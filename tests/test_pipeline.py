@@ -0,0 +1,113 @@
+"""Unit tests for the resumable classification pipeline"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.fileutils import extract_text_from_file, join_paper_texts
+from textpresso_classifiers.multimodel import MultiModelClassifier
+from textpresso_classifiers.pipeline import ClassificationPipeline, WorkLog, WORK_LOG_FILE_NAME
+from sklearn import svm
+
+__author__ = "Valerio Arnaboldi"
+__version__ = "1.0.1"
+
+
+class TestClassificationPipeline(unittest.TestCase):
+
+    def setUp(self):
+        this_dir = os.path.split(__file__)[0]
+        self.training_dir_path = os.path.join(this_dir, "datasets")
+        self.tmp_dir_path = tempfile.mkdtemp()
+        self.data_dir_path = os.path.join(self.tmp_dir_path, "C. elegans")
+        self.supplementals_dir_path = os.path.join(self.tmp_dir_path, "C. elegans Supplementals")
+        self.output_dir_path = os.path.join(self.tmp_dir_path, "output")
+        cas_dir_path = os.path.join(self.training_dir_path, "cas", "c_elegans")
+        for file in sorted(os.listdir(cas_dir_path)):
+            paper_id = file.split(".")[0]
+            os.makedirs(os.path.join(self.data_dir_path, paper_id, "images"))
+            shutil.copy(os.path.join(cas_dir_path, file), os.path.join(self.data_dir_path, paper_id))
+        os.makedirs(os.path.join(self.supplementals_dir_path, "WBPaper00035071_sup1"))
+        shutil.copy(os.path.join(cas_dir_path, "WBPaper00000079.tpcas.gz"),
+                    os.path.join(self.supplementals_dir_path, "WBPaper00035071_sup1"))
+        self.multi_classifier = MultiModelClassifier()
+        for name, ngram_range in [("geneint", (1, 1)), ("rnai", (1, 2))]:
+            classifier = TextpressoDocumentClassifier()
+            classifier.add_classified_docs_to_dataset(cas_dir_path, file_type="cas_pdf", category=1)
+            classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                      file_type="cas_xml", category=0)
+            classifier.generate_training_and_test_sets(percentage_training=1)
+            classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, ngram_range=ngram_range, top_n_feat=50)
+            classifier.train_classifier(model=svm.LinearSVC())
+            self.multi_classifier.add_classifier(name, classifier)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmp_dir_path)
+
+    def get_pipeline(self):
+        work_log = WorkLog(os.path.join(self.tmp_dir_path, WORK_LOG_FILE_NAME))
+        return ClassificationPipeline(self.multi_classifier, self.data_dir_path, self.output_dir_path, work_log,
+                                      supplementals_dir=self.supplementals_dir_path)
+
+    def read_output(self, datatype):
+        output_lines = []
+        for week_dir in sorted(os.listdir(self.output_dir_path)):
+            with open(os.path.join(self.output_dir_path, week_dir, datatype + ".txt")) as output_file:
+                output_lines.extend(line.rstrip("\n").split("\t") for line in output_file)
+        return output_lines
+
+    def test_get_paper_files(self):
+        pipeline = self.get_pipeline()
+        self.assertEqual([os.path.basename(file_path) for file_path in pipeline.get_paper_files("WBPaper00035071")],
+                         ["WBPaper00035071.tpcas.gz", "WBPaper00000079.tpcas.gz"])
+        self.assertEqual(len(pipeline.get_paper_files("WBPaper00000079")), 1)
+        pipeline.work_log.close()
+
+    def test_run(self):
+        pipeline = self.get_pipeline()
+        os.makedirs(os.path.join(self.data_dir_path, "WBPaper00099999"))
+        pipeline.work_log.add_processed(["WBPaper00000079"])
+        self.assertEqual(pipeline.run(batch_size=2, max_papers=3), 3)
+        self.assertEqual(pipeline.prediction_stats.num_failed, 0)
+        self.assertEqual(pipeline.list_pending_papers(), ["WBPaper00050657", "WBPaper00099999"])
+        pipeline.work_log.close()
+        # the next run only processes the pending papers, and papers without cas files are recorded as failed
+        pipeline = self.get_pipeline()
+        self.assertEqual(pipeline.run(batch_size=2), 2)
+        self.assertEqual(pipeline.work_log.get_counts(), {"classified": 5, "failed": 1})
+        pipeline.work_log.close()
+        paper_ids = ["WBPaper00026763", "WBPaper00035071", "WBPaper00041231", "WBPaper00050657"]
+        texts = [extract_text_from_file(os.path.join(self.data_dir_path, paper_id, paper_id + ".tpcas.gz"),
+                                        file_type="cas_pdf") for paper_id in paper_ids]
+        texts[1] = join_paper_texts([texts[1], extract_text_from_file(os.path.join(
+            self.data_dir_path, "WBPaper00000079", "WBPaper00000079.tpcas.gz"), file_type="cas_pdf")])
+        predictions = self.multi_classifier.predict_texts(texts)
+        for datatype, model_predictions in predictions.items():
+            self.assertEqual(self.read_output(datatype),
+                             [[paper_id + ".concat.txt", str(1 if prediction > 0.4 else 0)] for paper_id, prediction in
+                              zip(paper_ids, model_predictions)])
+
+    def test_resume_interrupted_export(self):
+        pipeline = self.get_pipeline()
+        with mock.patch.object(ClassificationPipeline, "_export_batch", side_effect=KeyboardInterrupt):
+            with self.assertRaises(KeyboardInterrupt):
+                pipeline.run(batch_size=2)
+        pipeline.work_log.close()
+        pipeline = self.get_pipeline()
+        self.assertEqual(pipeline.work_log.get_unexported_batches(), [1])
+        # simulate a batch partially written to the output files before the interruption
+        for datatype, (file_path, _) in pipeline.work_log.get_batch_outputs(1).items():
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "w") as output_file:
+                output_file.write("WBPaper00000079.concat.txt\t")
+        self.assertEqual(pipeline.run(batch_size=2), 3)
+        self.assertEqual(pipeline.work_log.get_unexported_batches(), [])
+        pipeline.work_log.close()
+        self.assertEqual([line[0] for line in self.read_output("geneint")],
+                         [paper_id + ".concat.txt" for paper_id in sorted(os.listdir(self.data_dir_path))])
+
+
+if __name__ == "__main__":
+    unittest.main()
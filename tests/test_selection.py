@@ -0,0 +1,74 @@
+"""Unit tests for feature selection"""
+
+import unittest
+import os
+import numpy as np
+import scipy.sparse as sp
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.selection import FeatureSelector, FeatureScorer, get_top_k_idx, mutual_info_scores
+from sklearn import feature_selection
+
+__author__ = "Valerio Arnaboldi"
+__version__ = "1.0.1"
+
+
+class TestFeatureSelector(unittest.TestCase):
+
+    def setUp(self):
+        this_dir = os.path.split(__file__)[0]
+        self.training_dir_path = os.path.join(this_dir, "datasets")
+
+    def test_get_top_k_idx(self):
+        scores = np.array([0.5, np.nan, 2.0, 0.5, 3.0, 0.5, 0.1])
+        self.assertEqual(get_top_k_idx(scores, 3).tolist(), [4, 2, 0])
+        self.assertEqual(get_top_k_idx(scores, 4).tolist(), [4, 2, 0, 3])
+        self.assertEqual(get_top_k_idx(scores, 10).tolist(), [4, 2, 0, 3, 5, 6, 1])
+        self.assertEqual(get_top_k_idx(scores, 0).tolist(), [])
+        random_scores = np.random.RandomState(0).randint(0, 50, size=1000).astype(np.float64)
+        self.assertEqual(get_top_k_idx(random_scores, 100).tolist(),
+                         sorted(range(len(random_scores)), key=lambda k: random_scores[k], reverse=True)[:100])
+
+    def test_mutual_info_scores(self):
+        random_state = np.random.RandomState(0)
+        features = sp.random(40, 30, density=0.3, format="csr", random_state=random_state)
+        target = random_state.randint(0, 3, size=40)
+        scores, pvalues = mutual_info_scores(features, target)
+        self.assertIsNone(pvalues)
+        expected_scores = feature_selection.mutual_info_classif((features > 0).astype(np.int64), target,
+                                                                discrete_features=True)
+        self.assertTrue(np.allclose(scores, expected_scores))
+
+    def test_fit(self):
+        features = sp.csr_matrix(np.array([[1, 0, 3], [0, 1, 2], [1, 0, 0], [0, 2, 1]], dtype=np.float64))
+        target = [1, 0, 1, 0]
+        feature_selector = FeatureSelector(scorer=FeatureScorer.ANOVA_F, k=2).fit(features, target)
+        scores, _ = feature_selection.f_classif(features, target)
+        self.assertTrue(np.allclose(feature_selector.scores_, scores))
+        self.assertEqual(feature_selector.get_selected_idx().tolist(), get_top_k_idx(scores, 2).tolist())
+        self.assertEqual(feature_selector.transform(features).shape, (4, 2))
+        self.assertEqual(len(feature_selector.select(1).get_selected_idx()), 1)
+        self.assertTrue(np.allclose(feature_selector.scores_, scores))
+
+    def test_extract_features_with_scorer(self):
+        classifier = TextpressoDocumentClassifier()
+        classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                  file_type="cas_pdf", category=1)
+        classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                  file_type="cas_xml", category=0)
+        classifier.generate_training_and_test_sets(percentage_training=0.8, random_seed=0)
+        for feature_scorer in FeatureScorer:
+            classifier.vocabulary = None
+            classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, top_n_feat=40,
+                                        feature_scorer=feature_scorer)
+            self.assertEqual(classifier.training_set.tr_features.shape[1], 40)
+            features_with_importance = classifier.get_features_with_importance()
+            self.assertEqual(len(features_with_importance), 40)
+            scores = [score for _, score in features_with_importance]
+            self.assertEqual(scores, sorted(scores, reverse=True))
+            # each feature is paired with its own score
+            for feature, score in features_with_importance[:5]:
+                self.assertEqual(score, classifier.feature_selector.scores_[classifier.vectorizer.vocabulary_[feature]])
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Unit tests for the classification service"""
+
+import unittest
+import os
+import shutil
+import tempfile
+import threading
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, TokenizerType
+from textpresso_classifiers.fileutils import list_files
+from textpresso_classifiers.multimodel import MultiModelClassifier
+from textpresso_classifiers.service import ClassificationService, ClassificationClient
+from sklearn import svm
+
+__author__ = "Valerio Arnaboldi"
+__version__ = "1.0.1"
+
+
+class TestClassificationService(unittest.TestCase):
+
+    def setUp(self):
+        this_dir = os.path.split(__file__)[0]
+        self.training_dir_path = os.path.join(this_dir, "datasets")
+        self.multi_classifier = MultiModelClassifier()
+        for name, ngram_range in [("unigrams", (1, 1)), ("bigrams", (1, 2))]:
+            classifier = TextpressoDocumentClassifier()
+            classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "c_elegans"),
+                                                      file_type="cas_pdf", category=1)
+            classifier.add_classified_docs_to_dataset(os.path.join(self.training_dir_path, "cas", "animals"),
+                                                      file_type="cas_xml", category=0)
+            classifier.generate_training_and_test_sets(percentage_training=1)
+            classifier.extract_features(tokenizer_type=TokenizerType.TFIDF, ngram_range=ngram_range, top_n_feat=50)
+            classifier.train_classifier(model=svm.LinearSVC())
+            self.multi_classifier.add_classifier(name, classifier)
+        self.texts = self.multi_classifier.classifiers["unigrams"].training_set.data
+        self.expected_predictions = self.multi_classifier.predict_texts(self.texts)
+
+    def test_predict_texts(self):
+        service = ClassificationService(self.multi_classifier, max_batch_size=8, max_wait=0.05)
+        host, port = service.start(port=0)
+        predictions = [None] * len(self.texts)
+
+        def classify(doc_idx):
+            client = ClassificationClient(host=host, port=port)
+            predictions[doc_idx] = client.predict_texts([self.texts[doc_idx]])[0]
+            client.close()
+
+        threads = [threading.Thread(target=classify, args=(doc_idx,)) for doc_idx in range(len(self.texts))]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        client = ClassificationClient(host=host, port=port)
+        self.assertEqual(client.get_model_names(), ["unigrams", "bigrams"])
+        stats = client.get_stats()
+        client.close()
+        service.stop()
+        for name, model_predictions in self.expected_predictions.items():
+            self.assertEqual([prediction[name] for prediction in predictions], model_predictions)
+        self.assertEqual(stats["num_docs"], len(self.texts))
+        # the concurrent requests are classified together
+        self.assertLess(stats["num_batches"], len(self.texts))
+
+    def test_predict_files_unix_socket(self):
+        socket_dir_path = tempfile.mkdtemp()
+        service = ClassificationService(self.multi_classifier)
+        unix_socket = service.start(unix_socket=os.path.join(socket_dir_path, "service.sock"))
+        client = ClassificationClient(unix_socket=unix_socket)
+        file_paths = list_files(os.path.join(self.training_dir_path, "cas", "animals"), recursive=False)
+        predictions = client.predict_files(file_paths + [os.path.join(socket_dir_path, "missing.tpcas.gz")],
+                                           file_type="cas_xml")
+        client.close()
+        service.stop()
+        self.assertFalse(os.path.exists(unix_socket))
+        shutil.rmtree(socket_dir_path)
+        self.assertIsNone(predictions[-1])
+        expected_predictions = self.multi_classifier.predict_texts(
+            [self.texts[self.multi_classifier.classifiers["unigrams"].training_set.filenames.index(
+                os.path.basename(file_path))] for file_path in file_paths])
+        for name, model_predictions in expected_predictions.items():
+            self.assertEqual([prediction[name] for prediction in predictions[:-1]], model_predictions)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+"""Unit tests for the cache of extracted text"""
+
+import unittest
+import os
+import shutil
+import tempfile
+from unittest import mock
+from textpresso_classifiers.fileutils import *
+from textpresso_classifiers.textcache import TextCache
+
+
+__author__ = "Valerio Arnaboldi"
+__license__ = "MIT"
+__version__ = "1.0.1"
+
+
+class TestTextCache(unittest.TestCase):
+
+    def setUp(self):
+        this_dir, this_filename = os.path.split(__file__)
+        self.cas_dir_path = os.path.join(this_dir, "datasets", "cas", "c_elegans")
+        self.cache_dir_path = tempfile.mkdtemp()
+        self.text_cache = TextCache(self.cache_dir_path)
+
+    def tearDown(self):
+        set_text_cache(None)
+        shutil.rmtree(self.cache_dir_path)
+
+    def test_get_and_put(self):
+        file_path = os.path.join(self.cas_dir_path, "WBPaper00050657.tpcas.gz")
+        self.assertIsNone(self.text_cache.get(file_path, "cas_pdf"))
+        self.text_cache.put(file_path, "cas_pdf", "fulltext")
+        self.assertEqual(self.text_cache.get(file_path, "cas_pdf"), "fulltext")
+        self.assertIsNone(self.text_cache.get(file_path, "cas_xml"))
+        cache_stats = self.text_cache.get_stats()
+        self.assertEqual(cache_stats.hits, 1)
+        self.assertEqual(cache_stats.misses, 2)
+        self.assertEqual(cache_stats.entries, 1)
+
+    def test_put_existing_entry(self):
+        file_path = os.path.join(self.cas_dir_path, "WBPaper00050657.tpcas.gz")
+        for _ in range(3):
+            self.text_cache.put(file_path, "cas_pdf", "fulltext")
+        self.text_cache.put(file_path, "cas_pdf", "new fulltext")
+        self.assertEqual(self.text_cache.size, len("new fulltext"))
+        self.assertEqual(self.text_cache.size, self.text_cache.get_stats().size)
+
+    def test_evict(self):
+        text_cache = TextCache(self.cache_dir_path, max_size=100)
+        file_paths = [os.path.join(self.cas_dir_path, file) for file in sorted(os.listdir(self.cas_dir_path))]
+        for file_path in file_paths:
+            text_cache.put(file_path, "cas_pdf", "x" * 40)
+        self.assertLessEqual(text_cache.get_stats().size, 100)
+        self.assertEqual(text_cache.get(file_paths[-1], "cas_pdf"), "x" * 40)
+        self.assertIsNone(text_cache.get(file_paths[0], "cas_pdf"))
+        text_cache.clear()
+        self.assertEqual(text_cache.get_stats().entries, 0)
+
+    def test_entries_removed_by_other_processes(self):
+        file_paths = [os.path.join(self.cas_dir_path, file) for file in sorted(os.listdir(self.cas_dir_path))]
+        for file_path in file_paths:
+            self.text_cache.put(file_path, "cas_pdf", "x" * 40)
+        scandir = os.scandir
+
+        def scandir_and_remove(path):
+            # remove the entries after the directory has been scanned, as a concurrent eviction would do
+            entries = list(scandir(path))
+            for entry in entries:
+                os.remove(entry.path)
+            return entries
+
+        with mock.patch("textpresso_classifiers.textcache.os.scandir", side_effect=scandir_and_remove):
+            self.assertEqual(self.text_cache.get_stats().entries, 0)
+            self.text_cache.evict(target_size=0)
+        self.assertEqual(self.text_cache.size, 0)
+
+    def test_extract_text_from_files_with_cache(self):
+        set_text_cache(self.text_cache)
+        file_paths = list_files(self.cas_dir_path)
+        fulltexts = extract_text_from_files(file_paths, file_type="cas_pdf")
+        self.assertEqual(self.text_cache.misses, len(file_paths))
+        self.assertEqual(extract_text_from_files(file_paths, file_type="cas_pdf", n_jobs=2), fulltexts)
+        self.assertEqual(extract_text_from_file(file_paths[0], file_type="cas_pdf"), fulltexts[0])
+        self.assertEqual(self.text_cache.hits, len(file_paths) + 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,2 +1,26 @@
-from .classifiers import TextpressoDocumentClassifier
+import importlib
+import sys
+import types
 from .fileutils import *
+
+# the classifiers import scikit-learn and nltk, so that they are imported only when they are first used and programs
+# that only convert documents do not pay for loading them
+_LAZY_ATTRIBUTES = {"TextpressoDocumentClassifier": ".classifiers", "MultiModelClassifier": ".multimodel"}
+
+
+class _LazyModule(types.ModuleType):
+    # the lazy attributes are resolved by the class of the module rather than by a module-level __getattr__, which is
+    # only supported by python 3.7 or later
+
+    def __getattr__(self, name):
+        if name in _LAZY_ATTRIBUTES:
+            value = getattr(importlib.import_module(_LAZY_ATTRIBUTES[name], __name__), name)
+            setattr(self, name, value)
+            return value
+        raise AttributeError("module {!r} has no attribute {!r}".format(__name__, name))
+
+    def __dir__(self):
+        return sorted(list(self.__dict__.keys()) + list(_LAZY_ATTRIBUTES.keys()))
+
+
+sys.modules[__name__].__class__ = _LazyModule
@@ -3,13 +3,21 @@
 import os
 import pickle
 import random
-from sklearn import metrics, feature_selection
+import numbers
+import time
+import numpy as np
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor
+from sklearn.pipeline import Pipeline
 from namedlist import namedlist
 from textpresso_classifiers.fileutils import *
+from textpresso_classifiers.corpus import is_packed_corpus, extract_text_from_packed_corpus, get_packed_corpus
+from textpresso_classifiers.features import FeatureMatrixCache, FeatureMatrices, get_dataset_digest, \
+    get_analyzer_key, ANALYZER_PARAMS
+from textpresso_classifiers.inference import CompiledVectorizer, save_inference_model, load_inference_model
+from textpresso_classifiers.selection import FeatureSelector, FeatureScorer, get_top_k_idx
 from sklearn.feature_extraction.text import TfidfVectorizer, HashingVectorizer, TfidfTransformer, CountVectorizer
-from typing import Tuple, List
-from nltk import word_tokenize
-from nltk.stem import WordNetLemmatizer
+from typing import Tuple, List, Dict, Set
 
 __author__ = "Valerio Arnaboldi"
 
@@ -18,11 +26,15 @@ __version__ = "1.0.1"
 
 DatasetStruct_ = namedlist("DatasetStruct", "data, filenames, target, tr_features")
 TestResults_ = namedlist("TestResults", "precision, recall, accuracy")
+CorpusStruct_ = namedlist("CorpusStruct", "counts, terms, analyzer_params, dataset_digest")
+PredictionStats_ = namedlist("PredictionStats", "num_docs, num_failed, wall_time, extraction_time, "
+                                                "extraction_wait_time, vectorization_time, prediction_time")
 
 
 class TokenizerType(Enum):
     BOW = 1
     TFIDF = 2
+    HASHING = 3
 
 
 class DatasetStruct(DatasetStruct_):
@@ -40,12 +52,361 @@ class TestResults(TestResults_):
     pass
 
 
+class CorpusStruct(CorpusStruct_):
+    """term counts of all the documents of a dataset
+
+    The *counts* field contains the sparse matrix of term counts, with a row for each document in the order of the
+    dataset and a column for each term, whose text is stored in the *terms* field in alphabetical order
+    """
+    pass
+
+
+class PredictionStats(PredictionStats_):
+    """statistics on the time spent in each stage of the classification of a set of files
+
+    The extraction time is the time spent reading and converting the documents, which runs in background when
+    prefetching is enabled, while the extraction wait time is the time the main stages spent waiting for converted
+    documents. A wait time close to the extraction time means that the classification is bound by I/O and conversion
+    """
+
+    def get_throughput(self):
+        """get the throughput of each stage, in documents per second
+
+        :return: the throughput of the extraction, vectorization, and prediction stages and of the whole process
+        :rtype: Dict[str, float]
+        """
+        num_docs = self.num_docs + self.num_failed
+        return {"extraction": num_docs / self.extraction_time if self.extraction_time > 0 else float("inf"),
+                "vectorization": self.num_docs / self.vectorization_time if self.vectorization_time > 0 else
+                float("inf"),
+                "prediction": self.num_docs / self.prediction_time if self.prediction_time > 0 else float("inf"),
+                "overall": num_docs / self.wall_time if self.wall_time > 0 else float("inf")}
+
+
+DEFAULT_LEMMA_CACHE_SIZE = 200000
+
+
+def word_tokenize(text: str):
+    """split a text into words with the tokenizer of nltk, which is imported on first use
+
+    :param text: the text
+    :type text: str
+    :return: the words of the text
+    :rtype: List[str]
+    """
+    from nltk import word_tokenize as nltk_word_tokenize
+    return nltk_word_tokenize(text)
+
+
 class LemmaTokenizer(object):
-    def __init__(self):
+    """tokenizer that splits a document into words and replaces each word with its lemma
+
+    Lemmas are memoized in a table that is shared by all the documents processed by the tokenizer and is saved
+    together with the tokenizer, so that the lemmatizer is called only once for each distinct token. The table is
+    bounded, and the oldest entries are removed when it is full. The tokens of a set of documents can be computed in
+    advance by a pool of worker processes with :meth:`prime`
+    """
+
+    def __init__(self, max_cache_size: int = DEFAULT_LEMMA_CACHE_SIZE):
+        """create a new tokenizer
+
+        :param max_cache_size: the maximum number of tokens whose lemma is memoized
+        :type max_cache_size: int
+        """
+        from nltk.stem import WordNetLemmatizer
         self.wnl = WordNetLemmatizer()
+        self.max_cache_size = max_cache_size
+        self.lemma_cache = {}
+        self._primed_docs = {}
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_primed_docs"] = {}
+        return state
+
+    def __setstate__(self, state):
+        # tokenizers saved with previous versions have no memo table
+        self.__dict__.update(state)
+        self.__dict__.setdefault("max_cache_size", DEFAULT_LEMMA_CACHE_SIZE)
+        self.__dict__.setdefault("lemma_cache", {})
+        self.__dict__.setdefault("_primed_docs", {})
+
+    def lemmatize(self, token: str):
+        """get the lemma of a token, using the memoized value if available
+
+        :param token: the token
+        :type token: str
+        :return: the lemma of the token
+        :rtype: str
+        """
+        lemma = self.lemma_cache.get(token)
+        if lemma is None:
+            lemma = self.wnl.lemmatize(token)
+            self._memoize(token, lemma)
+        return lemma
+
+    def _memoize(self, token: str, lemma: str):
+        if self.max_cache_size > 0:
+            if len(self.lemma_cache) >= self.max_cache_size:
+                del self.lemma_cache[next(iter(self.lemma_cache))]
+            self.lemma_cache[token] = lemma
+
+    def tokenize(self, doc: str):
+        """split a document into lemmatized tokens, without using primed documents
+
+        :param doc: the document
+        :type doc: str
+        :return: the lemmatized tokens
+        :rtype: List[str]
+        """
+        return [self.lemmatize(t) for t in word_tokenize(doc)]
 
     def __call__(self, doc):
-        return [self.wnl.lemmatize(t) for t in word_tokenize(doc)]
+        tokens = self._primed_docs.get(doc)
+        if tokens is not None:
+            return tokens
+        return self.tokenize(doc)
+
+    def prime(self, docs: List[str], n_jobs: int = 1):
+        """tokenize a set of documents in parallel and keep their tokens, which are returned when the tokenizer is
+        called on the same documents, until :meth:`clear_primed` is called. The lemmas computed by the worker processes
+        are added to the memo table. Documents must be passed as they are received by the tokenizer (i.e., after the
+        preprocessing applied by the vectorizer). Nothing is done if a single job is requested
+
+        :param docs: the documents to tokenize
+        :type docs: List[str]
+        :param n_jobs: the number of worker processes to use
+        :type n_jobs: int
+        """
+        n_jobs = min(get_num_jobs(n_jobs), len(docs))
+        if n_jobs < 2:
+            return
+        chunk_size = (len(docs) + n_jobs - 1) // n_jobs
+        chunks = [docs[i:i + chunk_size] for i in range(0, len(docs), chunk_size)]
+        with ProcessPoolExecutor(max_workers=len(chunks)) as executor:
+            for chunk, (chunk_tokens, new_lemmas) in zip(chunks, executor.map(_tokenize_documents,
+                                                                              [self] * len(chunks), chunks)):
+                self._primed_docs.update(zip(chunk, chunk_tokens))
+                self.add_lemmas(new_lemmas)
+
+    def clear_primed(self):
+        """discard the tokens of the documents primed with :meth:`prime`"""
+        self._primed_docs = {}
+
+    def get_lemmas(self):
+        """get the memoized lemmas
+
+        :return: the pairs of tokens and lemmas, from the oldest to the newest
+        :rtype: List[Tuple[str, str]]
+        """
+        return list(self.lemma_cache.items())
+
+    def add_lemmas(self, lemmas):
+        """add lemmas to the memo table, for example the ones of a tokenizer saved in the inference format. The tokens
+        that are already memoized are skipped, and the oldest entries are removed when the table is full
+
+        :param lemmas: the pairs of tokens and lemmas
+        :type lemmas: Iterable[Tuple[str, str]]
+        """
+        for token, lemma in lemmas:
+            if token not in self.lemma_cache:
+                self._memoize(token, lemma)
+
+
+def _tokenize_documents(tokenizer: LemmaTokenizer, docs: List[str]):
+    known_tokens = set(tokenizer.lemma_cache.keys())
+    docs_tokens = [tokenizer.tokenize(doc) for doc in docs]
+    return docs_tokens, [(token, lemma) for token, lemma in tokenizer.lemma_cache.items() if token not in
+                         known_tokens]
+
+
+def _count_terms(vectorizer: CountVectorizer, docs: List[str]):
+    lemma_tokenizer = vectorizer.tokenizer if isinstance(vectorizer.tokenizer, LemmaTokenizer) else None
+    known_tokens = set(lemma_tokenizer.lemma_cache.keys()) if lemma_tokenizer is not None else set()
+    try:
+        counts = vectorizer.fit_transform(docs).tocsr()
+        terms = sorted(vectorizer.vocabulary_.keys(), key=vectorizer.vocabulary_.get)
+    except ValueError:
+        # the documents of the shard contain only stop words
+        counts = sp.csr_matrix((len(docs), 0), dtype=vectorizer.dtype)
+        terms = []
+    new_lemmas = []
+    if lemma_tokenizer is not None:
+        new_lemmas = [(token, lemma) for token, lemma in lemma_tokenizer.lemma_cache.items() if token not in
+                      known_tokens]
+    return counts, terms, new_lemmas
+
+
+def count_terms_parallel(vectorizer: CountVectorizer, docs: List[str], n_jobs: int = 1):
+    """count the terms of a set of documents in parallel. The documents are split into contiguous shards, whose terms
+    are counted by worker processes with a copy of the vectorizer. The vocabularies of the shards are then merged and
+    the count matrices of the shards are re-mapped to the merged vocabulary and stacked, so that the result is the same
+    as the one obtained by fitting the vectorizer on all the documents. The lemmas computed by the workers are added to
+    the memo table of the lemma tokenizer of the vectorizer, if any
+
+    :param vectorizer: a CountVectorizer without limits on the vocabulary (i.e., max_df, min_df and max_features set to
+        their default values and no fixed vocabulary)
+    :type vectorizer: CountVectorizer
+    :param docs: the documents
+    :type docs: List[str]
+    :param n_jobs: the number of worker processes to use (-1 to use all the available cpus)
+    :type n_jobs: int
+    :return: the sparse matrix of term counts, with a row for each document, and the list of terms of its columns, in
+        alphabetical order
+    :rtype: Tuple[scipy.sparse.csr_matrix, List[str]]
+    """
+    n_jobs = min(get_num_jobs(n_jobs), len(docs))
+    if n_jobs < 2:
+        counts = vectorizer.fit_transform(docs).tocsr()
+        return counts, sorted(vectorizer.vocabulary_.keys(), key=vectorizer.vocabulary_.get)
+    shard_size = (len(docs) + n_jobs - 1) // n_jobs
+    shards = [docs[i:i + shard_size] for i in range(0, len(docs), shard_size)]
+    with ProcessPoolExecutor(max_workers=len(shards)) as executor:
+        shard_results = list(executor.map(_count_terms, [vectorizer] * len(shards), shards))
+    terms = sorted(set().union(*[shard_terms for _, shard_terms, _ in shard_results]))
+    if len(terms) == 0:
+        raise ValueError("empty vocabulary; perhaps the documents only contain stop words")
+    term_idx = {term: idx for idx, term in enumerate(terms)}
+    shard_counts = []
+    for counts, shard_terms, _ in shard_results:
+        columns = np.asarray([term_idx[term] for term in shard_terms], dtype=counts.indices.dtype)
+        counts = sp.csr_matrix((counts.data, columns[counts.indices], counts.indptr),
+                               shape=(counts.shape[0], len(terms)))
+        counts.sort_indices()
+        shard_counts.append(counts)
+    lemma_tokenizer = vectorizer.tokenizer if isinstance(vectorizer.tokenizer, LemmaTokenizer) else None
+    if lemma_tokenizer is not None:
+        for _, _, new_lemmas in shard_results:
+            for token, lemma in new_lemmas:
+                if token not in lemma_tokenizer.lemma_cache:
+                    lemma_tokenizer._memoize(token, lemma)
+    return sp.vstack(shard_counts, format="csr"), terms
+
+
+DEFAULT_DENSE_CHUNK_SIZE = 1000
+# prefix of the placeholders of removed features. The analyzers of the vectorizers join the tokens of n-grams with
+# single spaces, so that no term starts with a space
+REMOVED_FEATURE_PREFIX = " removed feature "
+
+
+def _edit_feature_ids(feature_ids: Dict[str, int], removed_features: Set[str], added_features: List[str],
+                      selected_idx: List[int] = None):
+    # the removed features are replaced by placeholders with the same ids, and the added features are appended, so that
+    # the ids of the other features do not change. Added features are also appended to the selected ids, if any
+    feature_ids = dict(feature_ids)
+    for feature in removed_features:
+        if feature in feature_ids:
+            feature_id = feature_ids.pop(feature)
+            feature_ids[REMOVED_FEATURE_PREFIX + str(feature_id)] = feature_id
+    selected = set(selected_idx) if selected_idx is not None else set()
+    for feature in added_features:
+        if feature not in feature_ids:
+            feature_ids[feature] = len(feature_ids)
+        if selected_idx is not None and feature_ids[feature] not in selected:
+            selected_idx.append(feature_ids[feature])
+            selected.add(feature_ids[feature])
+    return feature_ids
+
+
+def densify(features, chunk_size: int = DEFAULT_DENSE_CHUNK_SIZE, dtype=np.float32):
+    """transform a sparse matrix of features into a dense array, converting chunks of rows at a time into a
+    pre-allocated array, so that no intermediate dense matrix of the full size and of the original type is created
+
+    :param features: the sparse matrix of features
+    :param chunk_size: the number of rows converted at a time
+    :type chunk_size: int
+    :param dtype: the type of the dense array
+    :return: the dense array
+    :rtype: numpy.ndarray
+    """
+    if not sp.issparse(features):
+        return np.asarray(features, dtype=dtype)
+    features = features.tocsr()
+    dense_features = np.empty(features.shape, dtype=dtype)
+    for start in range(0, features.shape[0], chunk_size):
+        dense_features[start:start + chunk_size] = features[start:start + chunk_size].toarray()
+    return dense_features
+
+
+def predict_dense(model, features, chunk_size: int = DEFAULT_DENSE_CHUNK_SIZE, dtype=np.float32):
+    """predict the classes of a sparse matrix of features with a model that requires dense input, densifying and
+    classifying chunks of rows at a time
+
+    :param model: the trained model
+    :param features: the sparse matrix of features
+    :param chunk_size: the number of rows densified and classified at a time
+    :type chunk_size: int
+    :param dtype: the type of the dense chunks
+    :return: the predictions of the model for each row
+    :rtype: numpy.ndarray
+    """
+    if features.shape[0] == 0:
+        return model.predict(np.zeros((0, features.shape[1]), dtype=dtype))
+    features = features.tocsr() if sp.issparse(features) else features
+    return np.concatenate([model.predict(densify(features[start:start + chunk_size], chunk_size, dtype)) for start in
+                           range(0, features.shape[0], chunk_size)])
+
+
+def fit_dense(model, features, target, chunk_size: int = DEFAULT_DENSE_CHUNK_SIZE, dtype=np.float32):
+    """fit a model that requires dense input on a sparse matrix of features. Models that support incremental learning
+    (i.e., that have a *partial_fit* method, as GaussianNB) are fitted on dense chunks of rows, so that the full dense
+    matrix is never created. The other models (e.g., QuadraticDiscriminantAnalysis and GradientBoostingClassifier)
+    are still fitted on a dense array of the full size, built chunk by chunk: using float32 halves its memory, but it
+    still grows with the number of rows times the number of features
+
+    The variance smoothing of GaussianNB is computed on the full matrix of features, so that the chunked model is
+    the same as the one obtained with *fit*
+
+    :param model: the model to fit
+    :param features: the sparse matrix of features
+    :param target: the classes of the rows
+    :param chunk_size: the number of rows densified at a time
+    :type chunk_size: int
+    :param dtype: the type of the dense data
+    :return: the fitted model
+    """
+    if hasattr(model, "partial_fit"):
+        target = np.asarray(target)
+        classes = np.unique(target)
+        features = features.tocsr() if sp.issparse(features) else features
+        # partial_fit computes the variance smoothing of GaussianNB on each chunk, so it is disabled here and
+        # computed on the full matrix once all the chunks have been fitted
+        var_smoothing = getattr(model, "var_smoothing", None)
+        if var_smoothing is not None:
+            model.var_smoothing = 0.0
+        try:
+            for start in range(0, features.shape[0], chunk_size):
+                model.partial_fit(densify(features[start:start + chunk_size], chunk_size, dtype),
+                                  target[start:start + chunk_size], classes=classes)
+        finally:
+            if var_smoothing is not None:
+                model.var_smoothing = var_smoothing
+        if var_smoothing is not None:
+            _set_variance_smoothing(model, features, var_smoothing, dtype)
+        return model
+    return model.fit(densify(features, chunk_size, dtype), target)
+
+
+def _set_variance_smoothing(model, features, var_smoothing, dtype=np.float32):
+    """add to the variances of a GaussianNB model fitted in chunks the variance smoothing computed on the full matrix
+    of features, as done by *fit*
+
+    :param model: the GaussianNB model fitted with *partial_fit*
+    :param features: the matrix of features on which the model has been fitted
+    :param var_smoothing: the portion of the largest variance of the features to add to all the variances
+    :param dtype: the type of the dense data on which the model has been fitted
+    """
+    if sp.issparse(features):
+        features = features.astype(dtype).astype(np.float64)
+        max_var = np.max(np.asarray(features.multiply(features).mean(axis=0)).ravel() -
+                         np.square(np.asarray(features.mean(axis=0)).ravel()))
+    else:
+        max_var = np.max(np.var(np.asarray(features, dtype=dtype), axis=0))
+    epsilon = var_smoothing * max_var
+    # sklearn < 1.0 names the variances sigma_
+    variances = model.var_ if hasattr(model, "var_") else model.sigma_
+    variances += epsilon - model.epsilon_
+    model.epsilon_ = epsilon
 
 
 class TextpressoDocumentClassifier:
@@ -59,15 +420,20 @@ class TextpressoDocumentClassifier:
         self.feature_selector = None
         self.vocabulary = None
         self.top_n_feat = 0
+        self.prediction_stats = None
+        self.compiled_vectorizer = None
+        self.split_idx = None
+        self.corpus = None
 
     def add_classified_docs_to_dataset(self, dir_path: str = None, recursive: bool = True,
-                                       file_type: str = "pdf", category: int = 1):
+                                       file_type: str = "pdf", category: int = 1, n_jobs: int = 1):
         """load the text from the cas files in the specified directory and add them to the dataset,
         assigning them to the specified category (class)
 
         Note that only files with .tpcas.gz extension will be loaded
 
-        :param dir_path: the path to the directory containing the text files to be added to the dataset
+        :param dir_path: the path to the directory containing the text files to be added to the dataset, or to a packed
+            corpus of cas files, in which case the documents are named after their paper ids
         :type dir_path: str
         :param recursive: scan directory recursively
         :type recursive: bool
@@ -75,39 +441,35 @@ class TextpressoDocumentClassifier:
         :type file_type: str
         :param category: the category value to be associated with the documents
         :type category: int
+        :param n_jobs: the number of worker processes used to extract the text from the files. Documents are added
+            to the dataset in the same order regardless of the number of jobs
+        :type n_jobs: int
         """
-        for file in os.listdir(dir_path):
-            if not os.path.isdir(os.path.join(dir_path, file)):
-                if file_type == "pdf":
-                    data = extract_text_from_pdf(file_path=os.path.join(dir_path, file))
-                    if data is None:
-                        continue
-                    self.dataset.data.append(data)
-                elif file_type == "cas_pdf" or file_type == "cas_xml":
-                    if file_type == "cas_pdf":
-                        cas_type = CasType.PDF
-                    else:
-                        cas_type = CasType.XML
-                    self.dataset.data.append(extract_text_from_cas_content(
-                        cas_content=read_compressed_cas_content(file_path=os.path.join(dir_path, file)),
-                        cas_type=cas_type))
-                elif file_type == "txt":
-                    with open(os.path.join(dir_path, file)) as input_file:
-                        self.dataset.data.append(input_file.read())
-                self.dataset.filenames.append(file)
-                self.dataset.target.append(category)
-            elif recursive:
-                self.add_classified_docs_to_dataset(dir_path=os.path.join(dir_path, file), recursive=True,
-                                                    file_type=file_type, category=category)
-
-    def generate_training_and_test_sets(self, percentage_training: float = 0.8):
+        if is_packed_corpus(dir_path):
+            filenames, fulltexts = extract_text_from_packed_corpus(dir_path, file_type=file_type, n_jobs=n_jobs)
+        else:
+            file_paths = list_files(dir_path, recursive=recursive)
+            filenames = [os.path.basename(file_path) for file_path in file_paths]
+            fulltexts = extract_text_from_files(file_paths, file_type=file_type, n_jobs=n_jobs)
+        for filename, data in zip(filenames, fulltexts):
+            if data is None:
+                continue
+            self.dataset.data.append(data)
+            self.dataset.filenames.append(filename)
+            self.dataset.target.append(category)
+
+    def generate_training_and_test_sets(self, percentage_training: float = 0.8, random_seed: int = None):
         """split the dataset into training and test sets, storing the results in separate *training_set* and *test_set*
             fields and clearing the original *dataset* variable. If training and test sets have already been populated,
             the method automatically re-construct the dataset by merging the two sets before re-splitting it into the
-            new training and test sets.
+            new training and test sets. The dataset is re-constructed in its original order, so that splits generated
+            with the same seed are identical
 
         :param percentage_training: the percentage of observations to be placed in the training set
         :type percentage_training: float
+        :param random_seed: the seed used to randomly split the dataset. A different random split is generated at each
+            call if None
+        :type random_seed: int
         """
         if len(self.training_set.data) + len(self.test_set.data) > 0 and (self.dataset is None
                                                                           or len(self.dataset.data) == 0):
@@ -118,9 +480,19 @@ class TextpressoDocumentClassifier:
             self.dataset.filenames.extend(self.test_set.filenames)
             self.dataset.target = self.training_set.target
             self.dataset.target.extend(self.test_set.target)
+            split_idx = getattr(self, "split_idx", None)
+            if split_idx is not None and len(split_idx[0]) + len(split_idx[1]) == len(self.dataset.data):
+                # restore the order of the dataset before the previous split
+                merged_order = sorted(range(len(self.dataset.data)), key=(split_idx[0] + split_idx[1]).__getitem__)
+                self.dataset.data = [self.dataset.data[i] for i in merged_order]
+                self.dataset.filenames = [self.dataset.filenames[i] for i in merged_order]
+                self.dataset.target = [self.dataset.target[i] for i in merged_order]
         if len(self.dataset.data) > 0:
             idx_rand_order = list(range(len(self.dataset.data)))
-            random.shuffle(idx_rand_order)
+            if random_seed is not None:
+                random.Random(random_seed).shuffle(idx_rand_order)
+            else:
+                random.shuffle(idx_rand_order)
             training_set_idx = idx_rand_order[:int(len(idx_rand_order) * percentage_training)]
             test_set_idx = idx_rand_order[int(len(idx_rand_order) * percentage_training):]
             self.training_set.data = [self.dataset.data[i] for i in training_set_idx]
@@ -129,12 +501,14 @@ class TextpressoDocumentClassifier:
             self.test_set.data = [self.dataset.data[i] for i in test_set_idx]
             self.test_set.filenames = [self.dataset.filenames[i] for i in test_set_idx]
             self.test_set.target = [self.dataset.target[i] for i in test_set_idx]
+            self.split_idx = (training_set_idx, test_set_idx)
             self.dataset = None
 
     def extract_features(self, tokenizer_type: TokenizerType = TokenizerType.BOW, ngram_range: Tuple[int, int] = (1, 1),
                          lemmatization: bool = False, top_n_feat: int = None, stop_words = "english",
                          max_df: float = 1.0, max_features: int = None, fit_vocabulary: bool = True,
-                         transform_features: bool = True):
+                         transform_features: bool = True, n_jobs: int = 1,
+                         feature_cache: FeatureMatrixCache = None, feature_scorer: FeatureScorer = FeatureScorer.CHI2):
         """perform feature extraction on training and test sets and store the transformed features. By default, the
         method uses the vocabulary stored in the *vocabulary* field. If the vocabulary is None, a new vocabulary is
         built from the corpus.
@@ -157,81 +531,379 @@ class TextpressoDocumentClassifier:
         :type fit_vocabulary: bool
         :param transform_features: whether to transform the text in the documents into feature vectors
         :type transform_features: bool
+        :param n_jobs: the number of worker processes used to tokenize the documents and count their terms. The
+            memoized lemmas of the previous vectorizer of the classifier, if any, are re-used
+        :type n_jobs: int
+        :param feature_cache: a cache of feature matrices, shared with other calls and classifiers. If both
+            *fit_vocabulary* and *transform_features* are True and features have already been extracted with the same
+            parameters and vocabulary from the same training and test sets, the cached vectorizer and matrices are used
+            instead of tokenizing the documents again
+        :type feature_cache: FeatureMatrixCache
+        :param feature_scorer: the function used to score the features when selecting the best *top_n_feat* ones
+        :type feature_scorer: FeatureScorer
         """
         if len(self.training_set.data) > 0:
+            self.compiled_vectorizer = None
+            cache_key = None
+            if feature_cache is not None and fit_vocabulary and transform_features:
+                cache_key = feature_cache.get_key(self.training_set, self.test_set, {
+                    "tokenizer_type": tokenizer_type.name, "ngram_range": tuple(ngram_range),
+                    "lemmatization": lemmatization, "top_n_feat": top_n_feat, "stop_words": stop_words,
+                    "max_df": max_df, "max_features": max_features, "feature_scorer": feature_scorer.name,
+                    "vocabulary": sorted(self.vocabulary.items()) if self.vocabulary is not None else None})
+                feature_matrices = feature_cache.get(cache_key)
+                if feature_matrices is not None:
+                    self.vectorizer = feature_matrices.vectorizer
+                    self.training_set.tr_features = feature_matrices.training_features
+                    self.test_set.tr_features = feature_matrices.test_features
+                    self.feature_selector = feature_matrices.feature_selector
+                    self.top_n_feat = feature_matrices.top_n_feat
+                    self.vocabulary = feature_matrices.vocabulary
+                    return
+            lemma_tokenizer = None
+            if lemmatization:
+                lemma_tokenizer = self._get_lemma_tokenizer()
+                if lemma_tokenizer is None:
+                    lemma_tokenizer = LemmaTokenizer()
             if tokenizer_type == TokenizerType.BOW:
                 if lemmatization:
                     self.vectorizer = CountVectorizer(stop_words=stop_words, ngram_range=ngram_range,
-                                                      tokenizer=LemmaTokenizer(), max_df=max_df, max_features=max_features,
-                                                      vocabulary=self.vocabulary)
+                                                      tokenizer=lemma_tokenizer, max_df=max_df,
+                                                      max_features=max_features, vocabulary=self.vocabulary)
                 else:
                     self.vectorizer = CountVectorizer(stop_words=stop_words, ngram_range=ngram_range, max_df=max_df,
                                                       max_features=max_features, vocabulary=self.vocabulary)
             elif tokenizer_type == TokenizerType.TFIDF:
                 if lemmatization:
                     self.vectorizer = TfidfVectorizer(stop_words=stop_words, ngram_range=ngram_range,
-                                                      tokenizer=LemmaTokenizer(), max_df=max_df, max_features=max_features,
-                                                      vocabulary=self.vocabulary)
+                                                      tokenizer=lemma_tokenizer, max_df=max_df,
+                                                      max_features=max_features, vocabulary=self.vocabulary)
                 else:
                     self.vectorizer = TfidfVectorizer(stop_words=stop_words, ngram_range=ngram_range, max_df=max_df,
                                                       max_features=max_features, vocabulary=self.vocabulary)
-            if fit_vocabulary:
-                self.training_set.tr_features = self.vectorizer.fit(self.training_set.data)
-            if transform_features:
-                self.training_set.tr_features = self.vectorizer.transform(self.training_set.data)
-                if len(self.test_set.data) > 0:
-                    self.test_set.tr_features = self.vectorizer.transform(self.test_set.data)
+            elif tokenizer_type == TokenizerType.HASHING:
+                self.vectorizer = HashingVectorizer(stop_words=stop_words, ngram_range=ngram_range,
+                                                    tokenizer=lemma_tokenizer, alternate_sign=False)
+            if fit_vocabulary and transform_features and tokenizer_type != TokenizerType.HASHING:
+                self._fit_transform_from_corpus(n_jobs)
+            else:
+                if fit_vocabulary or transform_features:
+                    self._prime_lemma_tokenizer(self.training_set.data + self.test_set.data, n_jobs)
+                if fit_vocabulary:
+                    self.training_set.tr_features = self.vectorizer.fit(self.training_set.data)
+                if transform_features:
+                    self.training_set.tr_features = self.vectorizer.transform(self.training_set.data)
+                    if len(self.test_set.data) > 0:
+                        self.test_set.tr_features = self.vectorizer.transform(self.test_set.data)
             if top_n_feat is not None and transform_features:
-                fs = feature_selection.chi2(self.training_set.tr_features, self.training_set.target)
-                best_features_idx = sorted(range(len(fs[0])), key=lambda k: fs[0][k], reverse=True)[:top_n_feat]
-                self.training_set.tr_features = self.training_set.tr_features[:, best_features_idx]
-                if len(self.test_set.data) > 0:
-                    self.test_set.tr_features = self.test_set.tr_features[:, best_features_idx]
-                self.feature_selector = fs
-                self.top_n_feat = top_n_feat
-                inv_vocabulary = {v: k for k, v in self.vectorizer.vocabulary_.items()}
-                # store best features in vocabulary
-                self.vocabulary = dict([(inv_vocabulary[best_idx], new_idx) for best_idx, new_idx in
-                                        zip(best_features_idx, range(top_n_feat))])
+                self._select_best_features(FeatureSelector(scorer=feature_scorer, k=top_n_feat))
+                if tokenizer_type == TokenizerType.HASHING:
+                    self.vocabulary = None
             else:
-                self.vocabulary = self.vectorizer.vocabulary_
+                self.vocabulary = getattr(self.vectorizer, "vocabulary_", None)
                 self.feature_selector = None
+            self._clear_primed_lemma_tokenizer()
+            if cache_key is not None:
+                feature_cache.put(cache_key, FeatureMatrices(self.vectorizer, self.training_set.tr_features,
+                                                             self.test_set.tr_features, self.feature_selector,
+                                                             self.top_n_feat, self.vocabulary))
         else:
             raise Exception('training set is empty')
 
-    def train_classifier(self, model, dense: bool = False):
+    def _select_best_features(self, feature_selector: FeatureSelector, selected_idx: List[int] = None):
+        # the vocabulary of the classifier is set to the best features of the current vectorizer, sorted by score, or
+        # to the given features, in the given order
+        feature_selector.fit(self.training_set.tr_features, self.training_set.target)
+        if selected_idx is not None:
+            feature_selector.set_selected_idx(selected_idx)
+        best_features_idx = feature_selector.get_selected_idx()
+        self.training_set.tr_features = feature_selector.transform(self.training_set.tr_features)
+        if len(self.test_set.data) > 0:
+            self.test_set.tr_features = feature_selector.transform(self.test_set.tr_features)
+        self.feature_selector = feature_selector
+        self.top_n_feat = len(best_features_idx)
+        if hasattr(self.vectorizer, "vocabulary_"):
+            inv_vocabulary = {v: k for k, v in self.vectorizer.vocabulary_.items()}
+            # store best features in vocabulary
+            self.vocabulary = dict([(inv_vocabulary[best_idx], new_idx) for best_idx, new_idx in
+                                    zip(best_features_idx.tolist(), range(self.top_n_feat))])
+
+    def _get_corpus_split_idx(self):
+        num_docs = len(self.training_set.data) + len(self.test_set.data)
+        split_idx = getattr(self, "split_idx", None)
+        if split_idx is not None and len(split_idx[0]) == len(self.training_set.data) and \
+                len(split_idx[1]) == len(self.test_set.data):
+            return np.asarray(split_idx[0], dtype=np.int64), np.asarray(split_idx[1], dtype=np.int64)
+        return np.arange(len(self.training_set.data), dtype=np.int64), np.arange(len(self.training_set.data),
+                                                                                  num_docs, dtype=np.int64)
+
+    def build_corpus(self, n_jobs: int = 1):
+        """tokenize all the documents of the training and test sets, in the order of the dataset before the split, and
+        store their term counts in the *corpus* field. The counts are computed with the analyzer settings of the current
+        vectorizer, without any limit on the vocabulary, and are re-used by :meth:`extract_features` for all the splits
+        of the same documents, so that the text is analyzed only once. The corpus is re-built only if the documents or
+        the analyzer settings change
+
+        :param n_jobs: the number of worker processes used to tokenize the documents and count their terms, in shards
+            whose vocabularies are merged (see :func:`count_terms_parallel`)
+        :type n_jobs: int
+        :return: the corpus
+        :rtype: CorpusStruct
+        """
+        training_idx, test_idx = self._get_corpus_split_idx()
+        docs = [None] * (len(training_idx) + len(test_idx))
+        for doc_idx, doc in zip(training_idx, self.training_set.data):
+            docs[doc_idx] = doc
+        for doc_idx, doc in zip(test_idx, self.test_set.data):
+            docs[doc_idx] = doc
+        analyzer_params = get_analyzer_key(self.vectorizer)
+        dataset_digest = get_dataset_digest([DatasetStruct(data=docs, filenames=[""] * len(docs),
+                                                           target=[""] * len(docs), tr_features=None)])
+        corpus = getattr(self, "corpus", None)
+        if corpus is None or corpus.analyzer_params != analyzer_params or corpus.dataset_digest != dataset_digest:
+            corpus_vectorizer = CountVectorizer(**{param: value for param, value in self.vectorizer.get_params().items()
+                                                   if param in ANALYZER_PARAMS})
+            counts, corpus_terms = count_terms_parallel(corpus_vectorizer, docs, n_jobs=n_jobs)
+            terms = np.empty(len(corpus_terms), dtype=object)
+            terms[:] = corpus_terms
+            self.corpus = CorpusStruct(counts=counts, terms=terms, analyzer_params=analyzer_params,
+                                       dataset_digest=dataset_digest)
+        return self.corpus
+
+    def _fit_transform_from_corpus(self, n_jobs: int = 1):
+        corpus = self.build_corpus(n_jobs=n_jobs)
+        training_idx, test_idx = self._get_corpus_split_idx()
+        training_counts = corpus.counts[training_idx]
+        if self.vectorizer.binary:
+            training_counts.data.fill(1)
+        if self.vectorizer.vocabulary is not None:
+            # fixed vocabulary: map its terms to the columns of the corpus, terms not in the corpus have no counts
+            vocabulary = dict(self.vectorizer.vocabulary)
+            term_columns = {term: term_idx for term_idx, term in enumerate(corpus.terms)}
+            known_terms = [(term_columns[term], feature_idx) for term, feature_idx in vocabulary.items()
+                           if term in term_columns]
+            rows = np.asarray([term_idx for term_idx, _ in known_terms], dtype=np.int64)
+            cols = np.asarray([feature_idx for _, feature_idx in known_terms], dtype=np.int64)
+            projection = sp.csr_matrix((np.ones(len(known_terms), dtype=corpus.counts.dtype), (rows, cols)),
+                                       shape=(len(corpus.terms), len(vocabulary)))
+            training_counts = training_counts @ projection
+        else:
+            # vocabulary of the terms in the training set, in alphabetical order as built by CountVectorizer
+            doc_freq = np.bincount(training_counts.indices, minlength=len(corpus.terms))
+            mask = doc_freq > 0
+            max_df = self.vectorizer.max_df
+            max_doc_count = max_df if isinstance(max_df, numbers.Integral) else max_df * len(training_idx)
+            min_df = self.vectorizer.min_df
+            min_doc_count = min_df if isinstance(min_df, numbers.Integral) else min_df * len(training_idx)
+            mask &= (doc_freq <= max_doc_count) & (doc_freq >= min_doc_count)
+            max_features = self.vectorizer.max_features
+            if max_features is not None and mask.sum() > max_features:
+                # same selection and tie breaking as CountVectorizer on the terms of the training set
+                train_terms = np.flatnonzero(doc_freq > 0)
+                term_freq = np.asarray(training_counts[:, train_terms].sum(axis=0)).ravel()
+                train_mask = mask[train_terms]
+                new_mask = np.zeros(len(train_terms), dtype=bool)
+                new_mask[np.flatnonzero(train_mask)[(-term_freq[train_mask]).argsort()[:max_features]]] = True
+                mask = np.zeros(len(corpus.terms), dtype=bool)
+                mask[train_terms[new_mask]] = True
+            if not mask.any():
+                raise Exception('no terms remain after pruning the vocabulary')
+            projection = np.flatnonzero(mask)
+            vocabulary = {term: feature_idx for feature_idx, term in enumerate(corpus.terms[projection])}
+            training_counts = training_counts[:, projection]
+        self.vectorizer.vocabulary_ = vocabulary
+        self.vectorizer.fixed_vocabulary_ = self.vectorizer.vocabulary is not None
+        training_counts.sort_indices()
+        test_counts = None
+        if len(test_idx) > 0:
+            test_counts = corpus.counts[test_idx] @ projection if sp.issparse(projection) else \
+                corpus.counts[test_idx][:, projection]
+            if self.vectorizer.binary:
+                test_counts.data.fill(1)
+            test_counts.sort_indices()
+        if isinstance(self.vectorizer, TfidfVectorizer):
+            tfidf_transformer = TfidfTransformer(norm=self.vectorizer.norm, use_idf=self.vectorizer.use_idf,
+                                                 smooth_idf=self.vectorizer.smooth_idf,
+                                                 sublinear_tf=self.vectorizer.sublinear_tf)
+            tfidf_transformer.fit(training_counts)
+            self.vectorizer.idf_ = tfidf_transformer.idf_
+            training_counts = tfidf_transformer.transform(training_counts)
+            if test_counts is not None:
+                test_counts = tfidf_transformer.transform(test_counts)
+        self.training_set.tr_features = training_counts
+        if test_counts is not None:
+            self.test_set.tr_features = test_counts
+
+    def _get_lemma_tokenizer(self):
+        tokenizer = getattr(self.vectorizer, "tokenizer", None)
+        if isinstance(self.vectorizer, Pipeline):
+            tokenizer = getattr(self.vectorizer.steps[0][1], "tokenizer", None)
+        if isinstance(tokenizer, LemmaTokenizer):
+            return tokenizer
+        return None
+
+    def _prime_lemma_tokenizer(self, fulltexts: List[str], n_jobs: int):
+        lemma_tokenizer = self._get_lemma_tokenizer()
+        if lemma_tokenizer is not None and get_num_jobs(n_jobs) > 1:
+            vectorizer = self.vectorizer.steps[0][1] if isinstance(self.vectorizer, Pipeline) else self.vectorizer
+            preprocess = vectorizer.build_preprocessor()
+            lemma_tokenizer.prime([preprocess(fulltext) for fulltext in fulltexts], n_jobs=n_jobs)
+
+    def _clear_primed_lemma_tokenizer(self):
+        lemma_tokenizer = self._get_lemma_tokenizer()
+        if lemma_tokenizer is not None:
+            lemma_tokenizer.clear_primed()
+
+    def train_classifier(self, model, dense: bool = False, dense_chunk_size: int = DEFAULT_DENSE_CHUNK_SIZE):
         """train a classifier using the sample documents in the training set and save the trained model
 
         :param model: the model to train
-        :param dense: whether to transform the sparse matrix of features to a dense structure (required by some models)
+        :param dense: whether to transform the sparse matrix of features to a dense structure (required by some models).
+            Dense features are float32 and are built in chunks of rows, and models that support incremental learning
+            are fitted one chunk at a time (see :func:`fit_dense`)
         :type dense: bool
+        :param dense_chunk_size: the number of rows densified at a time
+        :type dense_chunk_size: int
         :raise: Exception in case the training set features have not been extracted yet
         """
         if self.training_set.tr_features is not None:
             self.classifier = model
             if dense:
-                self.classifier.fit(self.training_set.tr_features.todense(), self.training_set.target)
+                fit_dense(self.classifier, self.training_set.tr_features, self.training_set.target,
+                          chunk_size=dense_chunk_size)
             else:
                 self.classifier.fit(self.training_set.tr_features, self.training_set.target)
         else:
             raise Exception('training set features have not been extracted yet')
 
-    def test_classifier(self, test_on_training: bool = False, dense: bool = False):
+    @staticmethod
+    def _iter_labeled_batches(labeled_files: List[Tuple[str, int]], file_type: str, batch_size: int, n_jobs: int):
+        for batch_start in range(0, len(labeled_files), batch_size):
+            batch_files = labeled_files[batch_start:batch_start + batch_size]
+            fulltexts = extract_text_from_files([file_path for file_path, _ in batch_files], file_type=file_type,
+                                                n_jobs=n_jobs)
+            data = [(fulltext, category) for fulltext, (_, category) in zip(fulltexts, batch_files) if
+                    fulltext is not None]
+            if len(data) > 0:
+                yield [fulltext for fulltext, _ in data], [category for _, category in data]
+
+    def train_classifier_out_of_core(self, model, classified_dirs: List[Tuple[str, int]], file_type: str = "pdf",
+                                     recursive: bool = True, batch_size: int = 1000, n_features: int = 2 ** 20,
+                                     ngram_range: Tuple[int, int] = (1, 1), lemmatization: bool = False,
+                                     stop_words="english", use_idf: bool = True, n_epochs: int = 1, n_jobs: int = 1,
+                                     prefetch: int = 0, random_seed: int = None):
+        """train an incremental classifier on the documents contained in a set of directories, streaming them from
+        disk in mini-batches, so that the text of the corpus, the vocabulary and the full matrix of features are never
+        held in memory at once
+
+        Documents are transformed into feature vectors by a hashing vectorizer, which does not need a vocabulary, and
+        the feature vectors of each mini-batch are passed to the *partial_fit* method of the model. If *use_idf* is
+        True, the documents are read twice: the first pass collects the document frequencies of the features, which
+        are used to apply TF-IDF weighting in the second pass. The documents of the different directories are shuffled
+        before training, so that each mini-batch contains documents of all the categories. The training set, the test
+        set and the dataset of the classifier are not used. Setting a text cache with
+        :func:`textpresso_classifiers.fileutils.set_text_cache` avoids converting the documents again in each pass
+
+        :param model: the model to train, which must support *partial_fit* (e.g., SGDClassifier or MultinomialNB)
+        :param classified_dirs: the paths to the directories containing the documents, each with the category to be
+            associated with its documents
+        :type classified_dirs: List[Tuple[str, int]]
+        :param file_type: the type of files from which to extract the fulltext
+        :type file_type: str
+        :param recursive: scan directories recursively
+        :type recursive: bool
+        :param batch_size: the number of documents in each mini-batch
+        :type batch_size: int
+        :param n_features: the number of features of the hashing vectorizer
+        :type n_features: int
+        :param ngram_range: The lower and upper boundary of the range of n-values for different n-grams to be extracted.
+            All values of n such that min_n <= n <= max_n will be used.
+        :type ngram_range: Tuple[int, int]
+        :param lemmatization: whether to apply lemmatization to the text
+        :type lemmatization: bool
+        :param stop_words: stop words to use
+        :param use_idf: whether to apply TF-IDF weighting to the hashed features
+        :type use_idf: bool
+        :param n_epochs: the number of passes over the documents to train the model
+        :type n_epochs: int
+        :param n_jobs: the number of worker processes used to extract the text from the files and to lemmatize it
+        :type n_jobs: int
+        :param prefetch: the number of mini-batches to be read and converted in advance in background
+        :type prefetch: int
+        :param random_seed: the seed used to shuffle the documents
+        :type random_seed: int
+        :return: the number of documents used to train the classifier
+        :rtype: int
+        :raise: Exception in case the model does not support incremental training or no document can be read
+        """
+        if not hasattr(model, "partial_fit"):
+            raise Exception('the model does not support incremental training')
+        labeled_files = []
+        for dir_path, category in classified_dirs:
+            labeled_files.extend([(file_path, category) for file_path in list_files(dir_path, recursive=recursive)])
+        random.Random(random_seed).shuffle(labeled_files)
+        classes = sorted(set([category for _, category in labeled_files]))
+
+        def iter_batches():
+            batches = self._iter_labeled_batches(labeled_files, file_type, batch_size, n_jobs)
+            if prefetch > 0:
+                batches = iter_prefetched(batches, prefetch=prefetch)
+            return batches
+
+        hashing_vectorizer = HashingVectorizer(stop_words=stop_words, ngram_range=ngram_range,
+                                               tokenizer=LemmaTokenizer() if lemmatization else None,
+                                               n_features=n_features, alternate_sign=False,
+                                               norm=None if use_idf else "l2")
+        self.vectorizer = hashing_vectorizer
+        if use_idf:
+            doc_freq = np.zeros(n_features, dtype=np.int64)
+            num_docs = 0
+            for fulltexts, _ in iter_batches():
+                self._prime_lemma_tokenizer(fulltexts, n_jobs)
+                doc_freq += np.bincount(hashing_vectorizer.transform(fulltexts).indices, minlength=n_features)
+                self._clear_primed_lemma_tokenizer()
+                num_docs += len(fulltexts)
+            tfidf_transformer = TfidfTransformer()
+            # smoothed idf, as computed by TfidfTransformer.fit
+            tfidf_transformer.idf_ = np.log((1 + num_docs) / (1 + doc_freq)) + 1
+            self.vectorizer = Pipeline([("hashing", hashing_vectorizer), ("tfidf", tfidf_transformer)])
+        self.classifier = model
+        self.feature_selector = None
+        self.vocabulary = None
+        self.top_n_feat = 0
+        self.compiled_vectorizer = None
+        num_trained_docs = 0
+        for _ in range(n_epochs):
+            num_trained_docs = 0
+            for fulltexts, targets in iter_batches():
+                self._prime_lemma_tokenizer(fulltexts, n_jobs)
+                self.classifier.partial_fit(self.vectorizer.transform(fulltexts), targets, classes=classes)
+                self._clear_primed_lemma_tokenizer()
+                num_trained_docs += len(fulltexts)
+        if num_trained_docs == 0:
+            raise Exception('no document could be read from the provided directories')
+        return num_trained_docs
+
+    def test_classifier(self, test_on_training: bool = False, dense: bool = False,
+                        dense_chunk_size: int = DEFAULT_DENSE_CHUNK_SIZE):
         """test the classifier on the test set and return the results
 
         :param test_on_training: whether to test the classifier on the training set instead of the test set
         :type test_on_training: bool
         :param dense: whether to transform the sparse matrix of features to a dense structure (required by some models)
         :type dense: bool
+        :param dense_chunk_size: the number of rows densified and classified at a time
+        :type dense_chunk_size: int
         :return: the test results of the classifier
         :rtype: TestResults"""
+        from sklearn import metrics
         if test_on_training:
             test_set = self.training_set
         else:
             test_set = self.test_set
         if test_set.tr_features is not None:
             if dense:
-                pred = self.classifier.predict(test_set.tr_features.todense())
+                pred = predict_dense(self.classifier, test_set.tr_features, chunk_size=dense_chunk_size)
             else:
                 pred = self.classifier.predict(test_set.tr_features)
             precision = metrics.precision_score(test_set.target, pred)
@@ -254,96 +926,220 @@ class TextpressoDocumentClassifier:
             cannot be converted)
         :rtype: int
         """
-        if file_type == "pdf":
-            fulltext = extract_text_from_pdf(file_path)
-        elif file_type.startswith("cas_"):
-            if file_type == "cas_pdf":
-                cas_type = CasType.PDF
-            else:
-                cas_type = CasType.XML
-            fulltext = extract_text_from_cas_content(read_compressed_cas_content(file_path=file_path),
-                                                     cas_type=cas_type)
-        elif file_type == "txt":
-            fulltext = open(file_path, "r").read()
-        else:
-            raise Exception("file type not supported")
+        fulltext = extract_text_from_file(file_path, file_type=file_type)
         if fulltext is not None:
-            tr_features = self.vectorizer.transform([fulltext])
-            if self.feature_selector is not None:
-                best_features_idx = sorted(range(len(self.feature_selector[0])), key=lambda k: self.feature_selector[0][k],
-                                           reverse=True)
-                tr_features = tr_features[:, best_features_idx[:self.top_n_feat]]
+            tr_features = self._transform_for_prediction([fulltext])
             if dense:
-                return self.classifier.predict(tr_features.todense())
+                return predict_dense(self.classifier, tr_features)
             else:
                 return self.classifier.predict(tr_features)
         else:
             return None
 
-    def predict_files(self, dir_path: str, file_type: str = "pdf", dense: bool = False):
+    def _get_best_features_idx(self):
+        if isinstance(self.feature_selector, FeatureSelector):
+            return self.feature_selector.get_selected_idx()
+        elif self.feature_selector is not None:
+            # classifiers saved by previous versions store the (scores, p-values) tuple of the chi-squared test
+            return get_top_k_idx(self.feature_selector[0], self.top_n_feat)
+        return None
+
+    def _get_best_features_score(self):
+        if isinstance(self.feature_selector, FeatureSelector):
+            return self.feature_selector.get_selected_scores()
+        elif self.feature_selector is not None:
+            return np.asarray(self.feature_selector[0])[self._get_best_features_idx()]
+        return None
+
+    def _transform_for_prediction(self, fulltexts: List[str], best_features_idx: List[int] = None):
+        if getattr(self, "compiled_vectorizer", None) is not None:
+            return self.compiled_vectorizer.transform(fulltexts)
+        tr_features = self.vectorizer.transform(fulltexts)
+        if best_features_idx is None:
+            best_features_idx = self._get_best_features_idx()
+        if best_features_idx is not None:
+            tr_features = tr_features[:, best_features_idx]
+        return tr_features
+
+    def compile_for_inference(self, exact_norm: bool = True):
+        """compile the vectorizer of the classifier for inference, so that the documents to be classified are
+        transformed directly into the features selected for the classifier. The indices of the selected features are
+        computed once and the vocabulary of the compiled vectorizer is restricted to them, so that prediction does not
+        need to sort the feature scores or to build and slice the columns of the features that are not selected. The
+        compiled vectorizer is discarded when the features are extracted again. Classifiers based on hashing
+        vectorizers are left unchanged
+
+        :param exact_norm: whether to normalize TF-IDF feature vectors by the norm of the full vectors, as done by the
+            original vectorizer. If False, the compiled vectorizer is smaller but the feature vectors are normalized on
+            the selected features only, and the classifier should be re-trained with the same setting
+        :type exact_norm: bool
+        :raise: Exception in case the features have not been extracted yet
+        """
+        if self.vectorizer is None:
+            raise Exception('features have not been extracted yet')
+        if not hasattr(self.vectorizer, "vocabulary_"):
+            # hashing vectorizers have no vocabulary to restrict
+            return
+        self.compiled_vectorizer = CompiledVectorizer(self.vectorizer, self._get_best_features_idx(),
+                                                      exact_norm=exact_norm)
+
+    @staticmethod
+    def _iter_document_batches(dir_path: str, file_type: str, batch_size: int, n_jobs: int,
+                               stats: PredictionStats):
+        if is_packed_corpus(dir_path):
+            doc_names = get_packed_corpus(dir_path, refresh=True).get_paper_ids()
+        else:
+            doc_names = os.listdir(dir_path)
+        if batch_size is None:
+            batch_size = max(1, len(doc_names))
+        for batch_start in range(0, len(doc_names), batch_size):
+            batch_doc_names = doc_names[batch_start:batch_start + batch_size]
+            start_time = time.perf_counter()
+            if is_packed_corpus(dir_path):
+                fulltexts = extract_text_from_packed_corpus(dir_path, paper_ids=batch_doc_names, file_type=file_type,
+                                                            n_jobs=n_jobs)[1]
+            else:
+                fulltexts = extract_text_from_files([os.path.join(dir_path, file) for file in batch_doc_names],
+                                                    file_type=file_type, n_jobs=n_jobs)
+            stats.extraction_time += time.perf_counter() - start_time
+            yield batch_doc_names, fulltexts
+
+    def iter_predict_files(self, dir_path: str, file_type: str = "pdf", dense: bool = False, n_jobs: int = 1,
+                           chunk_size: int = 1000, prefetch: int = 0,
+                           dense_chunk_size: int = DEFAULT_DENSE_CHUNK_SIZE):
+        """predict the class of a set of files in a directory, processing them in chunks and yielding the predictions
+        as soon as each chunk has been classified
+
+        Only the text and the features of the current chunk (and of the prefetched ones) are held in memory, so that
+        memory usage is bounded by the size of the chunks and does not depend on the number of files in the directory.
+        The extraction of the text of the next chunks can be run in background while the current chunk is vectorized
+        and classified, so that reading the files overlaps with computation. The time spent in each stage is stored in
+        the *prediction_stats* field and updated after each chunk
+
+        :param dir_path: the path to the directory containing the files to be classified, or to a packed corpus of cas
+            files, in which case the documents are named after their paper ids
+        :type dir_path: str
+        :param file_type: the type of files
+        :type file_type: str
+        :param dense: whether to transform the sparse matrix of features to a dense structure (required by some models)
+        :type dense: bool
+        :param n_jobs: the number of worker processes used to extract the text from the files and to lemmatize it
+        :type n_jobs: int
+        :param chunk_size: the number of files to be processed in each chunk. All the files are processed in a single
+            chunk if None
+        :type chunk_size: int
+        :param prefetch: the number of chunks to be read and converted in advance in background
+        :type prefetch: int
+        :param dense_chunk_size: the number of rows of each chunk densified and classified at a time, if dense
+            features are required
+        :type dense_chunk_size: int
+        :return: a generator of file names of the classified documents, in the order in which they are read, along with
+            the classes predicted by the classifier or None if the class cannot be predicted (e.g., the input file
+            cannot be converted)
+        :rtype: Iterable[Tuple[str, int]]
+        """
+        stats = PredictionStats(0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.prediction_stats = stats
+        start_time = time.perf_counter()
+        best_features_idx = None
+        if getattr(self, "compiled_vectorizer", None) is None:
+            best_features_idx = self._get_best_features_idx()
+        chunks = self._iter_document_batches(dir_path, file_type, chunk_size, n_jobs, stats)
+        if prefetch > 0:
+            chunks = iter_prefetched(chunks, prefetch=prefetch)
+        while True:
+            wait_start_time = time.perf_counter()
+            chunk = next(chunks, None)
+            stats.extraction_wait_time += time.perf_counter() - wait_start_time
+            if chunk is None:
+                break
+            doc_names, fulltexts = chunk
+            data = [text for text in fulltexts if text is not None]
+            predictions = []
+            if len(data) > 0:
+                stage_start_time = time.perf_counter()
+                self._prime_lemma_tokenizer(data, n_jobs)
+                tr_features = self._transform_for_prediction(data, best_features_idx)
+                self._clear_primed_lemma_tokenizer()
+                stats.vectorization_time += time.perf_counter() - stage_start_time
+                stage_start_time = time.perf_counter()
+                if dense:
+                    predictions = predict_dense(self.classifier, tr_features, chunk_size=dense_chunk_size).tolist()
+                else:
+                    predictions = self.classifier.predict(tr_features).tolist()
+                stats.prediction_time += time.perf_counter() - stage_start_time
+            stats.num_docs += len(data)
+            stats.num_failed += len(fulltexts) - len(data)
+            stats.wall_time = time.perf_counter() - start_time
+            predictions = iter(predictions)
+            for doc_name, text in zip(doc_names, fulltexts):
+                yield doc_name, next(predictions) if text is not None else None
+
+    def predict_files(self, dir_path: str, file_type: str = "pdf", dense: bool = False, n_jobs: int = 1,
+                      batch_size: int = None, prefetch: int = 0, dense_chunk_size: int = DEFAULT_DENSE_CHUNK_SIZE):
         """predict the class of a set of files in a directory
 
-        :param dir_path: the path to the directory containing the files to be classified
+        Files can be processed in batches, and the extraction of the text of the next batches can be run in background
+        while the current batch is vectorized and classified, so that reading the files overlaps with computation. The
+        time spent in each stage is stored in the *prediction_stats* field. See :meth:`iter_predict_files` for a
+        variant that returns the predictions as they are produced
+
+        :param dir_path: the path to the directory containing the files to be classified, or to a packed corpus of cas
+            files, in which case the documents are named after their paper ids
         :type dir_path: str
         :param file_type: the type of files
         :type file_type: str
         :param dense: whether to transform the sparse matrix of features to a dense structure (required by some models)
         :type dense: bool
+        :param n_jobs: the number of worker processes used to extract the text from the files and to lemmatize it
+        :type n_jobs: int
+        :param batch_size: the number of files to be processed in each batch. All the files are processed in a single
+            batch if None
+        :type batch_size: int
+        :param prefetch: the number of batches to be read and converted in advance in background
+        :type prefetch: int
+        :param dense_chunk_size: the number of rows densified and classified at a time, if dense features are required
+        :type dense_chunk_size: int
         :return: the file names of the classified documents along with the classes predicted by the classifier or None
             if the class cannot be predicted (e.g., the input file cannot be converted)
         :rtype: Tuple[List[str], List[int]]
         """
-        data = []
         filenames = []
+        predictions = []
         failed_filenames = []
-        for file in os.listdir(dir_path):
-            file_path = os.path.join(dir_path, file)
-            if file_type == "pdf":
-                text = extract_text_from_pdf(file_path)
-                if text is None:
-                    failed_filenames.append(file)
-                    continue
-                data.append(extract_text_from_pdf(file_path))
-            elif file_type.startswith("cas_"):
-                if file_type == "cas_pdf":
-                    cas_type = CasType.PDF
-                else:
-                    cas_type = CasType.XML
-                data.append(extract_text_from_cas_content(read_compressed_cas_content(file_path=file_path),
-                            cas_type=cas_type))
-            elif file_type == "txt":
-                data.append(open(file_path, "r").read())
+        for filename, prediction in self.iter_predict_files(dir_path=dir_path, file_type=file_type, dense=dense,
+                                                            n_jobs=n_jobs, chunk_size=batch_size, prefetch=prefetch,
+                                                            dense_chunk_size=dense_chunk_size):
+            if prediction is None:
+                failed_filenames.append(filename)
             else:
-                raise Exception("file type not supported")
-            filenames.append(file)
-        tr_features = self.vectorizer.transform(data)
-        if self.feature_selector is not None:
-            best_features_idx = sorted(range(len(self.feature_selector[0])), key=lambda k: self.feature_selector[0][k],
-                                       reverse=True)
-            tr_features = tr_features[:, best_features_idx[:self.top_n_feat]]
+                filenames.append(filename)
+                predictions.append(prediction)
         filenames.extend(failed_filenames)
-        if dense:
-            predictions = self.classifier.predict(tr_features.todense()).tolist()
-        else:
-            predictions = self.classifier.predict(tr_features).tolist()
         predictions.extend([None] * len(failed_filenames))
         return filenames, predictions
 
     def get_features_with_importance(self):
-        """retrieve the list of features of the classifier together with their chi-squared score. The score is set to 0
-        in case the importance of the features has not been calculated
+        """retrieve the list of features of the classifier together with their feature selection score (chi-squared by
+        default). The score is set to 0 in case the importance of the features has not been calculated
 
         :return: the list of features of the classifier with their importance score
-        :rtype: List[Tuple[str, float]]"""
+        :rtype: List[Tuple[str, float]]
+        :raise: Exception in case the classifier uses a hashing vectorizer, whose features have no names"""
+        if not hasattr(self.vectorizer, "vocabulary_"):
+            if getattr(self, "compiled_vectorizer", None) is not None:
+                # classifiers loaded from the inference format keep only the selected features
+                return [(v, 0) for v in self.compiled_vectorizer.get_feature_names()]
+            raise Exception('the features of hashing vectorizers have no names')
         inv_vocabulary = {v: k for k, v in self.vectorizer.vocabulary_.items()}
         if self.feature_selector is not None:
-            best_features_idx = sorted(range(len(self.feature_selector[0])), key=lambda k: self.feature_selector[0][k],
-                                       reverse=True)[:self.top_n_feat]
-            best_features_score = self.feature_selector[0][:self.top_n_feat]
-            return sorted([(inv_vocabulary[idx], score) for idx, score in zip(best_features_idx, best_features_score)],
-                          key=lambda x: x[1], reverse=True)
+            # the best features are already sorted by decreasing score, unless the vocabulary has been edited
+            features = [(inv_vocabulary[idx], score) for idx, score in zip(self._get_best_features_idx().tolist(),
+                                                                            self._get_best_features_score().tolist())]
         else:
-            return [(v, 0) for v in self.vectorizer.vocabulary_.keys()]
+            features = [(v, 0) for v in self.vectorizer.vocabulary_.keys()]
+        # the placeholders of removed features are not features of the classifier
+        return [feature for feature in features if not feature[0].startswith(REMOVED_FEATURE_PREFIX)]
 
     def save_to_file(self, file_path: str, compact: bool = True):
         """save the classifier to file
@@ -361,45 +1157,133 @@ class TextpressoDocumentClassifier:
             self.training_set.tr_features = []
             self.test_set.data = []
             self.test_set.tr_features = []
+            self.corpus = None
         pickle.dump(self, open(file_path, "wb"))
 
+    def save_for_inference(self, file_path: str, exact_norm: bool = True, mmap: bool = False):
+        """save the classifier to file in the compact inference format, which contains only the settings of the
+        vectorizer, the selected features with their weights and the trained model (see
+        :func:`textpresso_classifiers.inference.save_inference_model`). The file is smaller than the pickle file
+        written by :meth:`save_to_file`, and the classifier loaded from it can only be used for prediction
+
+        :param file_path: path to the location where to store the classifier
+        :type file_path: str
+        :param exact_norm: whether to store the weights needed to normalize TF-IDF feature vectors by the norm of the
+            full vectors, as done by the original vectorizer (see :meth:`compile_for_inference`). The weights cover
+            the whole vocabulary, so the file is only about half the size of the pickle file and it is not faster to
+            load. If False, only the selected features are stored, which makes the file much smaller and faster to
+            load, but the feature vectors are normalized on the selected features and the predictions may differ
+        :type exact_norm: bool
+        :param mmap: whether to save the classifier as a directory of arrays that are memory-mapped read-only when the
+            classifier is loaded, so that processes that load the same classifier share its memory
+        :type mmap: bool
+        :raise: Exception in case the classifier has not been trained or it uses a hashing vectorizer
+        """
+        if self.classifier is None:
+            raise Exception('the classifier has not been trained yet')
+        if hasattr(self.vectorizer, "vocabulary_"):
+            compiled_vectorizer = CompiledVectorizer(self.vectorizer, self._get_best_features_idx(),
+                                                     exact_norm=exact_norm)
+        elif getattr(self, "compiled_vectorizer", None) is not None:
+            # classifier loaded from the inference format
+            compiled_vectorizer = self.compiled_vectorizer
+        else:
+            raise Exception('classifiers based on hashing vectorizers cannot be saved for inference')
+        save_inference_model(file_path, compiled_vectorizer, self.classifier, mmap=mmap)
+
     @staticmethod
     def load_from_file(file_path: str):
-        """load a classifier from file
+        """load a classifier from file, saved either by :meth:`save_to_file` or by :meth:`save_for_inference`
 
-        :param file_path: the path to the pickle file containing the classifier
+        :param file_path: the path to the file containing the classifier, or to the directory of a classifier saved in
+            the inference format with memory-mapped arrays
         :type file_path: str
         :return: the classifier object
         :rtype: TextpressoDocumentClassifier
         """
+        is_inference_model = os.path.isdir(file_path)
+        if not is_inference_model:
+            with open(file_path, "rb") as fpin:
+                is_inference_model = fpin.read(4) == b"PK\x03\x04"
+        if is_inference_model:
+            compiled_vectorizer, model, _ = load_inference_model(file_path, tokenizers={
+                LemmaTokenizer.__module__ + "." + LemmaTokenizer.__name__: LemmaTokenizer})
+            classifier = TextpressoDocumentClassifier()
+            classifier.dataset = None
+            classifier.classifier = model
+            classifier.compiled_vectorizer = compiled_vectorizer
+            classifier.vectorizer = compiled_vectorizer.vectorizer
+            classifier.vocabulary = compiled_vectorizer.vocabulary_
+            return classifier
         return pickle.load(open(file_path, "rb"))
 
     def remove_features(self, features: List[str]):
-        """remove a list of features from the current vocabulary of the classifier, if not empty. The classifier must
-        be re-trained to apply the new vocabulary.
+        """remove a list of features from the current vocabulary of the classifier, if not empty. The ids of the
+        remaining features do not change: the removed features are replaced by placeholders that never occur in the
+        documents, so that their columns in the feature matrices are empty. If the features of the training and test
+        sets have already been extracted, the feature matrices are derived for the new vocabulary from the corpus of
+        the classifier (see :meth:`build_corpus`), without analyzing the text again if the corpus has already been
+        built. The classifier must be re-trained to apply the new vocabulary.
 
         :param features: the list of features to be removed
         :type features: List[str]
+        :return: whether the feature matrices have been updated for the new vocabulary. If not, the features must be
+            extracted again with :meth:`extract_features`
+        :rtype: bool
         """
-        if self.vocabulary is not None:
-            for feature in features:
-                self.vocabulary.pop(feature, None)
-            curr_features_list = self.vocabulary.keys()
-            self.vocabulary = dict([(feature, feat_id) for feature, feat_id in
-                                    zip(curr_features_list, range(len(curr_features_list)))])
+        if self.vocabulary is None:
+            return False
+        return self._edit_vocabulary(removed_features=set(features))
 
     def add_features(self, features: List[str], delete_old_vocabulary: bool = False):
-        """add a list of features to the current vocabulary. The classifier must be re-trained to apply the new
+        """add a list of features to the current vocabulary. The ids of the features already in the vocabulary do not
+        change and the new features are appended after them. If the features of the training and test sets have already
+        been extracted, the feature matrices are derived for the new vocabulary from the term counts of the corpus of
+        the classifier (see :meth:`build_corpus`), without analyzing the text again if the corpus has already been
+        built, and the new features are added to the selected ones. The classifier must be re-trained to apply the new
         vocabulary
 
         :param features: the list of features to be added to the current vocabulary
         :type features: List[str]
         :param delete_old_vocabulary: whether to delete the old vocabulary before adding the new features
         :type delete_old_vocabulary: bool
+        :return: whether the feature matrices have been updated for the new vocabulary. If not, the features must be
+            extracted again with :meth:`extract_features`
+        :rtype: bool
         """
-        curr_features_set = set()
-        if self.vocabulary is not None and not delete_old_vocabulary:
-            curr_features_set = set(self.vocabulary.keys())
-        curr_features_set.update(features)
-        self.vocabulary = dict([(feature, feat_id) for feature, feat_id in
-                                zip(curr_features_set, range(len(curr_features_set)))])
+        return self._edit_vocabulary(added_features=features,
+                                     delete_old_vocabulary=self.vocabulary is None or delete_old_vocabulary)
+
+    def _edit_vocabulary(self, removed_features: Set[str] = frozenset(), added_features: List[str] = (),
+                         delete_old_vocabulary: bool = False):
+        if self.training_set.tr_features is None or len(self.training_set.data) == 0 or \
+                not isinstance(self.vectorizer, CountVectorizer) or not hasattr(self.vectorizer, "vocabulary_"):
+            self.vocabulary = _edit_feature_ids({} if delete_old_vocabulary else self.vocabulary, removed_features,
+                                                added_features)
+            return False
+        # the edits are applied to the full vocabulary of the vectorizer, so that the norms of TF-IDF vectors are
+        # computed on the edited vocabulary, and the selected features keep their order
+        selected_idx = None
+        if self.feature_selector is not None:
+            selected_idx = [] if delete_old_vocabulary else self._get_best_features_idx().tolist()
+        vectorizer_vocabulary = _edit_feature_ids({} if delete_old_vocabulary else self.vectorizer.vocabulary_,
+                                                  removed_features, added_features, selected_idx)
+        if len(vectorizer_vocabulary) == 0:
+            self.vocabulary = {}
+            return False
+        # the counts of the edited vocabulary are obtained by projecting the columns of the corpus built with the
+        # analyzer of the current vectorizer, which is re-used if it has already been built
+        self.vectorizer = type(self.vectorizer)(**dict(self.vectorizer.get_params(),
+                                                       vocabulary=vectorizer_vocabulary))
+        self._fit_transform_from_corpus()
+        self.compiled_vectorizer = None
+        if selected_idx is not None:
+            if isinstance(self.feature_selector, FeatureSelector):
+                feature_selector = FeatureSelector(scorer=self.feature_selector.scorer)
+            else:
+                # classifiers saved by previous versions store the scores of the chi-squared test
+                feature_selector = FeatureSelector()
+            self._select_best_features(feature_selector, selected_idx)
+        else:
+            self.vocabulary = self.vectorizer.vocabulary_
+        return True
@@ -0,0 +1,300 @@
+"""Packed corpus format to store large collections of compressed CAS files in a few indexed shard files"""
+
+import io
+import json
+import mmap
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import List
+from textpresso_classifiers.fileutils import extract_text_from_compressed_cas, get_cas_type, get_num_jobs, \
+    join_paper_texts
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+CORPUS_FORMAT_VERSION = 1
+CORPUS_MANIFEST_FILE_NAME = "corpus.json"
+SHARD_DATA_EXTENSION = ".tpshard"
+SHARD_INDEX_EXTENSION = ".tpshard.idx"
+DEFAULT_MAX_SHARD_SIZE = 1024 ** 3
+
+_open_corpora = {}
+
+
+def is_packed_corpus(path: str):
+    """check whether a path points to a packed corpus
+
+    :param path: the path to check
+    :type path: str
+    :return: whether the path is the directory of a packed corpus
+    :rtype: bool
+    """
+    return os.path.isfile(os.path.join(path, CORPUS_MANIFEST_FILE_NAME))
+
+
+def _list_paper_files(dir_path: str, file_extension: str):
+    file_paths = []
+    for root, dirs, files in os.walk(dir_path):
+        dirs.sort()
+        file_paths.extend(os.path.join(root, file) for file in sorted(files) if file.endswith(file_extension))
+    return file_paths
+
+
+def _get_paper_id(file_name: str):
+    return file_name.split(".")[0]
+
+
+def build_packed_corpus(input_dir: str, output_dir: str, supplementals_dir: str = None,
+                        max_shard_size: int = DEFAULT_MAX_SHARD_SIZE, file_extension: str = ".tpcas.gz"):
+    """pack a directory tree of compressed cas files into a set of shard files with an index by paper id
+
+    Each sub-directory of the input directory is considered as a paper, identified by the name of the sub-directory,
+    and all the files with the specified extension contained in it are stored in the corpus as files of the paper.
+    Files placed directly in the input directory are stored as papers, identified by the name of the file up to the
+    first dot. Supplemental files can be added from a separate directory, whose entries are assigned to the paper
+    identified by their name up to the first dot (e.g., WBPaper00001234.sup.1). The compressed content of the files
+    is stored as-is, and all the files of a paper are stored in the same shard
+
+    :param input_dir: the directory containing the papers
+    :type input_dir: str
+    :param output_dir: the directory where to write the packed corpus
+    :type output_dir: str
+    :param supplementals_dir: the directory containing the supplemental files of the papers
+    :type supplementals_dir: str
+    :param max_shard_size: the maximum size in bytes of a shard file. A new shard is started when the current one
+        exceeds this size
+    :type max_shard_size: int
+    :param file_extension: the extension of the files to be packed
+    :type file_extension: str
+    :return: the number of papers stored in the corpus
+    :rtype: int
+    """
+    supplementals = {}
+    if supplementals_dir is not None:
+        for entry in sorted(os.listdir(supplementals_dir)):
+            entry_path = os.path.join(supplementals_dir, entry)
+            if os.path.isdir(entry_path):
+                supplementals.setdefault(_get_paper_id(entry), []).extend(_list_paper_files(entry_path,
+                                                                                            file_extension))
+            elif entry.endswith(file_extension):
+                supplementals.setdefault(_get_paper_id(entry), []).append(entry_path)
+    os.makedirs(output_dir, exist_ok=True)
+    shard_names = []
+    shard_data_file = None
+    shard_index_file = None
+    num_papers = 0
+    for entry in sorted(os.listdir(input_dir)):
+        entry_path = os.path.join(input_dir, entry)
+        if os.path.isdir(entry_path):
+            paper_id = entry
+            file_paths = _list_paper_files(entry_path, file_extension)
+        elif entry.endswith(file_extension):
+            paper_id = _get_paper_id(entry)
+            file_paths = [entry_path]
+        else:
+            continue
+        file_paths.extend(supplementals.get(paper_id, []))
+        if not file_paths:
+            continue
+        if shard_data_file is None or shard_data_file.tell() >= max_shard_size:
+            if shard_data_file is not None:
+                shard_data_file.close()
+                shard_index_file.close()
+            shard_names.append("shard-{:05d}".format(len(shard_names)))
+            shard_data_file = open(os.path.join(output_dir, shard_names[-1] + SHARD_DATA_EXTENSION + ".tmp"), "wb")
+            shard_index_file = open(os.path.join(output_dir, shard_names[-1] + SHARD_INDEX_EXTENSION + ".tmp"), "w")
+        for file_path in file_paths:
+            offset = shard_data_file.tell()
+            with open(file_path, "rb") as input_file:
+                length = shard_data_file.write(input_file.read())
+            shard_index_file.write("\t".join([paper_id, os.path.basename(file_path), str(offset), str(length)]) + "\n")
+        num_papers += 1
+    if shard_data_file is not None:
+        shard_data_file.close()
+        shard_index_file.close()
+    # the files of a corpus that is re-built are replaced rather than overwritten, so that the processes that have
+    # memory-mapped the previous shards keep reading them until they re-open the corpus
+    for shard_name in shard_names:
+        for extension in [SHARD_DATA_EXTENSION, SHARD_INDEX_EXTENSION]:
+            os.replace(os.path.join(output_dir, shard_name + extension + ".tmp"),
+                       os.path.join(output_dir, shard_name + extension))
+    with open(os.path.join(output_dir, CORPUS_MANIFEST_FILE_NAME + ".tmp"), "w") as manifest_file:
+        json.dump({"format_version": CORPUS_FORMAT_VERSION, "shards": shard_names, "num_papers": num_papers},
+                  manifest_file)
+    os.replace(os.path.join(output_dir, CORPUS_MANIFEST_FILE_NAME + ".tmp"),
+               os.path.join(output_dir, CORPUS_MANIFEST_FILE_NAME))
+    # the shards of a previous build that are not part of the new corpus are removed. Processes that have them
+    # memory-mapped can still read them until they re-open the corpus
+    shard_file_names = set(shard_name + extension for shard_name in shard_names for extension in
+                           [SHARD_DATA_EXTENSION, SHARD_INDEX_EXTENSION])
+    for file_name in os.listdir(output_dir):
+        if file_name.startswith("shard-") and (file_name.endswith(SHARD_DATA_EXTENSION) or
+                                               file_name.endswith(SHARD_INDEX_EXTENSION)) and \
+                file_name not in shard_file_names:
+            os.remove(os.path.join(output_dir, file_name))
+    return num_papers
+
+
+class PackedCorpus(object):
+    """reader of a packed corpus
+
+    The shard files are memory-mapped and their indices are loaded when the corpus is opened, so that the files of a
+    paper can be accessed by paper id without any further filesystem call. A corpus can be pickled and sent to other
+    processes, where it is re-opened on first access
+    """
+
+    def __init__(self, corpus_dir: str):
+        """open a packed corpus
+
+        :param corpus_dir: the directory of the packed corpus
+        :type corpus_dir: str
+        """
+        self.corpus_dir = corpus_dir
+        self._shards = None
+        self._index = None
+
+    def __getstate__(self):
+        return {"corpus_dir": self.corpus_dir}
+
+    def __setstate__(self, state):
+        self.__init__(state["corpus_dir"])
+
+    def _open(self):
+        with open(os.path.join(self.corpus_dir, CORPUS_MANIFEST_FILE_NAME)) as manifest_file:
+            manifest = json.load(manifest_file)
+        if manifest["format_version"] > CORPUS_FORMAT_VERSION:
+            raise Exception("unsupported corpus format version: " + str(manifest["format_version"]))
+        shards = []
+        index = {}
+        for shard_idx, shard_name in enumerate(manifest["shards"]):
+            with open(os.path.join(self.corpus_dir, shard_name + SHARD_DATA_EXTENSION), "rb") as shard_data_file:
+                shards.append(mmap.mmap(shard_data_file.fileno(), 0, access=mmap.ACCESS_READ))
+            with open(os.path.join(self.corpus_dir, shard_name + SHARD_INDEX_EXTENSION)) as shard_index_file:
+                for line in shard_index_file:
+                    paper_id, file_name, offset, length = line.rstrip("\n").split("\t")
+                    index.setdefault(paper_id, []).append((file_name, shard_idx, int(offset), int(length)))
+        self._shards = shards
+        self._index = index
+
+    @property
+    def index(self):
+        if self._index is None:
+            self._open()
+        return self._index
+
+    def __len__(self):
+        return len(self.index)
+
+    def __contains__(self, paper_id: str):
+        return paper_id in self.index
+
+    def get_paper_ids(self):
+        """get the ids of the papers in the corpus, in the order in which they are stored
+
+        :return: the list of paper ids
+        :rtype: List[str]
+        """
+        return list(self.index.keys())
+
+    def get_files(self, paper_id: str):
+        """get the compressed content of the files of a paper
+
+        :param paper_id: the id of the paper
+        :type paper_id: str
+        :return: the list of file names of the paper, with the compressed content of each file
+        :rtype: List[Tuple[str, bytes]]
+        """
+        return [(file_name, self._shards[shard_idx][offset:offset + length]) for file_name, shard_idx, offset, length
+                in self.index[paper_id]]
+
+    def extract_text(self, paper_id: str, file_type: str = "cas_pdf"):
+        """extract the fulltext of a paper, obtained by joining the text of all its files
+
+        :param paper_id: the id of the paper
+        :type paper_id: str
+        :param file_type: the type of the cas files of the paper, either "cas_pdf" or "cas_xml"
+        :type file_type: str
+        :return: the fulltext of the paper
+        :rtype: str
+        """
+        cas_type = get_cas_type(file_type)
+        return join_paper_texts([extract_text_from_compressed_cas(io.BytesIO(content), cas_type=cas_type) for _, content
+                                 in self.get_files(paper_id)])
+
+    def close(self):
+        """close the shard files of the corpus"""
+        if self._shards is not None:
+            for shard in self._shards:
+                shard.close()
+        self._shards = None
+        self._index = None
+
+
+def _get_manifest_stamp(corpus_dir: str):
+    try:
+        manifest_stat = os.stat(os.path.join(corpus_dir, CORPUS_MANIFEST_FILE_NAME))
+    except OSError:
+        return None
+    return manifest_stat.st_ino, manifest_stat.st_size, manifest_stat.st_mtime_ns
+
+
+def get_packed_corpus(corpus_dir: str, refresh: bool = False):
+    """get a reader for a packed corpus, re-using the one already opened by the current process, if any
+
+    :param corpus_dir: the directory of the packed corpus
+    :type corpus_dir: str
+    :param refresh: whether to check if the manifest of the corpus has changed since the corpus was opened (e.g.,
+        because the corpus has been re-built) and to open a new reader in that case, so that long-running processes
+        do not keep reading the old shards. The check costs a filesystem call, so it should be done once per batch of
+        papers rather than for each paper
+    :type refresh: bool
+    :return: the reader of the corpus
+    :rtype: PackedCorpus
+    """
+    corpus_dir = os.path.abspath(corpus_dir)
+    open_corpus = _open_corpora.get(corpus_dir)
+    if open_corpus is not None and not refresh:
+        return open_corpus[1]
+    manifest_stamp = _get_manifest_stamp(corpus_dir)
+    if open_corpus is None or open_corpus[0] != manifest_stamp:
+        # the previous reader is not closed, since other threads may still be reading from it: its shards are unmapped
+        # when it is no longer referenced
+        open_corpus = (manifest_stamp, PackedCorpus(corpus_dir))
+        _open_corpora[corpus_dir] = open_corpus
+    return open_corpus[1]
+
+
+def _extract_text_from_packed_corpus(corpus_dir: str, paper_id: str, file_type: str):
+    return get_packed_corpus(corpus_dir).extract_text(paper_id, file_type=file_type)
+
+
+def extract_text_from_packed_corpus(corpus_dir: str, paper_ids: List[str] = None, file_type: str = "cas_pdf",
+                                    n_jobs: int = 1):
+    """extract the fulltext of a set of papers from a packed corpus, optionally distributing the extraction over a
+    pool of worker processes. The corpus is re-opened if it has been re-built since the last call, so that each call
+    sees a consistent version of the corpus. The cache of extracted text is not used, since its entries are keyed by
+    the path and the modification time of single files, which papers stored in a corpus do not have
+
+    :param corpus_dir: the directory of the packed corpus
+    :type corpus_dir: str
+    :param paper_ids: the ids of the papers to extract. All the papers in the corpus are extracted if None
+    :type paper_ids: List[str]
+    :param file_type: the type of the cas files in the corpus, either "cas_pdf" or "cas_xml"
+    :type file_type: str
+    :param n_jobs: the number of worker processes to use
+    :type n_jobs: int
+    :return: the ids of the papers and their fulltext, in the same order
+    :rtype: Tuple[List[str], List[str]]
+    """
+    corpus = get_packed_corpus(corpus_dir, refresh=True)
+    if paper_ids is None:
+        paper_ids = corpus.get_paper_ids()
+    n_jobs = get_num_jobs(n_jobs)
+    if n_jobs == 1 or len(paper_ids) < 2:
+        return paper_ids, [corpus.extract_text(paper_id, file_type=file_type) for paper_id in paper_ids]
+    with ProcessPoolExecutor(max_workers=min(n_jobs, len(paper_ids))) as executor:
+        return paper_ids, list(executor.map(_extract_text_from_packed_corpus, [corpus_dir] * len(paper_ids),
+                                            paper_ids, [file_type] * len(paper_ids),
+                                            chunksize=max(1, len(paper_ids) // (n_jobs * 4))))
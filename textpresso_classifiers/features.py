@@ -0,0 +1,169 @@
+"""Utilities to extract and cache the feature matrices of the training and test sets of classifiers"""
+
+import copy
+import hashlib
+from collections import OrderedDict
+from namedlist import namedlist
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+ANALYZER_PARAMS = ["input", "encoding", "decode_error", "strip_accents", "lowercase", "preprocessor", "tokenizer",
+                   "stop_words", "token_pattern", "ngram_range", "analyzer"]
+
+
+def get_analyzer_key(vectorizer):
+    """get a key that identifies the settings of a vectorizer that affect the analysis of the text, so that vectorizers
+    with the same key extract the same terms from a document
+
+    :param vectorizer: the vectorizer
+    :return: the key of the analyzer of the vectorizer
+    :rtype: str
+    """
+    params = vectorizer.get_params()
+    key_values = []
+    for param in ANALYZER_PARAMS:
+        value = params.get(param)
+        if value is not None and callable(value):
+            value = type(value).__module__ + "." + type(value).__name__
+        elif isinstance(value, (set, frozenset)):
+            value = sorted(value)
+        key_values.append(param + "=" + repr(value))
+    return ", ".join(key_values)
+
+
+FeatureMatrices_ = namedlist("FeatureMatrices", "vectorizer, training_features, test_features, feature_selector, "
+                                                "top_n_feat, vocabulary")
+
+
+class FeatureMatrices(FeatureMatrices_):
+    """the result of feature extraction on a pair of training and test sets"""
+    pass
+
+
+def get_dataset_digest(datasets):
+    """compute a digest that identifies the content and the order of the documents of a list of datasets
+
+    :param datasets: the datasets
+    :type datasets: List[DatasetStruct]
+    :return: the hex digest of the datasets
+    :rtype: str
+    """
+    digest = hashlib.sha1()
+    for dataset in datasets:
+        digest.update(str(len(dataset.data)).encode("utf-8"))
+        for filename, target, text in zip(dataset.filenames, dataset.target, dataset.data):
+            digest.update("\t".join([str(filename), str(target), str(len(text))]).encode("utf-8"))
+            digest.update(text.encode("utf-8"))
+    return digest.hexdigest()
+
+
+def get_params_digest(params):
+    """compute a digest of a set of feature extraction parameters
+
+    :param params: the parameters, as a dictionary of values whose representation identifies them
+    :type params: Dict[str, Any]
+    :return: the hex digest of the parameters
+    :rtype: str
+    """
+    return hashlib.sha1(repr(sorted((key, repr(value)) for key, value in params.items())).encode("utf-8")).hexdigest()
+
+
+class FeatureMatrixCache(object):
+    """in-memory cache of the feature matrices extracted from the training and test sets of a classifier, keyed by the
+    documents of the sets and by the parameters of feature extraction
+
+    The text of each document is hashed only the first time the document is seen, and the digest is memoized by the
+    identity of the text, so that the keys of later splits of the same dataset are computed from the digests of the
+    documents in the order of the split. The cache keeps a reference to the text of the documents it has seen
+
+    The cache can be shared by multiple calls to
+    :meth:`textpresso_classifiers.classifiers.TextpressoDocumentClassifier.extract_features` and by multiple
+    classifiers, so that models trained and tested on the same splits of the same dataset re-use the same feature
+    matrices instead of tokenizing the documents again. The matrices are shared among the users of the cache and must
+    not be modified in place
+    """
+
+    def __init__(self, max_entries: int = None):
+        """create a new cache
+
+        :param max_entries: the maximum number of entries in the cache. The least recently used entries are removed
+            when the cache is full. The size of the cache is not bounded if None
+        :type max_entries: int
+        """
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._text_digests = {}
+
+    def _get_text_digest(self, text: str):
+        # the text is stored with its digest, so that its id cannot be re-used by another object
+        text_digest = self._text_digests.get(id(text))
+        if text_digest is None or text_digest[0] is not text:
+            text_digest = (text, hashlib.sha1(text.encode("utf-8")).digest())
+            self._text_digests[id(text)] = text_digest
+        return text_digest[1]
+
+    def get_key(self, training_set, test_set, params):
+        """get the key of the features extracted from a pair of training and test sets
+
+        :param training_set: the training set
+        :type training_set: DatasetStruct
+        :param test_set: the test set
+        :type test_set: DatasetStruct
+        :param params: the parameters of feature extraction
+        :type params: Dict[str, Any]
+        :return: the key of the cache entry
+        :rtype: str
+        """
+        digest = hashlib.sha1()
+        for dataset in [training_set, test_set]:
+            digest.update(str(len(dataset.data)).encode("utf-8"))
+            for filename, target, text in zip(dataset.filenames, dataset.target, dataset.data):
+                digest.update("\t".join([str(filename), str(target), ""]).encode("utf-8"))
+                digest.update(self._get_text_digest(text))
+        return digest.hexdigest() + "-" + get_params_digest(params)
+
+    def get(self, key: str):
+        """get the feature matrices stored for a key
+
+        :param key: the key of the entry
+        :type key: str
+        :return: the feature matrices or None if the key is not in the cache
+        :rtype: FeatureMatrices
+        """
+        feature_matrices = self._entries.get(key)
+        if feature_matrices is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return FeatureMatrices(feature_matrices.vectorizer, feature_matrices.training_features,
+                               feature_matrices.test_features, feature_matrices.feature_selector,
+                               feature_matrices.top_n_feat, copy.copy(feature_matrices.vocabulary))
+
+    def put(self, key: str, feature_matrices: FeatureMatrices):
+        """store the feature matrices for a key
+
+        :param key: the key of the entry
+        :type key: str
+        :param feature_matrices: the feature matrices
+        :type feature_matrices: FeatureMatrices
+        """
+        self._entries[key] = FeatureMatrices(feature_matrices.vectorizer, feature_matrices.training_features,
+                                             feature_matrices.test_features, feature_matrices.feature_selector,
+                                             feature_matrices.top_n_feat, copy.copy(feature_matrices.vocabulary))
+        self._entries.move_to_end(key)
+        while self.max_entries is not None and len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def clear(self):
+        """remove all the entries from the cache"""
+        self._entries.clear()
+        self._text_digests.clear()
+
+    def __len__(self):
+        return len(self._entries)
@@ -1,17 +1,44 @@
 """Utilities to transform pdf and CAS files into feature vectors for the classifiers"""
 
+import atexit
 import html
+import multiprocessing
+import os
+import queue
 import re
 import gzip
+import struct
+import sys
+import threading
+import time
+import zlib
 import xml.etree.ElementTree as ET
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing.connection import wait
 from enum import Enum
-import PyPDF2
+from typing import List, Iterable
+from textpresso_classifiers.textcache import TextCache
 
 __author__ = "Valerio Arnaboldi"
 
 __version__ = "1.0.1"
 
 
+CAS_CHUNK_SIZE = 1 << 16
+SOFA_STRING_START = "sofaString=\""
+# html entities are at most 32 characters long plus the leading ampersand, the optional number sign and the trailing
+# semicolon
+MAX_ENTITY_LENGTH = 36
+TEXT_CACHE_DIR_ENV_VAR = "TP_TEXT_CACHE_DIR"
+DEFAULT_PDF_TIMEOUT = 120
+DEFAULT_PDF_FAILURE_TTL = 3600
+PDF_FAILURES_FILE_NAME = "pdf_failures.txt"
+
+_text_cache = None
+_pdf_extraction_engine = None
+_pdf_extraction_engine_lock = threading.Lock()
+
+
 class CasType(Enum):
     """type of cas file"""
     PDF = 1
@@ -76,21 +103,713 @@ def extract_text_from_article_xml(text: str):
             return "".join(child.itertext())
 
 
-def extract_text_from_pdf(file_path: str):
+def iter_text_from_article_xml(text_chunks: Iterable[str]):
+    """extract the text of the body of an article from its xml representation (in pubmed format) provided in chunks
+
+    The xml is parsed incrementally and only the elements in the body of the article are kept in memory until their
+    text has been returned, so that front matter, references, and other sections are dropped while they are parsed.
+    Once joined, the generated chunks give the same text returned by :func:`extract_text_from_article_xml`, or an
+    empty string if the article has no body
+
+    :param text_chunks: the chunks of the xml text of the article in pubmed format
+    :type text_chunks: Iterable[str]
+    :return: a generator of text chunks of the body of the article
+    :rtype: Iterable[str]
+    """
+    parser = ET.XMLPullParser(events=("start", "end"))
+    root = None
+    depth = 0
+    # stack of [element, last child] for the open elements in the body
+    body_stack = []
+    for chunk in text_chunks:
+        parser.feed(chunk)
+        for event, elem in parser.read_events():
+            if event == "start":
+                depth += 1
+                if body_stack:
+                    parent = body_stack[-1]
+                    if parent[1] is None:
+                        yield parent[0].text or ""
+                    else:
+                        yield parent[1].tail or ""
+                        parent[0].remove(parent[1])
+                    parent[1] = elem
+                    body_stack.append([elem, None])
+                elif depth == 1:
+                    root = elem
+                elif depth == 2 and elem.tag == "body":
+                    body_stack.append([elem, None])
+            else:
+                depth -= 1
+                if body_stack:
+                    last_child = body_stack.pop()[1]
+                    if last_child is None:
+                        yield elem.text or ""
+                    else:
+                        yield last_child.tail or ""
+                        elem.remove(last_child)
+                    if not body_stack:
+                        return
+                elif depth == 1:
+                    root.remove(elem)
+                else:
+                    elem.clear()
+
+
+def iter_sofa_string(cas_file, chunk_size: int = CAS_CHUNK_SIZE):
+    """read the content of a cas file incrementally and yield the unescaped text of its sofaString attribute in chunks
+
+    Only a chunk of the cas file is held in memory at any time, so that the memory used does not depend on the size of
+    the annotations stored in the cas file
+
+    :param cas_file: the cas file, opened in text mode
+    :param chunk_size: the number of characters to read from the cas file at a time
+    :type chunk_size: int
+    :return: a generator of unescaped text chunks
+    :rtype: Iterable[str]
+    """
+    buffer = ""
+    for chunk in iter(lambda: cas_file.read(chunk_size), ""):
+        buffer += chunk
+        start_idx = buffer.find(SOFA_STRING_START)
+        if start_idx >= 0:
+            buffer = buffer[start_idx + len(SOFA_STRING_START):]
+            break
+        buffer = buffer[-(len(SOFA_STRING_START) - 1):]
+    else:
+        raise Exception("sofaString not found in cas file")
+    while True:
+        end_idx = buffer.find("\"")
+        if end_idx >= 0:
+            yield html.unescape(buffer[:end_idx])
+            return
+        # do not split html entities between chunks
+        amp_idx = buffer.find("&", max(0, len(buffer) - MAX_ENTITY_LENGTH))
+        if amp_idx >= 0:
+            yield html.unescape(buffer[:amp_idx])
+            buffer = buffer[amp_idx:]
+        else:
+            yield html.unescape(buffer)
+            buffer = ""
+        chunk = cas_file.read(chunk_size)
+        if not chunk:
+            raise Exception("sofaString not terminated in cas file")
+        buffer += chunk
+
+
+def iter_lines_without_pdf_tags(text_chunks: Iterable[str]):
+    """remove pdf tags from a text provided in chunks. The text is processed one line at a time, so that the result is
+    the same as the one of :func:`remove_pdf_tags_from_text` applied to the whole text
+
+    :param text_chunks: the chunks of text
+    :type text_chunks: Iterable[str]
+    :return: a generator of text chunks without pdf tags
+    :rtype: Iterable[str]
+    """
+    buffer = ""
+    for chunk in text_chunks:
+        buffer += chunk
+        last_newline_idx = buffer.rfind("\n")
+        if last_newline_idx >= 0:
+            yield remove_pdf_tags_from_text(buffer[:last_newline_idx + 1])
+            buffer = buffer[last_newline_idx + 1:]
+    if buffer:
+        yield remove_pdf_tags_from_text(buffer)
+
+
+def iter_normalized_whitespace(text_chunks: Iterable[str]):
+    """replace each sequence of whitespace characters with a single space and strip leading and trailing whitespace
+    from a text provided in chunks, producing the same result of applying the normalization to the whole text
+
+    :param text_chunks: the chunks of text
+    :type text_chunks: Iterable[str]
+    :return: a generator of normalized text chunks
+    :rtype: Iterable[str]
+    """
+    pending_space = False
+    started = False
+    for chunk in text_chunks:
+        normalized_chunk = re.sub(r"\s+", " ", chunk)
+        if not normalized_chunk:
+            continue
+        if normalized_chunk[0] == " ":
+            pending_space = True
+            normalized_chunk = normalized_chunk[1:]
+        ends_with_space = normalized_chunk.endswith(" ")
+        normalized_chunk = normalized_chunk.rstrip(" ")
+        if normalized_chunk:
+            if pending_space and started:
+                normalized_chunk = " " + normalized_chunk
+            started = True
+            pending_space = ends_with_space
+            yield normalized_chunk
+        elif ends_with_space:
+            pending_space = True
+
+
+def iter_text_from_compressed_cas(file_path: str, cas_type: CasType = CasType.PDF, chunk_size: int = CAS_CHUNK_SIZE):
+    """extract the fulltext of an article from a compressed cas file, reading the file as a stream and yielding the
+    normalized text in chunks
+
+    :param file_path: the path to the compressed cas file, or a binary file object with the compressed content
+    :type file_path: str
+    :param cas_type: the type of cas file
+    :type cas_type: CasType
+    :param chunk_size: the number of characters to read from the cas file at a time
+    :type chunk_size: int
+    :return: a generator of text chunks that, once joined, give the same text returned by
+        :func:`extract_text_from_cas_content`
+    :rtype: Iterable[str]
+    """
+    with gzip.open(file_path, 'rt') as file:
+        text_chunks = iter_sofa_string(file, chunk_size=chunk_size)
+        if cas_type == CasType.PDF:
+            text_chunks = iter_lines_without_pdf_tags(text_chunks)
+        elif cas_type == CasType.XML:
+            text_chunks = iter_text_from_article_xml(text_chunks)
+        yield from iter_normalized_whitespace(text_chunks)
+
+
+def extract_text_from_compressed_cas(file_path: str, cas_type: CasType = CasType.PDF):
+    """extract the fulltext of an article from a compressed cas file without loading the whole cas content in memory
+
+    :param file_path: the path to the compressed cas file, or a binary file object with the compressed content
+    :type file_path: str
+    :param cas_type: the type of cas file
+    :type cas_type: CasType
+    :return: the fulltext of the article represented by the cas file
+    :rtype: str
+    """
+    return "".join(iter_text_from_compressed_cas(file_path, cas_type=cas_type))
+
+
+def _parse_pdf(file_path: str, max_pages: int = None):
+    # PyPDF2 is imported only by the programs that convert pdf files
+    import PyPDF2
+    with open(file_path, 'rb') as pdf_file:
+        pdf_reader = PyPDF2.PdfFileReader(pdf_file)
+        num_pages = pdf_reader.numPages
+        if max_pages is not None:
+            num_pages = min(num_pages, max_pages)
+        return "".join([pdf_reader.getPage(i).extractText() for i in range(num_pages)])
+
+
+def _get_pdf_parse_errors():
+    # errors raised by the content of a pdf file, as opposed to the errors of the environment (e.g., lack of memory or
+    # file descriptors) and of the installed version of PyPDF2 (e.g., deprecated functions), which are not permanent
+    import PyPDF2
+    pdf_read_error = PyPDF2.errors.PdfReadError if hasattr(PyPDF2, "errors") else PyPDF2.utils.PdfReadError
+    return pdf_read_error, ValueError, KeyError, IndexError, AssertionError, struct.error, zlib.error
+
+
+def extract_text_from_pdf(file_path: str, max_pages: int = None):
     """extract the fulltext of an article from a pdf file
 
     :param file_path: the path to the pdf file
     :type file_path: str
-    :return: the fulltext of the article represented by the cas file
+    :param max_pages: the maximum number of pages to extract. All the pages are extracted if None
+    :type max_pages: int
+    :return: the fulltext of the article represented by the cas file or None if the pdf file cannot be converted
+    :rtype: str
+    """
+    try:
+        return _parse_pdf(file_path, max_pages=max_pages)
+    except Exception:
+        return None
+
+
+def _pdf_extraction_worker(conn):
+    pdf_parse_errors = _get_pdf_parse_errors()
+    while True:
+        try:
+            task = conn.recv()
+        except EOFError:
+            return
+        if task is None:
+            return
+        task_idx, file_path, max_pages = task
+        try:
+            conn.send((task_idx, _parse_pdf(file_path, max_pages=max_pages), False))
+        except pdf_parse_errors:
+            # a file that cannot be parsed fails again in any later conversion
+            conn.send((task_idx, None, True))
+        except Exception:
+            conn.send((task_idx, None, False))
+
+
+class PdfExtractionEngine(object):
+    """extract the fulltext of pdf files in a set of isolated worker processes
+
+    Each document is converted by a worker process with a time limit. Workers that exceed the time limit or crash
+    (e.g., because of a malformed pdf file) are killed and replaced, so that a single document cannot stall the whole
+    conversion. The files that could not be converted are stored in a negative cache and are skipped in later
+    conversions, unless they are modified. Files that cannot be parsed are skipped permanently, while timeouts,
+    crashes, errors of the environment (e.g., lack of memory or of file descriptors) and errors of the installed
+    version of PyPDF2 are only remembered for *failure_ttl* seconds, since they may not happen again. The negative
+    cache can be persisted to file. Conversions from multiple threads are serialized
+
+    The engine can be used as a context manager, which takes care of stopping the worker processes
+    """
+
+    def __init__(self, n_jobs: int = 1, timeout: float = DEFAULT_PDF_TIMEOUT, max_pages: int = None,
+                 failures_file_path: str = None, failure_ttl: float = DEFAULT_PDF_FAILURE_TTL):
+        """create a new extraction engine
+
+        :param n_jobs: the number of worker processes
+        :type n_jobs: int
+        :param timeout: the maximum time in seconds allowed for the conversion of a single document
+        :type timeout: float
+        :param max_pages: the maximum number of pages to extract from each document
+        :type max_pages: int
+        :param failures_file_path: the path to the file where to persist the negative cache
+        :type failures_file_path: str
+        :param failure_ttl: the time in seconds after which a file that failed because of a timeout, a crash or an
+            error of the environment is converted again
+        :type failure_ttl: float
+        """
+        self.n_jobs = get_num_jobs(n_jobs)
+        self.timeout = timeout
+        self.max_pages = max_pages
+        self.failure_ttl = failure_ttl
+        self.failures_file_path = None
+        # expiration time of each failure, infinite for the files that cannot be parsed
+        self.failures = {}
+        self.set_failures_file(failures_file_path)
+        self._workers = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def set_failures_file(self, failures_file_path: str = None):
+        """set the file where the negative cache is persisted, adding the failures already stored in the file to the
+        negative cache
+
+        :param failures_file_path: the path to the file, or None to keep the negative cache only in memory
+        :type failures_file_path: str
+        """
+        self.failures_file_path = failures_file_path
+        if failures_file_path is not None and os.path.isfile(failures_file_path):
+            with open(failures_file_path) as failures_file:
+                for line in failures_file:
+                    fields = line.rstrip("\n").split("\t")
+                    # lines written by previous versions have no expiration time and never expire
+                    expiration_time = float(fields.pop()) if len(fields) > 3 else float("inf")
+                    failure_key = "\t".join(fields)
+                    self.failures[failure_key] = max(expiration_time, self.failures.get(failure_key, 0))
+
+    @staticmethod
+    def _get_failure_key(file_path: str):
+        try:
+            file_stat = os.stat(file_path)
+        except OSError:
+            return None
+        return "\t".join([os.path.abspath(file_path), str(file_stat.st_size), str(file_stat.st_mtime_ns)])
+
+    def _start_worker(self):
+        parent_conn, child_conn = multiprocessing.Pipe()
+        process = multiprocessing.Process(target=_pdf_extraction_worker, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return [process, parent_conn]
+
+    def _stop_worker(self, worker, kill: bool = False):
+        process, conn = worker
+        if not kill:
+            try:
+                conn.send(None)
+            except (BrokenPipeError, OSError):
+                pass
+            process.join(timeout=self.timeout)
+        if process.is_alive():
+            process.terminate()
+        process.join()
+        conn.close()
+
+    def _add_failure(self, file_path: str, permanent: bool):
+        failure_key = self._get_failure_key(file_path)
+        if failure_key is None:
+            return
+        expiration_time = float("inf") if permanent else time.time() + self.failure_ttl
+        self.failures[failure_key] = expiration_time
+        if self.failures_file_path is not None:
+            with open(self.failures_file_path, "a") as failures_file:
+                failures_file.write(failure_key + "\t" + repr(expiration_time) + "\n")
+
+    def is_known_failure(self, file_path: str):
+        """check whether a file is in the negative cache of files that could not be converted
+
+        :param file_path: the path to the file
+        :type file_path: str
+        :return: whether the file failed a previous conversion
+        :rtype: bool
+        """
+        return self.failures.get(self._get_failure_key(file_path), 0) > time.time()
+
+    def extract(self, file_paths: List[str], timeout: float = None, max_pages: int = None):
+        """extract the fulltext of a list of pdf files
+
+        :param file_paths: the paths to the pdf files
+        :type file_paths: List[str]
+        :param timeout: the maximum time in seconds allowed for the conversion of a single document. The timeout of
+            the engine is used if None
+        :type timeout: float
+        :param max_pages: the maximum number of pages to extract from each document. The maximum number of pages of
+            the engine is used if None
+        :type max_pages: int
+        :return: the fulltext of each file in the same order of the input paths, or None for the files that cannot be
+            converted within the time limit
+        :rtype: List[str]
+        """
+        with self._lock:
+            return self._extract(file_paths, self.timeout if timeout is None else timeout,
+                                 self.max_pages if max_pages is None else max_pages)
+
+    def _extract(self, file_paths: List[str], timeout: float, max_pages: int):
+        fulltexts = [None] * len(file_paths)
+        pending_tasks = [(i, file_path) for i, file_path in enumerate(file_paths) if not
+                         self.is_known_failure(file_path)]
+        pending_tasks.reverse()
+        while len(self._workers) > self.n_jobs:
+            self._stop_worker(self._workers.pop())
+        while len(self._workers) < min(self.n_jobs, len(pending_tasks)):
+            self._workers.append(self._start_worker())
+        running_tasks = {}
+        while pending_tasks or running_tasks:
+            for worker_idx, worker in enumerate(self._workers):
+                if worker_idx not in running_tasks and pending_tasks:
+                    task = pending_tasks.pop()
+                    try:
+                        worker[1].send(task + (max_pages,))
+                    except (BrokenPipeError, EOFError, OSError):
+                        # the idle worker died, the task is sent to its replacement in the next round
+                        pending_tasks.append(task)
+                        self._stop_worker(worker, kill=True)
+                        self._workers[worker_idx] = self._start_worker()
+                        continue
+                    running_tasks[worker_idx] = (task, time.monotonic() + timeout)
+            if not running_tasks:
+                continue
+            next_deadline = min(deadline for _, deadline in running_tasks.values())
+            ready_conns = wait([self._workers[worker_idx][1] for worker_idx in running_tasks],
+                               timeout=max(0, next_deadline - time.monotonic()))
+            for worker_idx, ((task_idx, file_path), deadline) in list(running_tasks.items()):
+                worker = self._workers[worker_idx]
+                permanent_failure = False
+                if worker[1] in ready_conns:
+                    try:
+                        _, fulltext, permanent_failure = worker[1].recv()
+                    except (EOFError, OSError):
+                        fulltext = None
+                        self._stop_worker(worker, kill=True)
+                        self._workers[worker_idx] = self._start_worker()
+                elif time.monotonic() >= deadline:
+                    fulltext = None
+                    self._stop_worker(worker, kill=True)
+                    self._workers[worker_idx] = self._start_worker()
+                else:
+                    continue
+                del running_tasks[worker_idx]
+                if fulltext is None:
+                    self._add_failure(file_path, permanent_failure)
+                fulltexts[task_idx] = fulltext
+        return fulltexts
+
+    def close(self):
+        """stop the worker processes of the engine"""
+        if self._pid != os.getpid():
+            # the workers of an engine inherited from a parent process belong to the parent
+            self._workers = []
+            return
+        with self._lock:
+            for worker in self._workers:
+                self._stop_worker(worker)
+            self._workers = []
+
+
+def get_pdf_extraction_engine(n_jobs: int = None):
+    """get the extraction engine shared by all the functions that convert pdf files, so that its worker processes are
+    started once and re-used by later conversions. The engine is created on first use and persists its negative cache
+    in the directory of the cache of extracted text, if set
+
+    :param n_jobs: the number of worker processes of the engine. The current number is kept if None
+    :type n_jobs: int
+    :return: the shared extraction engine
+    :rtype: PdfExtractionEngine
+    """
+    global _pdf_extraction_engine
+    text_cache = get_text_cache()
+    failures_file_path = os.path.join(text_cache.cache_dir, PDF_FAILURES_FILE_NAME) if text_cache is not None else \
+        None
+    with _pdf_extraction_engine_lock:
+        if _pdf_extraction_engine is None or _pdf_extraction_engine._pid != os.getpid():
+            _pdf_extraction_engine = PdfExtractionEngine(n_jobs=1 if n_jobs is None else n_jobs,
+                                                         failures_file_path=failures_file_path)
+        else:
+            if n_jobs is not None:
+                _pdf_extraction_engine.n_jobs = get_num_jobs(n_jobs)
+            if _pdf_extraction_engine.failures_file_path != failures_file_path:
+                _pdf_extraction_engine.set_failures_file(failures_file_path)
+        return _pdf_extraction_engine
+
+
+@atexit.register
+def _close_pdf_extraction_engine():
+    if _pdf_extraction_engine is not None:
+        _pdf_extraction_engine.close()
+
+
+def get_cas_type(file_type: str):
+    """get the type of cas file corresponding to a file type string
+
+    :param file_type: the type of file, either "cas_pdf" or "cas_xml"
+    :type file_type: str
+    :return: the type of cas file
+    :rtype: CasType
+    """
+    if file_type == "cas_pdf":
+        return CasType.PDF
+    elif file_type == "cas_xml":
+        return CasType.XML
+    else:
+        raise Exception("file type not supported")
+
+
+def set_text_cache(text_cache: TextCache = None):
+    """set the cache of extracted text consulted by the functions that extract the fulltext of files
+
+    :param text_cache: the cache to use, or None to disable caching
+    :type text_cache: TextCache
+    """
+    global _text_cache
+    _text_cache = text_cache
+
+
+def get_text_cache():
+    """get the cache of extracted text currently in use. If no cache has been set and the TP_TEXT_CACHE_DIR
+    environment variable is defined, a cache is opened in the directory specified by the variable
+
+    :return: the cache of extracted text or None if caching is disabled
+    :rtype: TextCache
+    """
+    global _text_cache
+    if _text_cache is None and os.environ.get(TEXT_CACHE_DIR_ENV_VAR):
+        _text_cache = TextCache(os.environ[TEXT_CACHE_DIR_ENV_VAR])
+    return _text_cache
+
+
+def add_text_cache_arguments(parser, documents_description: str = "the documents"):
+    """add the options that set the text cache to the argument parser of a program. The cache is opened by
+    :func:`set_text_cache_from_args`
+
+    :param parser: the argument parser
+    :type parser: argparse.ArgumentParser
+    :param documents_description: the description of the documents whose text is cached, used in the help
+    :type documents_description: str
+    """
+    parser.add_argument("--text-cache", metavar="text_cache_dir", dest="text_cache_dir", type=str, default=None,
+                        help="directory of a persistent cache of the text extracted from " + documents_description +
+                             ", shared among runs of the programs of the package")
+    parser.add_argument("--text-cache-max-size", metavar="text_cache_max_size", dest="text_cache_max_size", type=int,
+                        default=10240, help="maximum size of the text cache in MB")
+
+
+def set_text_cache_from_args(args):
+    """open the text cache specified by the options added by :func:`add_text_cache_arguments`, if any
+
+    :param args: the parsed arguments of the program
+    :type args: argparse.Namespace
+    """
+    if args.text_cache_dir is not None:
+        set_text_cache(TextCache(args.text_cache_dir, max_size=args.text_cache_max_size * 1024 ** 2))
+
+
+def print_text_cache_stats(file=sys.stderr):
+    """print the usage statistics of the text cache in use, if any
+
+    :param file: the stream where to print the statistics
+    """
+    text_cache = get_text_cache()
+    if text_cache is not None:
+        cache_stats = text_cache.get_stats()
+        print("text cache hits:", cache_stats.hits, "misses:", cache_stats.misses, "entries:", cache_stats.entries,
+              "size:", cache_stats.size, file=file)
+
+
+def _extract_text_from_file(file_path: str, file_type: str = "pdf"):
+    if file_type == "pdf":
+        return extract_text_from_pdf(file_path)
+    elif file_type.startswith("cas_"):
+        return extract_text_from_compressed_cas(file_path=file_path, cas_type=get_cas_type(file_type))
+    elif file_type == "txt":
+        with open(file_path) as input_file:
+            return input_file.read()
+    else:
+        raise Exception("file type not supported")
+
+
+def extract_text_from_file(file_path: str, file_type: str = "pdf", use_cache: bool = True):
+    """extract the fulltext of an article from a file of the specified type. Pdf files are converted in the calling
+    process, use :func:`extract_text_from_files` to convert them in isolated and time-bounded worker processes
+
+    :param file_path: the path to the file
+    :type file_path: str
+    :param file_type: the type of file, among "pdf", "cas_pdf", "cas_xml", and "txt"
+    :type file_type: str
+    :param use_cache: whether to look up the text in the cache of extracted text (if set) and to store the result in it
+    :type use_cache: bool
+    :return: the fulltext of the article or None if the file cannot be converted
+    :rtype: str
+    """
+    text_cache = get_text_cache() if use_cache and file_type != "txt" else None
+    if text_cache is not None:
+        fulltext = text_cache.get(file_path, file_type)
+        if fulltext is not None:
+            return fulltext
+    fulltext = _extract_text_from_file(file_path, file_type)
+    if text_cache is not None and fulltext is not None:
+        text_cache.put(file_path, file_type, fulltext)
+    return fulltext
+
+
+def get_num_jobs(n_jobs: int = 1):
+    """get the actual number of worker processes to use for a n_jobs value. Negative values are counted backwards
+    from the number of available cpus, so that -1 means all cpus, -2 all cpus but one, and so on
+
+    :param n_jobs: the number of jobs requested
+    :type n_jobs: int
+    :return: the number of worker processes
+    :rtype: int
+    """
+    if n_jobs is None or n_jobs == 0:
+        return 1
+    if n_jobs < 0:
+        return max(1, (os.cpu_count() or 1) + 1 + n_jobs)
+    return n_jobs
+
+
+def extract_text_from_files(file_paths: List[str], file_type: str = "pdf", n_jobs: int = 1,
+                            pdf_timeout: float = DEFAULT_PDF_TIMEOUT, pdf_max_pages: int = None):
+    """extract the fulltext of a list of files, optionally distributing the conversions over a pool of worker
+    processes. The results are returned in the same order as the input paths. Files already present in the cache of
+    extracted text are not converted again. Pdf files are converted through the shared :class:`PdfExtractionEngine`
+    (see :func:`get_pdf_extraction_engine`), so that each conversion is isolated and time-bounded
+
+    :param file_paths: the paths to the files
+    :type file_paths: List[str]
+    :param file_type: the type of the files, among "pdf", "cas_pdf", "cas_xml", and "txt"
+    :type file_type: str
+    :param n_jobs: the number of worker processes to use. 1 converts the files serially in the calling process,
+        -1 uses all the available cpus
+    :type n_jobs: int
+    :param pdf_timeout: the maximum time in seconds allowed for the conversion of a single pdf file
+    :type pdf_timeout: float
+    :param pdf_max_pages: the maximum number of pages to extract from each pdf file
+    :type pdf_max_pages: int
+    :return: the fulltext of each file, or None for the files that cannot be converted
+    :rtype: List[str]
+    """
+    text_cache = get_text_cache() if file_type != "txt" else None
+    fulltexts = [text_cache.get(file_path, file_type) if text_cache is not None else None for file_path in file_paths]
+    missing_idx = [i for i, fulltext in enumerate(fulltexts) if fulltext is None]
+    missing_paths = [file_paths[i] for i in missing_idx]
+    n_jobs = get_num_jobs(n_jobs)
+    if file_type == "pdf":
+        missing_fulltexts = get_pdf_extraction_engine(n_jobs=n_jobs).extract(missing_paths, timeout=pdf_timeout,
+                                                                             max_pages=pdf_max_pages)
+    elif n_jobs == 1 or len(missing_paths) < 2:
+        missing_fulltexts = [_extract_text_from_file(file_path, file_type) for file_path in missing_paths]
+    else:
+        with ProcessPoolExecutor(max_workers=min(n_jobs, len(missing_paths))) as executor:
+            missing_fulltexts = list(executor.map(_extract_text_from_file, missing_paths,
+                                                  [file_type] * len(missing_paths),
+                                                  chunksize=max(1, len(missing_paths) // (n_jobs * 4))))
+    for i, fulltext in zip(missing_idx, missing_fulltexts):
+        fulltexts[i] = fulltext
+        if text_cache is not None and fulltext is not None:
+            text_cache.put(file_paths[i], file_type, fulltext)
+    return fulltexts
+
+
+def join_paper_texts(texts: List[str]):
+    """join the fulltext of the files of a paper (e.g., the article and its supplementary materials) into the fulltext
+    of the paper. All the functions that read papers made of multiple files use the same separator, so that a paper
+    has the same text, and the same features, when it is read for training and for classification
+
+    :param texts: the fulltext of each file of the paper
+    :type texts: List[str]
+    :return: the fulltext of the paper
     :rtype: str
     """
-    fulltext = ""
-    pdfFileObj = open(file_path, 'rb')
+    return " ".join(texts)
+
+
+def list_files(dir_path: str, recursive: bool = True):
+    """list the files contained in a directory, in the same order in which the directory is traversed
+
+    :param dir_path: the path to the directory
+    :type dir_path: str
+    :param recursive: scan directory recursively
+    :type recursive: bool
+    :return: the paths to the files in the directory
+    :rtype: List[str]
+    """
+    file_paths = []
+    for file in os.listdir(dir_path):
+        file_path = os.path.join(dir_path, file)
+        if not os.path.isdir(file_path):
+            file_paths.append(file_path)
+        elif recursive:
+            file_paths.extend(list_files(file_path, recursive=True))
+    return file_paths
+
+
+def iter_prefetched(iterable: Iterable, prefetch: int = 1):
+    """consume an iterable in a background thread, keeping up to the specified number of items ready in advance, so
+    that the production of the items (e.g., reading and converting files) overlaps with their consumption
+
+    :param iterable: the iterable to consume
+    :type iterable: Iterable
+    :param prefetch: the maximum number of items produced in advance
+    :type prefetch: int
+    :return: a generator of the items of the iterable, in the same order
+    :rtype: Iterable
+    """
+    items_queue = queue.Queue(maxsize=max(1, prefetch))
+    stop_event = threading.Event()
+    end_of_items = object()
+
+    def put(item, exception=None):
+        while not stop_event.is_set():
+            try:
+                items_queue.put((item, exception), timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def produce():
+        try:
+            for item in iterable:
+                if not put(item):
+                    return
+            put(end_of_items)
+        except Exception as e:
+            put(end_of_items, e)
+
+    producer = threading.Thread(target=produce, daemon=True)
+    producer.start()
     try:
-        pdfReader = PyPDF2.PdfFileReader(pdfFileObj)
-        for i in range(pdfReader.numPages):
-            pageObj = pdfReader.getPage(i)
-            fulltext += pageObj.extractText()
-        return fulltext
-    except:
-        return None
\ No newline at end of file
+        while True:
+            item, exception = items_queue.get()
+            if item is end_of_items:
+                if exception is not None:
+                    raise exception
+                return
+            yield item
+    finally:
+        stop_event.set()
@@ -0,0 +1,632 @@
+"""Vectorizers compiled for inference, which extract only the features selected for a trained classifier, and a compact
+file format to store them together with the trained models"""
+
+import io
+import itertools
+import json
+import os
+import pickle
+import shutil
+import uuid
+import zlib
+import numpy as np
+import scipy.sparse as sp
+from collections import Counter
+from typing import List, Dict, Callable
+from sklearn.feature_extraction.text import TfidfVectorizer, CountVectorizer
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+# version 2 stores the large arrays of the model as arrays of the file instead of pickle buffers
+INFERENCE_FORMAT_VERSION = 2
+MIN_MMAP_BUFFER_SIZE = 4096
+# the highest protocol supported by all the python versions of the package
+MODEL_PICKLE_PROTOCOL = 4
+
+
+class CompiledVectorizer(object):
+    """vectorizer that transforms documents directly into the space of the features selected for a classifier
+
+    The vocabulary of the vectorizer is restricted to the selected features, in the order in which they are given, so
+    that the matrices returned by :meth:`transform` are the same as the ones obtained by transforming the documents
+    with the original vectorizer and then selecting the columns of the features, without building the columns of the
+    other terms. For TF-IDF vectorizers with normalization, the weights of the terms that are not selected are kept
+    to compute the norm of the full feature vectors, so that the values are exactly the same as the original ones. If
+    *exact_norm* is False, the norm is computed on the selected features only, which makes the compiled vectorizer
+    smaller at the cost of a different scaling of the feature vectors
+    """
+
+    def __init__(self, vectorizer, feature_idx: List[int] = None, exact_norm: bool = True):
+        """compile a fitted vectorizer
+
+        :param vectorizer: the fitted CountVectorizer or TfidfVectorizer
+        :param feature_idx: the indices of the selected features in the vocabulary of the vectorizer, in the order in
+            which they must appear in the transformed matrices. All the features are kept if None
+        :type feature_idx: List[int]
+        :param exact_norm: whether to normalize TF-IDF vectors by the norm of the full feature vectors
+        :type exact_norm: bool
+        """
+        terms = [None] * len(vectorizer.vocabulary_)
+        for term, term_idx in vectorizer.vocabulary_.items():
+            terms[term_idx] = term
+        if feature_idx is None:
+            feature_idx = range(len(terms))
+        feature_idx = np.asarray(feature_idx, dtype=np.int64)
+        self.vocabulary_ = {terms[term_idx]: new_idx for new_idx, term_idx in enumerate(feature_idx)}
+        self.binary = vectorizer.binary
+        self.dtype = vectorizer.dtype
+        self.tfidf = isinstance(vectorizer, TfidfVectorizer)
+        self.sublinear_tf = self.tfidf and vectorizer.sublinear_tf
+        self.norm = vectorizer.norm if self.tfidf else None
+        self.idf_ = None
+        if self.tfidf and vectorizer.use_idf:
+            self.idf_ = vectorizer.idf_[feature_idx]
+        self.unselected_weights_ = None
+        if self.norm is not None and exact_norm:
+            selected = np.zeros(len(terms), dtype=bool)
+            selected[feature_idx] = True
+            idf = vectorizer.idf_ if vectorizer.use_idf else np.ones(len(terms))
+            self.unselected_weights_ = {terms[term_idx]: float(idf[term_idx]) for term_idx in
+                                        np.flatnonzero(~selected)}
+        # the analysis settings are copied from the original vectorizer without its vocabulary and weights
+        self.vectorizer = type(vectorizer)(**dict(vectorizer.get_params(), vocabulary=None))
+        self._analyzer = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["_analyzer"] = None
+        return state
+
+    def get_feature_names(self):
+        """get the names of the features returned by the vectorizer
+
+        :return: the features, in the order of the columns of the transformed matrices
+        :rtype: List[str]
+        """
+        if isinstance(self.vocabulary_, TermIndex):
+            return list(self.vocabulary_.keys())
+        return sorted(self.vocabulary_.keys(), key=lambda term: self.vocabulary_[term])
+
+    def _get_term_weights(self, counts):
+        if self.binary:
+            return np.ones(len(counts))
+        if self.sublinear_tf:
+            return np.log(counts) + 1
+        return counts.astype(np.float64)
+
+    @staticmethod
+    def _lookup(mapping, terms, default, dtype):
+        if isinstance(mapping, TermIndex):
+            term_ids = mapping.lookup(terms)
+            if mapping.values is None:
+                return term_ids
+            values = np.full(len(terms), default, dtype=dtype)
+            values[term_ids >= 0] = mapping.values[term_ids[term_ids >= 0]]
+            return values
+        # the lookups of the terms in dictionaries are iterated in C, without a python loop over the terms
+        return np.fromiter(map(mapping.get, terms, itertools.repeat(default, len(terms))), dtype=dtype,
+                           count=len(terms))
+
+    def transform(self, raw_documents: List[str]):
+        """transform documents into feature vectors
+
+        :param raw_documents: the text of the documents
+        :type raw_documents: List[str]
+        :return: the matrix of the feature vectors of the documents, with the selected features as columns
+        :rtype: scipy.sparse.csr_matrix
+        """
+        if self._analyzer is None:
+            self._analyzer = self.vectorizer.build_analyzer()
+        return self.transform_term_counts(Counter(self._analyzer(doc)) for doc in raw_documents)
+
+    def transform_term_counts(self, docs_term_counts):
+        """transform documents given as the counts of the terms extracted by the analyzer of the vectorizer into
+        feature vectors, so that the terms of the documents can be counted once for all the compiled vectorizers with
+        the same analyzer settings
+
+        :param docs_term_counts: the counts of the terms of each document
+        :type docs_term_counts: Iterable[Dict[str, int]]
+        :return: the matrix of the feature vectors of the documents, with the selected features as columns
+        :rtype: scipy.sparse.csr_matrix
+        """
+        exact_norm = self.unselected_weights_ is not None
+        # the terms in dictionaries are looked up for each document, while the strings of the terms are still in the
+        # cache, whereas the terms in term indexes are looked up for all the documents at once by vectorized operations
+        batch_lookup = isinstance(self.vocabulary_, TermIndex) or isinstance(self.unselected_weights_, TermIndex)
+        terms = []
+        counts = []
+        term_ids = []
+        weights = []
+        num_doc_terms = []
+        for term_counts in docs_term_counts:
+            if batch_lookup:
+                terms.extend(term_counts.keys())
+            else:
+                term_ids.append(self._lookup(self.vocabulary_, term_counts, -1, np.int64))
+                if exact_norm:
+                    weights.append(self._lookup(self.unselected_weights_, term_counts, np.nan, np.float64))
+            counts.extend(term_counts.values())
+            num_doc_terms.append(len(term_counts))
+        num_docs = len(num_doc_terms)
+        counts = np.array(counts, dtype=np.int64)
+        rows = np.repeat(np.arange(num_docs, dtype=np.int64), num_doc_terms)
+        if batch_lookup:
+            terms = np.array(terms, dtype=object)
+            term_ids = self._lookup(self.vocabulary_, terms, -1, np.int64)
+            if exact_norm:
+                weights = self._lookup(self.unselected_weights_, terms, np.nan, np.float64)
+        else:
+            term_ids = np.concatenate(term_ids) if num_docs > 0 else np.zeros(0, dtype=np.int64)
+            if exact_norm:
+                weights = np.concatenate(weights) if num_docs > 0 else np.zeros(0)
+        selected = term_ids >= 0
+        unselected_norms = np.zeros(num_docs)
+        if exact_norm:
+            # the norm of the unselected part of the feature vectors is computed from the vector of the weights of
+            # all the terms, where the selected and the unknown terms have no weight
+            known = ~np.isnan(weights)
+            weights = weights[known] * self._get_term_weights(counts[known])
+            unselected_norms = np.bincount(rows[known], weights=np.abs(weights) if self.norm == "l1" else
+                                           weights * weights, minlength=num_docs)
+        indptr = np.zeros(num_docs + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows[selected], minlength=num_docs), out=indptr[1:])
+        features = sp.csr_matrix((counts[selected], term_ids[selected], indptr),
+                                 shape=(num_docs, len(self.vocabulary_)))
+        features.sort_indices()
+        if self.binary:
+            features.data.fill(1)
+        if not self.tfidf:
+            return features.astype(self.dtype)
+        features = features.astype(np.float64)
+        if self.sublinear_tf:
+            np.log(features.data, features.data)
+            features.data += 1
+        if self.idf_ is not None:
+            features.data *= self.idf_[features.indices]
+        if self.norm is not None:
+            row_values = features.multiply(features) if self.norm == "l2" else abs(features)
+            norms = np.asarray(row_values.sum(axis=1)).ravel() + unselected_norms
+            if self.norm == "l2":
+                norms = np.sqrt(norms)
+            norms[norms == 0.0] = 1.0
+            features.data /= np.repeat(norms, np.diff(features.indptr))
+        return features.astype(self.dtype)
+
+
+class TermIndex(object):
+    """read-only hash table that maps terms to their ids, and optionally to a value for each term, stored in numpy
+    arrays
+
+    The terms are stored as a single utf-8 buffer with the offsets of each term, and the table is an array of slots
+    with open addressing on the crc32 of the terms. Since all the data are in flat arrays, the index can be saved to
+    .npy files and memory-mapped read-only by :func:`load_inference_model`, so that processes loading the same model
+    share the pages of the index instead of building a private dictionary of terms
+    """
+
+    def __init__(self, terms_data, terms_offsets, slots, hashes, values=None):
+        """create an index from its arrays. Use :meth:`build` to create the index of a list of terms
+
+        :param terms_data: the utf-8 buffer of the terms
+        :param terms_offsets: the offsets of the terms in the buffer, with an additional offset for the end of the last
+            term
+        :param slots: the hash table, with the ids of the terms or -1 for empty slots. The size must be a power of 2
+        :param hashes: the crc32 of each term
+        :param values: the values associated with the terms, if any
+        """
+        self.terms_data = terms_data
+        self.terms_offsets = terms_offsets
+        self.slots = slots
+        self.hashes = hashes
+        self.values = values
+        self._mask = len(slots) - 1
+        self._data_view = memoryview(terms_data).cast("B") if len(terms_data) > 0 else memoryview(b"")
+
+    @staticmethod
+    def build(terms: List[str], values=None):
+        """build the index of a list of terms, whose ids are their positions in the list
+
+        :param terms: the terms
+        :type terms: List[str]
+        :param values: the values associated with the terms, if any
+        :return: the index
+        :rtype: TermIndex
+        """
+        encoded_terms = [term.encode("utf-8") for term in terms]
+        terms_offsets = np.zeros(len(encoded_terms) + 1, dtype=np.int64)
+        np.cumsum([len(term) for term in encoded_terms], out=terms_offsets[1:])
+        terms_data = np.frombuffer(b"".join(encoded_terms), dtype=np.uint8)
+        hashes = np.array([zlib.crc32(term) for term in encoded_terms], dtype=np.uint32)
+        num_slots = 1
+        while num_slots < 2 * len(encoded_terms):
+            num_slots *= 2
+        slots = np.full(num_slots, -1, dtype=np.int64)
+        for term_idx, term_hash in enumerate(hashes.tolist()):
+            slot = term_hash & (num_slots - 1)
+            while slots[slot] >= 0:
+                slot = (slot + 1) & (num_slots - 1)
+            slots[slot] = term_idx
+        return TermIndex(terms_data, terms_offsets, slots, hashes,
+                         np.asarray(values) if values is not None else None)
+
+    def get_arrays(self, prefix: str):
+        """get the arrays of the index, named with a prefix
+
+        :param prefix: the prefix of the names of the arrays
+        :type prefix: str
+        :return: the arrays of the index
+        :rtype: Dict[str, numpy.ndarray]
+        """
+        arrays = {prefix + "_data": self.terms_data, prefix + "_offsets": self.terms_offsets,
+                  prefix + "_slots": self.slots, prefix + "_hashes": self.hashes}
+        if self.values is not None:
+            arrays[prefix + "_values"] = self.values
+        return arrays
+
+    @staticmethod
+    def from_arrays(arrays, prefix: str):
+        """create an index from the arrays returned by :meth:`get_arrays`
+
+        :param arrays: the arrays, indexed by name
+        :param prefix: the prefix of the names of the arrays
+        :type prefix: str
+        :return: the index
+        :rtype: TermIndex
+        """
+        return TermIndex(arrays[prefix + "_data"], arrays[prefix + "_offsets"], arrays[prefix + "_slots"],
+                         arrays[prefix + "_hashes"], arrays[prefix + "_values"] if prefix + "_values" in arrays
+                         else None)
+
+    def __len__(self):
+        return len(self.terms_offsets) - 1
+
+    def _get_term(self, term_idx: int):
+        return bytes(self._data_view[self.terms_offsets[term_idx]:self.terms_offsets[term_idx + 1]]).decode("utf-8")
+
+    def keys(self):
+        """get the terms of the index
+
+        :return: the terms, in the order of their ids
+        :rtype: Iterable[str]
+        """
+        return (self._get_term(term_idx) for term_idx in range(len(self)))
+
+    def __iter__(self):
+        return self.keys()
+
+    def items(self):
+        """get the terms of the index with their values, or with their ids if the index has no values
+
+        :return: the pairs of terms and values
+        :rtype: Iterable[Tuple[str, Any]]
+        """
+        return ((self._get_term(term_idx), self.values[term_idx] if self.values is not None else term_idx) for
+                term_idx in range(len(self)))
+
+    def lookup(self, terms: List[str]):
+        """get the ids of a list of terms
+
+        :param terms: the terms
+        :type terms: List[str]
+        :return: the ids of the terms, or -1 for the terms that are not in the index
+        :rtype: numpy.ndarray
+        """
+        encoded_terms = [term.encode("utf-8") for term in terms]
+        term_hashes = np.fromiter(map(zlib.crc32, encoded_terms), dtype=np.int64, count=len(encoded_terms))
+        term_ids = np.full(len(encoded_terms), -1, dtype=np.int64)
+        if len(self) == 0 or len(encoded_terms) == 0:
+            return term_ids
+        terms_lengths = np.fromiter(map(len, encoded_terms), dtype=np.int64, count=len(encoded_terms))
+        terms_offsets = np.cumsum(terms_lengths) - terms_lengths
+        terms_data = np.frombuffer(b"".join(encoded_terms), dtype=np.uint8)
+        pending = np.arange(len(encoded_terms))
+        slots = term_hashes & self._mask
+        while len(pending) > 0:
+            candidates = self.slots[slots[pending]]
+            occupied = candidates >= 0
+            pending, candidates = pending[occupied], candidates[occupied]
+            found = (self.hashes[candidates] == term_hashes[pending]) & (
+                self.terms_offsets[candidates + 1] - self.terms_offsets[candidates] == terms_lengths[pending])
+            # the bytes of the terms with the same hash and length are compared all at once
+            match_idx = np.flatnonzero(found)
+            match_lengths = terms_lengths[pending[match_idx]]
+            if match_lengths.sum() > 0:
+                byte_pos = np.arange(match_lengths.sum()) - np.repeat(np.cumsum(match_lengths) - match_lengths,
+                                                                      match_lengths)
+                query_bytes = terms_data[np.repeat(terms_offsets[pending[match_idx]], match_lengths) + byte_pos]
+                index_bytes = self.terms_data[np.repeat(self.terms_offsets[candidates[match_idx]], match_lengths) +
+                                              byte_pos]
+                different_bytes = query_bytes != index_bytes
+                mismatches = np.bincount(np.repeat(np.arange(len(match_idx)), match_lengths), weights=different_bytes,
+                                         minlength=len(match_idx))
+                found[match_idx[mismatches > 0]] = False
+            term_ids[pending[found]] = candidates[found]
+            pending = pending[~found]
+            slots[pending] = (slots[pending] + 1) & self._mask
+        return term_ids
+
+    def get(self, term: str, default=None):
+        """get the value of a term, or its id if the index has no values
+
+        :param term: the term
+        :type term: str
+        :param default: the value returned if the term is not in the index
+        :return: the value or the id of the term
+        """
+        term_idx = int(self.lookup([term])[0])
+        if term_idx < 0:
+            return default
+        return self.values[term_idx] if self.values is not None else term_idx
+
+    def __contains__(self, term: str):
+        return self.lookup([term])[0] >= 0
+
+
+def _get_class_path(obj):
+    return type(obj).__module__ + "." + type(obj).__name__
+
+
+def _encode_terms(terms: List[str]):
+    # terms are stored as a single utf-8 buffer instead of a fixed width unicode array, which would take the space of
+    # the longest term for each term
+    return np.frombuffer("\0".join(terms).encode("utf-8"), dtype=np.uint8)
+
+
+def _decode_terms(terms_array):
+    if len(terms_array) == 0:
+        return []
+    return terms_array.tobytes().decode("utf-8").split("\0")
+
+
+def _get_tokenizer_lemmas_arrays(compiled_vectorizer: CompiledVectorizer):
+    # the memo table of the tokenizer is saved with the model, so that loaded models do not lemmatize again the tokens
+    # seen during training. Pairs that cannot be stored in the null separated buffers of the terms are skipped
+    tokenizer = compiled_vectorizer.vectorizer.get_params().get("tokenizer")
+    if tokenizer is None or not hasattr(tokenizer, "get_lemmas"):
+        return {}
+    lemmas = [(token, lemma) for token, lemma in tokenizer.get_lemmas() if token and lemma and "\0" not in token and
+              "\0" not in lemma]
+    return {"lemma_tokens": _encode_terms([token for token, _ in lemmas]),
+            "lemma_values": _encode_terms([lemma for _, lemma in lemmas])}
+
+
+def _get_tokenizer_lemmas(arrays):
+    if "lemma_tokens" not in arrays:
+        return None
+    return zip(_decode_terms(arrays["lemma_tokens"]), _decode_terms(arrays["lemma_values"]))
+
+
+def _get_header(compiled_vectorizer: CompiledVectorizer, layout: str, metadata: Dict = None):
+    params = compiled_vectorizer.vectorizer.get_params()
+    params.pop("vocabulary", None)
+    params.pop("dtype", None)
+    if params.get("preprocessor") is not None or callable(params.get("analyzer")):
+        raise Exception('vectorizers with custom preprocessors or analyzers cannot be saved for inference')
+    if params.get("tokenizer") is not None:
+        params["tokenizer"] = _get_class_path(params["tokenizer"])
+    if isinstance(params.get("stop_words"), (set, frozenset, list)):
+        params["stop_words"] = sorted(params["stop_words"])
+    return {"format_version": INFERENCE_FORMAT_VERSION, "layout": layout,
+            "vectorizer_class": type(compiled_vectorizer.vectorizer).__name__, "vectorizer_params": params,
+            "binary": compiled_vectorizer.binary, "dtype": np.dtype(compiled_vectorizer.dtype).name,
+            "tfidf": compiled_vectorizer.tfidf, "sublinear_tf": compiled_vectorizer.sublinear_tf,
+            "norm": compiled_vectorizer.norm, "metadata": metadata if metadata is not None else {}}
+
+
+class _ModelPickler(pickle.Pickler):
+    # numpy arrays of the model are stored as arrays of the file, referenced by name in the pickle stream, so that
+    # they can be memory-mapped when the model is loaded. Small arrays are kept in the pickle stream, where they do
+    # not need an entry of their own
+
+    def __init__(self, file, model_arrays: Dict):
+        super().__init__(file, protocol=MODEL_PICKLE_PROTOCOL)
+        self.model_arrays = model_arrays
+        self._array_names = {}
+
+    def persistent_id(self, obj):
+        if not isinstance(obj, np.ndarray) or isinstance(obj, np.matrix) or obj.dtype.hasobject or \
+                obj.nbytes < MIN_MMAP_BUFFER_SIZE:
+            return None
+        if id(obj) not in self._array_names:
+            array_name = "model_array_" + str(len(self._array_names))
+            self._array_names[id(obj)] = array_name
+            self.model_arrays[array_name] = obj
+        return self._array_names[id(obj)]
+
+
+class _ModelUnpickler(pickle.Unpickler):
+
+    def __init__(self, file, model_arrays):
+        super().__init__(file)
+        self.model_arrays = model_arrays
+        # arrays referenced more than once by the model are loaded once, as they were shared when the model was saved
+        self._loaded_arrays = {}
+
+    def persistent_load(self, pid):
+        if pid not in self._loaded_arrays:
+            self._loaded_arrays[pid] = self.model_arrays[pid]
+        return self._loaded_arrays[pid]
+
+
+def _dump_model(model):
+    model_arrays = {}
+    model_file = io.BytesIO()
+    _ModelPickler(model_file, model_arrays).dump(model)
+    return model_file.getvalue(), model_arrays
+
+
+def _load_model(model_data: bytes, model_arrays):
+    return _ModelUnpickler(io.BytesIO(model_data), model_arrays).load()
+
+
+def _build_compiled_vectorizer(header: Dict, tokenizers: Dict[str, Callable], vocabulary, idf, unselected_weights,
+                               lemmas=None):
+    if header.get("format_version") not in range(1, INFERENCE_FORMAT_VERSION + 1):
+        raise Exception('unsupported inference model format version: ' + str(header.get("format_version")))
+    params = header["vectorizer_params"]
+    if params.get("tokenizer") is not None:
+        if tokenizers is None or params["tokenizer"] not in tokenizers:
+            raise Exception('unknown tokenizer: ' + params["tokenizer"])
+        params["tokenizer"] = tokenizers[params["tokenizer"]]()
+        if lemmas is not None and hasattr(params["tokenizer"], "add_lemmas"):
+            params["tokenizer"].add_lemmas(lemmas)
+    if isinstance(params.get("ngram_range"), list):
+        params["ngram_range"] = tuple(params["ngram_range"])
+    vectorizer_class = TfidfVectorizer if header["vectorizer_class"] == "TfidfVectorizer" else CountVectorizer
+    compiled_vectorizer = CompiledVectorizer.__new__(CompiledVectorizer)
+    compiled_vectorizer.vocabulary_ = vocabulary
+    compiled_vectorizer.binary = header["binary"]
+    compiled_vectorizer.dtype = np.dtype(header["dtype"]).type
+    compiled_vectorizer.tfidf = header["tfidf"]
+    compiled_vectorizer.sublinear_tf = header["sublinear_tf"]
+    compiled_vectorizer.norm = header["norm"]
+    compiled_vectorizer.idf_ = idf
+    compiled_vectorizer.unselected_weights_ = unselected_weights
+    compiled_vectorizer.vectorizer = vectorizer_class(**dict(params, dtype=compiled_vectorizer.dtype))
+    compiled_vectorizer._analyzer = None
+    return compiled_vectorizer
+
+
+def _get_tmp_path(file_path: str):
+    # temporary files are created next to the model with the permissions of regular files
+    return os.path.abspath(file_path) + "." + uuid.uuid4().hex + ".tmp"
+
+
+def save_inference_model(file_path: str, compiled_vectorizer: CompiledVectorizer, model, metadata: Dict = None,
+                         mmap: bool = False):
+    """save a compiled vectorizer and a trained model to a compact file for inference
+
+    The file is a numpy npz archive that contains a json header with the format version and the settings of the
+    vectorizer, the selected terms, their idf weights, the weights of the unselected terms used to compute exact norms
+    (if any), the lemmas memoized by the tokenizer (if any) and the model. Only the model is pickled, so that loading
+    the file does not require to unpickle the training data, the feature scores or the vocabulary of the original
+    vectorizer. The large numpy arrays of the model (e.g., coefficients and support vectors) are stored as arrays of
+    the archive and referenced by name in the pickle stream.
+
+    If *mmap* is True, the model is saved instead as a directory of .npy files that are memory-mapped read-only when
+    the model is loaded. The terms are stored as :class:`TermIndex` hash tables and the large arrays of the model are
+    stored in separate .npy files, so that concurrent processes that load the same model share the memory of all its
+    large arrays. Looking up terms in the hash tables is slower than in the dictionaries built when loading npz
+    archives (about 1.5 times on the synthetic benchmark in benchmarks/bench_compiled_vectorizer.py), so the directory
+    layout only pays off when the memory saved by sharing the model among processes matters more than latency. An
+    existing model is replaced by a new directory, so that the files memory-mapped by the processes that loaded it are
+    left untouched
+
+    :param file_path: the path of the file, or of the directory if *mmap* is True
+    :type file_path: str
+    :param compiled_vectorizer: the compiled vectorizer
+    :type compiled_vectorizer: CompiledVectorizer
+    :param model: the trained model
+    :param metadata: additional values to store in the header. The values must be serializable to json
+    :type metadata: Dict
+    :param mmap: whether to save the model as a directory of memory-mappable arrays
+    :type mmap: bool
+    :raise: Exception in case the vectorizer uses a custom preprocessor or analyzer
+    """
+    header = _get_header(compiled_vectorizer, "dir" if mmap else "npz", metadata)
+    arrays = _get_tokenizer_lemmas_arrays(compiled_vectorizer)
+    if compiled_vectorizer.idf_ is not None:
+        arrays["idf"] = np.asarray(compiled_vectorizer.idf_)
+    if mmap:
+        arrays.update(TermIndex.build(compiled_vectorizer.get_feature_names()).get_arrays("terms"))
+        if compiled_vectorizer.unselected_weights_ is not None:
+            unselected_terms, unselected_weights = zip(*compiled_vectorizer.unselected_weights_.items()) if \
+                len(compiled_vectorizer.unselected_weights_) > 0 else ([], [])
+            arrays.update(TermIndex.build(list(unselected_terms), np.array(unselected_weights, dtype=np.float64))
+                          .get_arrays("unselected"))
+        model_data, model_arrays = _dump_model(model)
+        arrays.update(model_arrays)
+        header["arrays"] = sorted(arrays.keys())
+        # the model is written to a new directory that replaces the previous one, so that the files memory-mapped by
+        # the processes that loaded the previous model are never overwritten and no stale array is left in the model
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        tmp_dir_path = _get_tmp_path(file_path)
+        os.mkdir(tmp_dir_path)
+        try:
+            for array_name, array in arrays.items():
+                np.save(os.path.join(tmp_dir_path, array_name + ".npy"), array)
+            with open(os.path.join(tmp_dir_path, "model.pkl"), "wb") as fpout:
+                fpout.write(model_data)
+            with open(os.path.join(tmp_dir_path, "header.json"), "w") as fpout:
+                json.dump(header, fpout)
+            if os.path.isdir(file_path):
+                old_dir_path = _get_tmp_path(file_path)
+                os.replace(file_path, old_dir_path)
+                os.replace(tmp_dir_path, file_path)
+                shutil.rmtree(old_dir_path, ignore_errors=True)
+            else:
+                os.replace(tmp_dir_path, file_path)
+        except BaseException:
+            shutil.rmtree(tmp_dir_path, ignore_errors=True)
+            raise
+    else:
+        arrays["header"] = np.array(json.dumps(header))
+        arrays["terms"] = _encode_terms(compiled_vectorizer.get_feature_names())
+        model_data, model_arrays = _dump_model(model)
+        arrays["model"] = np.frombuffer(model_data, dtype=np.uint8)
+        arrays.update(model_arrays)
+        if compiled_vectorizer.unselected_weights_ is not None:
+            arrays["unselected_terms"] = _encode_terms(list(compiled_vectorizer.unselected_weights_.keys()))
+            arrays["unselected_weights"] = np.array(list(compiled_vectorizer.unselected_weights_.values()),
+                                                    dtype=np.float64)
+        tmp_path = _get_tmp_path(file_path)
+        try:
+            with open(tmp_path, "xb") as fpout:
+                np.savez(fpout, **arrays)
+            os.replace(tmp_path, file_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+
+def load_inference_model(file_path: str, tokenizers: Dict[str, Callable] = None):
+    """load a compiled vectorizer and a trained model saved by :func:`save_inference_model`. The arrays of models saved
+    as directories are memory-mapped read-only
+
+    :param file_path: the path of the file or of the directory of the model
+    :type file_path: str
+    :param tokenizers: the factories of the custom tokenizers that can be used by the vectorizer, indexed by the
+        module and name of their class
+    :type tokenizers: Dict[str, Callable]
+    :return: the compiled vectorizer, the model and the metadata stored in the file
+    :rtype: Tuple[CompiledVectorizer, Any, Dict]
+    :raise: Exception in case the format of the file is not supported or the tokenizer of the vectorizer is not known
+    """
+    if os.path.isdir(file_path):
+        with open(os.path.join(file_path, "header.json")) as fpin:
+            header = json.load(fpin)
+        # only the arrays listed in the header are part of the model. Models saved by previous versions have no list
+        array_names = header.get("arrays")
+        if array_names is None:
+            array_names = [file[:-len(".npy")] for file in os.listdir(file_path) if file.endswith(".npy")]
+        arrays = {array_name: np.load(os.path.join(file_path, array_name + ".npy"), mmap_mode="r", allow_pickle=False)
+                  for array_name in array_names}
+        unselected_weights = None
+        if "unselected_slots" in arrays:
+            unselected_weights = TermIndex.from_arrays(arrays, "unselected")
+        compiled_vectorizer = _build_compiled_vectorizer(header, tokenizers, TermIndex.from_arrays(arrays, "terms"),
+                                                         arrays.get("idf"), unselected_weights,
+                                                         _get_tokenizer_lemmas(arrays))
+        with open(os.path.join(file_path, "model.pkl"), "rb") as fpin:
+            if "num_model_buffers" in header:
+                # models saved by version 1 of the format store the arrays of the model as pickle buffers, which can
+                # only be loaded by python 3.8 or later
+                model = pickle.loads(fpin.read(), buffers=[arrays["model_buffer_" + str(buffer_idx)] for buffer_idx
+                                                           in range(header["num_model_buffers"])])
+            else:
+                model = _load_model(fpin.read(), arrays)
+        return compiled_vectorizer, model, header["metadata"]
+    with np.load(file_path, allow_pickle=False) as arrays:
+        header = json.loads(str(arrays["header"]))
+        unselected_weights = None
+        if "unselected_terms" in arrays:
+            unselected_weights = dict(zip(_decode_terms(arrays["unselected_terms"]),
+                                          arrays["unselected_weights"].tolist()))
+        compiled_vectorizer = _build_compiled_vectorizer(
+            header, tokenizers, {term: term_idx for term_idx, term in enumerate(_decode_terms(arrays["terms"]))},
+            arrays["idf"] if "idf" in arrays else None, unselected_weights, _get_tokenizer_lemmas(arrays))
+        model = _load_model(arrays["model"].tobytes(), arrays)
+    return compiled_vectorizer, model, header["metadata"]
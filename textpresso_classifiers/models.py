@@ -0,0 +1,67 @@
+"""Create the models of the command line programs, importing the module of each model only when it is used"""
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+MODEL_TYPES = ["KNN", "SVM_LINEAR", "SVM_NONLINEAR", "TREE", "RF", "MLP", "NAIVEB", "GAUSS", "LDA", "XGBOOST", "SGD"]
+DENSE_MODEL_TYPES = ["NAIVEB", "GAUSS", "LDA", "XGBOOST"]
+
+
+def is_dense_model(model_type: str):
+    """check whether a type of model requires dense feature vectors
+
+    :param model_type: the type of model, among MODEL_TYPES
+    :type model_type: str
+    :return: whether the model requires dense feature vectors
+    :rtype: bool
+    """
+    return model_type in DENSE_MODEL_TYPES
+
+
+def create_model(model_type: str):
+    """create a new, untrained model of the specified type. Only the module of the model is imported, so that the
+    programs do not pay for importing all the model families of scikit-learn
+
+    :param model_type: the type of model, among MODEL_TYPES
+    :type model_type: str
+    :return: the model
+    :raise: Exception in case the type of model is not supported
+    """
+    if model_type == "KNN":
+        from sklearn.neighbors import KNeighborsClassifier
+        return KNeighborsClassifier(3)
+    elif model_type == "SVM_LINEAR":
+        from sklearn.svm import SVC
+        return SVC(kernel="linear")
+    elif model_type == "SVM_NONLINEAR":
+        from sklearn.svm import NuSVR
+        return NuSVR(kernel='sigmoid', gamma=0.05)
+    elif model_type == "TREE":
+        from sklearn.tree import DecisionTreeClassifier
+        return DecisionTreeClassifier()
+    elif model_type == "RF":
+        from sklearn.ensemble import RandomForestClassifier
+        return RandomForestClassifier()
+    elif model_type == "MLP":
+        from sklearn.neural_network import MLPClassifier
+        return MLPClassifier(alpha=1)
+    elif model_type == "NAIVEB":
+        from sklearn.naive_bayes import GaussianNB
+        return GaussianNB()
+    elif model_type == "GAUSS":
+        from sklearn.gaussian_process import GaussianProcessClassifier
+        from sklearn.gaussian_process.kernels import RBF
+        return GaussianProcessClassifier(1.0 * RBF(1.0), warm_start=True)
+    elif model_type == "LDA":
+        from sklearn.discriminant_analysis import QuadraticDiscriminantAnalysis
+        return QuadraticDiscriminantAnalysis()
+    elif model_type == "XGBOOST":
+        from sklearn.ensemble import GradientBoostingClassifier
+        return GradientBoostingClassifier()
+    elif model_type == "SGD":
+        from sklearn.linear_model import SGDClassifier
+        return SGDClassifier()
+    else:
+        raise Exception('model type not supported: ' + model_type)
@@ -0,0 +1,294 @@
+"""Apply a set of Textpresso document classifiers to the same documents in a single pass"""
+
+import itertools
+import os
+import time
+import numpy as np
+import scipy.sparse as sp
+from collections import OrderedDict, Counter
+from typing import List, Dict
+from sklearn.feature_extraction.text import CountVectorizer, TfidfVectorizer
+from sklearn.preprocessing import normalize
+from textpresso_classifiers.classifiers import TextpressoDocumentClassifier, PredictionStats, predict_dense
+from textpresso_classifiers.features import get_analyzer_key
+from textpresso_classifiers.fileutils import iter_prefetched
+from textpresso_classifiers.models import MODEL_TYPES, DENSE_MODEL_TYPES
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+def transform_counts(vectorizer, counts):
+    """transform a matrix of term counts, with columns ordered as the vocabulary of a fitted vectorizer, into the
+    feature vectors that the vectorizer would return for the same documents
+
+    :param vectorizer: the fitted CountVectorizer or TfidfVectorizer
+    :param counts: the matrix of term counts
+    :type counts: scipy.sparse.csr_matrix
+    :return: the feature vectors
+    :rtype: scipy.sparse.csr_matrix
+    """
+    if vectorizer.binary:
+        counts = counts.copy()
+        counts.data.fill(1)
+    if isinstance(vectorizer, TfidfVectorizer):
+        features = counts.astype(np.float64)
+        if vectorizer.sublinear_tf:
+            np.log(features.data, features.data)
+            features.data += 1
+        if vectorizer.use_idf:
+            features = features @ sp.diags(vectorizer.idf_, format="csr")
+        if vectorizer.norm:
+            features = normalize(features, norm=vectorizer.norm, copy=False)
+        return features
+    return counts.astype(vectorizer.dtype)
+
+
+class _AnalyzerGroup(object):
+    """set of classifiers whose vectorizers share the same analyzer"""
+
+    def __init__(self, vectorizer):
+        self.analyzer = vectorizer.build_analyzer()
+        self.model_names = []
+        self.vocabulary = {}
+        self.columns = {}
+        self.compiled_vectorizers = {}
+        self._count_vectorizer = None
+
+    def add_model(self, model_name: str, vectorizer):
+        self.model_names.append(model_name)
+        for term in vectorizer.vocabulary_:
+            self.vocabulary.setdefault(term, len(self.vocabulary))
+        columns = np.empty(len(vectorizer.vocabulary_), dtype=np.int64)
+        for term, term_idx in vectorizer.vocabulary_.items():
+            columns[term_idx] = self.vocabulary[term]
+        self.columns[model_name] = columns
+        self._count_vectorizer = None
+
+    def add_compiled_model(self, model_name: str, compiled_vectorizer):
+        self.model_names.append(model_name)
+        self.compiled_vectorizers[model_name] = compiled_vectorizer
+
+    def count_terms(self, texts: List[str]):
+        # the counts of all the terms of each document are needed only by compiled vectorizers, which look up their
+        # own terms in them
+        if len(self.compiled_vectorizers) == 0:
+            if self._count_vectorizer is None:
+                # the vocabulary is validated once, instead of at each call
+                self._count_vectorizer = CountVectorizer(analyzer=self.analyzer, vocabulary=self.vocabulary)
+                self._count_vectorizer._validate_vocabulary()
+            return self._count_vectorizer.transform(texts).tocsc(), None
+        docs_term_counts = [Counter(self.analyzer(text)) for text in texts]
+        if len(self.vocabulary) == 0:
+            return None, docs_term_counts
+        indptr = [0]
+        indices = []
+        values = []
+        for term_counts in docs_term_counts:
+            term_ids = np.fromiter(map(self.vocabulary.get, term_counts, itertools.repeat(-1, len(term_counts))),
+                                   dtype=np.int64, count=len(term_counts))
+            known = term_ids >= 0
+            indices.append(term_ids[known])
+            values.append(np.fromiter(term_counts.values(), dtype=np.int64, count=len(term_counts))[known])
+            indptr.append(indptr[-1] + int(known.sum()))
+        counts = sp.csr_matrix((np.concatenate(values), np.concatenate(indices), np.asarray(indptr, dtype=np.int64)),
+                               shape=(len(texts), len(self.vocabulary)))
+        counts.sort_indices()
+        return counts.tocsc(), docs_term_counts
+
+
+class MultiModelClassifier(object):
+    """apply a set of :class:`TextpressoDocumentClassifier` models to the same documents
+
+    The text of each document is extracted once for all the models, and the text is analyzed once for each group of
+    models with the same analyzer settings (tokenizer, n-gram range, stop words, etc.). The term counts of each group
+    are computed on the union of the vocabularies of its models and then projected onto the vocabulary of each model
+    and weighted as the vectorizer of the model would do, so that the predictions are the same as the ones obtained by
+    applying each model separately. Models with a vectorizer compiled for inference (e.g., loaded from the inference
+    format) look up their selected terms in the counts of all the terms of the documents, computed once for the group
+    """
+
+    def __init__(self):
+        self.classifiers = OrderedDict()
+        self.dense = {}
+        self.prediction_stats = None
+        self._groups = None
+
+    def add_classifier(self, name: str, classifier: TextpressoDocumentClassifier, dense: bool = False):
+        """add a trained classifier to the set
+
+        :param name: the name of the classifier (e.g., the data type it predicts)
+        :type name: str
+        :param classifier: the trained classifier
+        :type classifier: TextpressoDocumentClassifier
+        :param dense: whether the model of the classifier requires dense feature vectors
+        :type dense: bool
+        """
+        self.classifiers[name] = classifier
+        self.dense[name] = dense
+        self._groups = None
+
+    def get_model_names(self):
+        """get the names of the classifiers in the set
+
+        :return: the names of the classifiers, in the order in which they were added
+        :rtype: List[str]
+        """
+        return list(self.classifiers.keys())
+
+    def _get_groups(self):
+        if self._groups is None:
+            groups = OrderedDict()
+            for name, classifier in self.classifiers.items():
+                compiled_vectorizer = getattr(classifier, "compiled_vectorizer", None)
+                if compiled_vectorizer is not None:
+                    analyzer_key = get_analyzer_key(compiled_vectorizer.vectorizer)
+                    if analyzer_key not in groups:
+                        groups[analyzer_key] = _AnalyzerGroup(compiled_vectorizer.vectorizer)
+                    groups[analyzer_key].add_compiled_model(name, compiled_vectorizer)
+                elif isinstance(classifier.vectorizer, (CountVectorizer, TfidfVectorizer)) and \
+                        hasattr(classifier.vectorizer, "vocabulary_"):
+                    analyzer_key = get_analyzer_key(classifier.vectorizer)
+                    if analyzer_key not in groups:
+                        groups[analyzer_key] = _AnalyzerGroup(classifier.vectorizer)
+                    groups[analyzer_key].add_model(name, classifier.vectorizer)
+            self._groups = list(groups.values())
+        return self._groups
+
+    def _predict(self, name: str, tr_features, select_features: bool = True):
+        classifier = self.classifiers[name]
+        best_features_idx = classifier._get_best_features_idx() if select_features else None
+        if best_features_idx is not None:
+            tr_features = tr_features[:, best_features_idx]
+        if self.dense[name]:
+            return predict_dense(classifier.classifier, tr_features).tolist()
+        return classifier.classifier.predict(tr_features).tolist()
+
+    def predict_texts(self, texts: List[str]):
+        """predict the classes of a list of documents with all the classifiers in the set
+
+        :param texts: the fulltext of the documents
+        :type texts: List[str]
+        :return: the predictions of each classifier for the documents, in the same order of the documents
+        :rtype: Dict[str, List[int]]
+        """
+        predictions = {}
+        if len(texts) == 0:
+            return {name: [] for name in self.classifiers}
+        for group in self._get_groups():
+            counts, docs_term_counts = group.count_terms(texts)
+            for name in group.model_names:
+                if name in group.compiled_vectorizers:
+                    tr_features = group.compiled_vectorizers[name].transform_term_counts(docs_term_counts)
+                    predictions[name] = self._predict(name, tr_features, select_features=False)
+                else:
+                    tr_features = transform_counts(self.classifiers[name].vectorizer,
+                                                   counts[:, group.columns[name]].tocsr())
+                    predictions[name] = self._predict(name, tr_features)
+        for name, classifier in self.classifiers.items():
+            if name not in predictions:
+                predictions[name] = self._predict(name, classifier._transform_for_prediction(texts),
+                                                  select_features=False)
+        return OrderedDict((name, predictions[name]) for name in self.classifiers)
+
+    def iter_predict_files(self, dir_path: str, file_type: str = "pdf", n_jobs: int = 1, chunk_size: int = 1000,
+                           prefetch: int = 0):
+        """predict the classes of a set of files with all the classifiers in the set, processing the files in chunks
+        and yielding the predictions as soon as each chunk has been classified. The time spent in each stage is stored
+        in the *prediction_stats* field, where vectorization and prediction are counted together as prediction time
+
+        :param dir_path: the path to the directory containing the files to be classified, or to a packed corpus of cas
+            files
+        :type dir_path: str
+        :param file_type: the type of files
+        :type file_type: str
+        :param n_jobs: the number of worker processes used to extract the text from the files
+        :type n_jobs: int
+        :param chunk_size: the number of files to be processed in each chunk
+        :type chunk_size: int
+        :param prefetch: the number of chunks to be read and converted in advance in background
+        :type prefetch: int
+        :return: a generator of file names of the classified documents, in the order in which they are read, along with
+            the classes predicted by each classifier or None if the file cannot be converted
+        :rtype: Iterable[Tuple[str, Dict[str, int]]]
+        """
+        stats = PredictionStats(0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.prediction_stats = stats
+        start_time = time.perf_counter()
+        chunks = TextpressoDocumentClassifier._iter_document_batches(dir_path, file_type, chunk_size, n_jobs, stats)
+        if prefetch > 0:
+            chunks = iter_prefetched(chunks, prefetch=prefetch)
+        while True:
+            wait_start_time = time.perf_counter()
+            chunk = next(chunks, None)
+            stats.extraction_wait_time += time.perf_counter() - wait_start_time
+            if chunk is None:
+                break
+            doc_names, fulltexts = chunk
+            data = [text for text in fulltexts if text is not None]
+            stage_start_time = time.perf_counter()
+            predictions = self.predict_texts(data)
+            stats.prediction_time += time.perf_counter() - stage_start_time
+            stats.num_docs += len(data)
+            stats.num_failed += len(fulltexts) - len(data)
+            stats.wall_time = time.perf_counter() - start_time
+            prediction_idx = 0
+            for doc_name, text in zip(doc_names, fulltexts):
+                if text is None:
+                    yield doc_name, None
+                else:
+                    yield doc_name, OrderedDict((name, model_predictions[prediction_idx]) for name, model_predictions
+                                                in predictions.items())
+                    prediction_idx += 1
+
+    @staticmethod
+    def load_from_files(model_files: Dict[str, str], dense_models: List[str] = None):
+        """load a set of classifiers from their pickle files or files in the inference format
+
+        :param model_files: the names of the classifiers with the paths to their files
+        :type model_files: Dict[str, str]
+        :param dense_models: the names of the classifiers whose model requires dense feature vectors
+        :type dense_models: List[str]
+        :return: the set of classifiers
+        :rtype: MultiModelClassifier
+        """
+        multi_classifier = MultiModelClassifier()
+        for name, file_path in model_files.items():
+            multi_classifier.add_classifier(name, TextpressoDocumentClassifier.load_from_file(file_path),
+                                            dense=dense_models is not None and name in dense_models)
+        return multi_classifier
+
+    @staticmethod
+    def load_from_dir(models_dir: str, datatypes: List[str] = None):
+        """load a set of classifiers from a directory of pickle files named <datatype>_<model_type>.pkl, as the ones
+        used by the classification pipeline of WormBase (e.g., geneint_SVM_LINEAR.pkl), or of files in the inference
+        format named <datatype>_<model_type>.npz or directories of memory-mapped arrays named
+        <datatype>_<model_type>.mmap. The datatypes are used as names of the classifiers, and the model types are used
+        to determine whether the models require dense feature vectors
+
+        :param models_dir: the directory containing the model files
+        :type models_dir: str
+        :param datatypes: the datatypes to load. All the models in the directory are loaded if None
+        :type datatypes: List[str]
+        :return: the set of classifiers, sorted by datatype
+        :rtype: MultiModelClassifier
+        """
+        model_files = OrderedDict()
+        dense_models = []
+        for file in sorted(os.listdir(models_dir)):
+            if not file.endswith(".pkl") and not file.endswith(".npz") and not file.endswith(".mmap"):
+                continue
+            datatype, model_type = os.path.splitext(file)[0], None
+            for known_model_type in MODEL_TYPES:
+                if datatype.endswith("_" + known_model_type):
+                    datatype, model_type = datatype[:-len(known_model_type) - 1], known_model_type
+                    break
+            if datatypes is not None and datatype not in datatypes:
+                continue
+            if datatype in model_files:
+                raise Exception("more than one model found for datatype " + datatype)
+            model_files[datatype] = os.path.join(models_dir, file)
+            if model_type in DENSE_MODEL_TYPES:
+                dense_models.append(datatype)
+        return MultiModelClassifier.load_from_files(model_files, dense_models)
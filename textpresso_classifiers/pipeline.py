@@ -0,0 +1,338 @@
+"""Resumable pipeline that classifies the papers of a Textpresso data directory into multiple data types"""
+
+import bisect
+import os
+import sqlite3
+import time
+from typing import List, Dict, Iterable
+from textpresso_classifiers.classifiers import PredictionStats
+from textpresso_classifiers.fileutils import extract_text_from_files, iter_prefetched, join_paper_texts
+from textpresso_classifiers.multimodel import MultiModelClassifier
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+WORK_LOG_FILE_NAME = "work_log.sqlite"
+CAS_FILE_EXTENSION = ".tpcas.gz"
+OUTPUT_FILE_EXTENSION = ".txt"
+PREDICTION_THRESHOLD = 0.4
+STATUS_CLASSIFIED = "classified"
+STATUS_FAILED = "failed"
+SQLITE_MAX_PARAMS = 500
+
+
+class WorkLog(object):
+    """indexed log of the papers processed by a :class:`ClassificationPipeline`, stored in a SQLite database
+
+    The papers and the predictions of each batch are stored in a single transaction, together with the size of the
+    output files before the results of the batch are appended to them. A batch is marked as exported after its results
+    have been written to the output files, so that the results of a batch interrupted while being written are
+    truncated and written again when the pipeline is resumed, and each paper appears exactly once in the output
+    """
+
+    def __init__(self, db_path: str):
+        """open a work log, creating it if it does not exist
+
+        :param db_path: the path to the database file
+        :type db_path: str
+        """
+        self.db_path = db_path
+        self.connection = sqlite3.connect(db_path)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        with self.connection:
+            self.connection.execute("CREATE TABLE IF NOT EXISTS papers (paper_id TEXT PRIMARY KEY, status TEXT NOT "
+                                    "NULL, batch_id INTEGER)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS predictions (paper_id TEXT NOT NULL, datatype TEXT NOT "
+                                    "NULL, prediction INTEGER NOT NULL, PRIMARY KEY (paper_id, datatype))")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS batches (batch_id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                                    "output_dir TEXT NOT NULL, exported INTEGER NOT NULL DEFAULT 0, created_at REAL)")
+            self.connection.execute("CREATE TABLE IF NOT EXISTS batch_outputs (batch_id INTEGER NOT NULL, datatype TEXT "
+                                    "NOT NULL, file_path TEXT NOT NULL, offset INTEGER NOT NULL, PRIMARY KEY "
+                                    "(batch_id, datatype))")
+
+    def get_processed(self, paper_ids: List[str]):
+        """get the papers of a list that have already been processed, looking them up in the index of the log
+
+        :param paper_ids: the ids of the papers
+        :type paper_ids: List[str]
+        :return: the ids of the processed papers
+        :rtype: Set[str]
+        """
+        processed = set()
+        for start in range(0, len(paper_ids), SQLITE_MAX_PARAMS):
+            chunk = paper_ids[start:start + SQLITE_MAX_PARAMS]
+            processed.update(row[0] for row in self.connection.execute(
+                "SELECT paper_id FROM papers WHERE paper_id IN (" + ",".join("?" * len(chunk)) + ")", chunk))
+        return processed
+
+    def add_processed(self, paper_ids: Iterable[str], status: str = STATUS_CLASSIFIED):
+        """mark papers as processed without storing their predictions, e.g., to import the list of papers classified
+        by the shell pipeline
+
+        :param paper_ids: the ids of the papers
+        :type paper_ids: Iterable[str]
+        :param status: the status of the papers
+        :type status: str
+        """
+        with self.connection:
+            self.connection.executemany("INSERT OR IGNORE INTO papers (paper_id, status) VALUES (?, ?)",
+                                        ((paper_id, status) for paper_id in paper_ids))
+
+    def add_batch(self, output_dir: str, predictions: Dict[str, Dict[str, int]], failed_paper_ids: List[str],
+                  output_files: Dict[str, str]):
+        """store the results of a batch of papers
+
+        :param output_dir: the directory of the output files of the batch
+        :type output_dir: str
+        :param predictions: the predictions of each data type for each classified paper
+        :type predictions: Dict[str, Dict[str, int]]
+        :param failed_paper_ids: the ids of the papers that could not be read
+        :type failed_paper_ids: List[str]
+        :param output_files: the output file of each data type
+        :type output_files: Dict[str, str]
+        :return: the id of the batch
+        :rtype: int
+        """
+        with self.connection:
+            batch_id = self.connection.execute("INSERT INTO batches (output_dir, created_at) VALUES (?, ?)",
+                                               (output_dir, time.time())).lastrowid
+            self.connection.executemany("INSERT OR REPLACE INTO papers (paper_id, status, batch_id) VALUES (?, ?, ?)",
+                                        [(paper_id, STATUS_CLASSIFIED, batch_id) for paper_id in predictions] +
+                                        [(paper_id, STATUS_FAILED, batch_id) for paper_id in failed_paper_ids])
+            self.connection.executemany("INSERT OR REPLACE INTO predictions (paper_id, datatype, prediction) VALUES "
+                                        "(?, ?, ?)", [(paper_id, datatype, prediction) for paper_id, paper_predictions
+                                                      in predictions.items() for datatype, prediction in
+                                                      paper_predictions.items()])
+            self.connection.executemany("INSERT INTO batch_outputs (batch_id, datatype, file_path, offset) VALUES "
+                                        "(?, ?, ?, ?)", [(batch_id, datatype, file_path, os.path.getsize(file_path)
+                                                          if os.path.exists(file_path) else 0)
+                                                         for datatype, file_path in output_files.items()])
+        return batch_id
+
+    def get_unexported_batches(self):
+        """get the ids of the batches whose results have not been completely written to the output files
+
+        :return: the ids of the batches, in the order in which they were added
+        :rtype: List[int]
+        """
+        return [row[0] for row in self.connection.execute("SELECT batch_id FROM batches WHERE exported = 0 ORDER BY "
+                                                          "batch_id")]
+
+    def get_batch_outputs(self, batch_id: int):
+        """get the output files of a batch with their size before the results of the batch were written
+
+        :param batch_id: the id of the batch
+        :type batch_id: int
+        :return: the output file of each data type and its size
+        :rtype: Dict[str, Tuple[str, int]]
+        """
+        return {datatype: (file_path, offset) for datatype, file_path, offset in self.connection.execute(
+            "SELECT datatype, file_path, offset FROM batch_outputs WHERE batch_id = ?", (batch_id,))}
+
+    def get_batch_predictions(self, batch_id: int, datatype: str):
+        """get the predictions of a data type for the papers of a batch
+
+        :param batch_id: the id of the batch
+        :type batch_id: int
+        :param datatype: the data type
+        :type datatype: str
+        :return: the ids of the papers with their prediction, sorted by paper id
+        :rtype: List[Tuple[str, int]]
+        """
+        return self.connection.execute("SELECT papers.paper_id, prediction FROM papers JOIN predictions ON "
+                                       "papers.paper_id = predictions.paper_id WHERE batch_id = ? AND datatype = ? "
+                                       "ORDER BY papers.paper_id", (batch_id, datatype)).fetchall()
+
+    def set_exported(self, batch_id: int):
+        """mark the results of a batch as written to the output files
+
+        :param batch_id: the id of the batch
+        :type batch_id: int
+        """
+        with self.connection:
+            self.connection.execute("UPDATE batches SET exported = 1 WHERE batch_id = ?", (batch_id,))
+
+    def get_counts(self):
+        """get the number of processed papers for each status
+
+        :return: the number of papers for each status
+        :rtype: Dict[str, int]
+        """
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM papers GROUP BY status"))
+
+    def close(self):
+        """close the database"""
+        self.connection.close()
+
+
+class ClassificationPipeline(object):
+    """classify the papers of a data directory with a set of classifiers, one data type per classifier, keeping track
+    of the processed papers in a :class:`WorkLog`
+
+    Each sub-directory of the data directory is a paper, and the text of a paper is the concatenation of the text of the
+    cas files found in its directory and in the directories of its supplementary materials, whose names start with the
+    paper id, joined as in packed corpora (see :func:`textpresso_classifiers.fileutils.join_paper_texts`). The files are
+    read in place, in batches, and the predictions of each batch are appended to a file for each data type in a
+    sub-directory of the output directory named after the current year and week (e.g., 2018-07), as lines containing the
+    name of the paper and the predicted class (0 or 1). Papers are named as the concatenated text files of the shell
+    pipeline (<paper_id>.concat.txt), so that the output files have the same format. When the pipeline is run again,
+    only the papers that are not in the work log are read, and the results of batches interrupted while being written to
+    the output files are written again
+    """
+
+    def __init__(self, multi_classifier: MultiModelClassifier, data_dir: str, output_dir: str, work_log: WorkLog,
+                 file_type: str = "cas_pdf", supplementals_dir: str = None):
+        """create a new pipeline
+
+        :param multi_classifier: the classifiers to apply, named after the data types they predict
+        :type multi_classifier: MultiModelClassifier
+        :param data_dir: the directory containing a sub-directory with the cas files of each paper
+        :type data_dir: str
+        :param output_dir: the directory where the predictions are written
+        :type output_dir: str
+        :param work_log: the log of the processed papers
+        :type work_log: WorkLog
+        :param file_type: the type of the cas files
+        :type file_type: str
+        :param supplementals_dir: the directory containing the directories of the supplementary materials of the
+            papers, named after the paper ids, if any
+        :type supplementals_dir: str
+        """
+        self.multi_classifier = multi_classifier
+        self.data_dir = data_dir
+        self.output_dir = output_dir
+        self.work_log = work_log
+        self.file_type = file_type
+        self.supplementals_dir = supplementals_dir
+        self.prediction_stats = None
+        self._supplementals = None
+
+    def list_pending_papers(self):
+        """list the papers of the data directory that are not in the work log. Only the top level of the data
+        directory is listed, and the directories of the pending papers are scanned later, when they are read
+
+        :return: the ids of the pending papers, sorted
+        :rtype: List[str]
+        """
+        paper_ids = sorted(entry.name for entry in os.scandir(self.data_dir) if entry.is_dir())
+        processed = self.work_log.get_processed(paper_ids)
+        return [paper_id for paper_id in paper_ids if paper_id not in processed]
+
+    def _get_supplementals(self, paper_id: str):
+        if self.supplementals_dir is None or not os.path.isdir(self.supplementals_dir):
+            return []
+        if self._supplementals is None:
+            # the supplementals directory is listed once, and the entries of each paper are found by prefix
+            self._supplementals = sorted(entry.name for entry in os.scandir(self.supplementals_dir) if entry.is_dir())
+        supplementals = []
+        idx = bisect.bisect_left(self._supplementals, paper_id)
+        while idx < len(self._supplementals) and self._supplementals[idx].startswith(paper_id):
+            supplementals.append(os.path.join(self.supplementals_dir, self._supplementals[idx]))
+            idx += 1
+        return supplementals
+
+    def get_paper_files(self, paper_id: str):
+        """get the cas files of a paper and of its supplementary materials
+
+        :param paper_id: the id of the paper
+        :type paper_id: str
+        :return: the paths to the cas files
+        :rtype: List[str]
+        """
+        file_paths = []
+        for paper_dir in [os.path.join(self.data_dir, paper_id)] + self._get_supplementals(paper_id):
+            for root, dirs, files in os.walk(paper_dir):
+                dirs.sort()
+                file_paths.extend(os.path.join(root, file) for file in sorted(files) if
+                                  file.endswith(CAS_FILE_EXTENSION))
+        return file_paths
+
+    def _iter_paper_batches(self, paper_ids: List[str], batch_size: int, n_jobs: int, stats: PredictionStats):
+        for batch_start in range(0, len(paper_ids), batch_size):
+            batch_paper_ids = paper_ids[batch_start:batch_start + batch_size]
+            start_time = time.perf_counter()
+            paper_files = [self.get_paper_files(paper_id) for paper_id in batch_paper_ids]
+            fulltexts = iter(extract_text_from_files([file_path for file_paths in paper_files for file_path in
+                                                      file_paths], file_type=self.file_type, n_jobs=n_jobs))
+            texts = []
+            for file_paths in paper_files:
+                file_texts = [text for text in (next(fulltexts) for _ in file_paths) if text is not None]
+                texts.append(join_paper_texts(file_texts) if len(file_texts) > 0 else None)
+            stats.extraction_time += time.perf_counter() - start_time
+            yield batch_paper_ids, texts
+
+    def _export_batch(self, batch_id: int):
+        for datatype, (file_path, offset) in self.work_log.get_batch_outputs(batch_id).items():
+            os.makedirs(os.path.dirname(file_path), exist_ok=True)
+            with open(file_path, "a") as output_file:
+                # remove the lines written before an interruption
+                output_file.truncate(offset)
+                for paper_id, prediction in self.work_log.get_batch_predictions(batch_id, datatype):
+                    output_file.write(paper_id + ".concat.txt\t" + str(prediction) + "\n")
+                output_file.flush()
+                os.fsync(output_file.fileno())
+        self.work_log.set_exported(batch_id)
+
+    def resume_export(self):
+        """write the results of the batches that were interrupted while being written to the output files
+
+        :return: the number of batches written
+        :rtype: int
+        """
+        batch_ids = self.work_log.get_unexported_batches()
+        for batch_id in batch_ids:
+            self._export_batch(batch_id)
+        return len(batch_ids)
+
+    def run(self, batch_size: int = 1000, n_jobs: int = 1, prefetch: int = 0, max_papers: int = None):
+        """classify the pending papers of the data directory and write their predictions to the output files. The time
+        spent in each stage is stored in the *prediction_stats* field
+
+        :param batch_size: the number of papers read and classified at a time
+        :type batch_size: int
+        :param n_jobs: the number of worker processes used to extract the text from the files
+        :type n_jobs: int
+        :param prefetch: the number of batches to read and convert in advance in background
+        :type prefetch: int
+        :param max_papers: the maximum number of papers to process. All the pending papers are processed if None
+        :type max_papers: int
+        :return: the number of processed papers, including the ones that could not be read
+        :rtype: int
+        """
+        stats = PredictionStats(0, 0, 0.0, 0.0, 0.0, 0.0, 0.0)
+        self.prediction_stats = stats
+        start_time = time.perf_counter()
+        self.resume_export()
+        paper_ids = self.list_pending_papers()
+        if max_papers is not None:
+            paper_ids = paper_ids[:max_papers]
+        batches = self._iter_paper_batches(paper_ids, batch_size, n_jobs, stats)
+        if prefetch > 0:
+            batches = iter_prefetched(batches, prefetch=prefetch)
+        datatypes = self.multi_classifier.get_model_names()
+        while True:
+            wait_start_time = time.perf_counter()
+            batch = next(batches, None)
+            stats.extraction_wait_time += time.perf_counter() - wait_start_time
+            if batch is None:
+                break
+            batch_paper_ids, texts = batch
+            classified_paper_ids = [paper_id for paper_id, text in zip(batch_paper_ids, texts) if text is not None]
+            stage_start_time = time.perf_counter()
+            predictions = self.multi_classifier.predict_texts([text for text in texts if text is not None])
+            stats.prediction_time += time.perf_counter() - stage_start_time
+            paper_predictions = {paper_id: {datatype: 1 if predictions[datatype][idx] > PREDICTION_THRESHOLD else 0
+                                            for datatype in datatypes}
+                                 for idx, paper_id in enumerate(classified_paper_ids)}
+            week_dir = os.path.join(self.output_dir, time.strftime("%Y-%W"))
+            batch_id = self.work_log.add_batch(
+                week_dir, paper_predictions, [paper_id for paper_id, text in zip(batch_paper_ids, texts) if
+                                              text is None],
+                {datatype: os.path.join(week_dir, datatype + OUTPUT_FILE_EXTENSION) for datatype in datatypes})
+            self._export_batch(batch_id)
+            stats.num_docs += len(classified_paper_ids)
+            stats.num_failed += len(batch_paper_ids) - len(classified_paper_ids)
+        stats.wall_time = time.perf_counter() - start_time
+        return stats.num_docs + stats.num_failed
@@ -0,0 +1,201 @@
+"""Select the best features of classifiers according to pluggable scoring functions"""
+
+import numpy as np
+import scipy.sparse as sp
+from enum import Enum
+from typing import List
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+class FeatureScorer(Enum):
+    CHI2 = 1
+    ANOVA_F = 2
+    MUTUAL_INFO = 3
+
+
+def mutual_info_scores(features, target):
+    """compute the mutual information between the presence of each feature in a document and the class of the
+    document. The documents containing each feature are counted per class with sparse matrix products, so that the
+    features are never converted to a dense matrix
+
+    :param features: the feature matrix of the documents
+    :param target: the classes of the documents
+    :type target: List[int]
+    :return: the mutual information of each feature in nats and None, since the scores have no p-values
+    :rtype: Tuple[np.ndarray, None]
+    """
+    presence = sp.csr_matrix(features, copy=True)
+    presence.eliminate_zeros()
+    presence.data = np.ones(len(presence.data), dtype=np.float64)
+    classes, target_idx = np.unique(np.asarray(target), return_inverse=True)
+    num_docs = presence.shape[0]
+    class_indicator = sp.csr_matrix((np.ones(num_docs), (target_idx, np.arange(num_docs))),
+                                    shape=(len(classes), num_docs))
+    # number of documents of each class containing each feature (n_classes x n_features)
+    present_counts = np.asarray((class_indicator @ presence).todense())
+    class_counts = np.bincount(target_idx, minlength=len(classes)).astype(np.float64)[:, np.newaxis]
+    feature_counts = present_counts.sum(axis=0)[np.newaxis, :]
+    scores = np.zeros(presence.shape[1], dtype=np.float64)
+    for joint_counts, marginal_counts in [(present_counts, feature_counts),
+                                          (class_counts - present_counts, num_docs - feature_counts)]:
+        with np.errstate(divide="ignore", invalid="ignore"):
+            terms = joint_counts / num_docs * np.log(joint_counts * num_docs / (marginal_counts * class_counts))
+        scores += np.where(joint_counts > 0, terms, 0).sum(axis=0)
+    return np.maximum(scores, 0), None
+
+
+def chi2_scores(features, target):
+    """compute the chi-squared statistic between each feature and the classes of the documents
+
+    :param features: the feature matrix of the documents
+    :param target: the classes of the documents
+    :type target: List[int]
+    :return: the scores and the p-values of the features
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    from sklearn.feature_selection import chi2
+    return chi2(features, target)
+
+
+def anova_f_scores(features, target):
+    """compute the ANOVA F-value of each feature for the classes of the documents
+
+    :param features: the feature matrix of the documents
+    :param target: the classes of the documents
+    :type target: List[int]
+    :return: the scores and the p-values of the features
+    :rtype: Tuple[np.ndarray, np.ndarray]
+    """
+    from sklearn.feature_selection import f_classif
+    return f_classif(features, target)
+
+
+# the feature selection module of scikit-learn is imported only when the features are scored
+SCORE_FUNCTIONS = {
+    FeatureScorer.CHI2: chi2_scores,
+    FeatureScorer.ANOVA_F: anova_f_scores,
+    FeatureScorer.MUTUAL_INFO: mutual_info_scores
+}
+
+
+def get_top_k_idx(scores, k: int):
+    """get the indices of the k highest scores, sorted by decreasing score. Ties are broken by increasing index and
+    undefined (nan) scores are ranked last. Only the k best scores are sorted, after partitioning the scores in linear
+    time
+
+    :param scores: the scores
+    :param k: the number of indices to return
+    :type k: int
+    :return: the indices of the k highest scores
+    :rtype: np.ndarray
+    """
+    scores = np.asarray(scores, dtype=np.float64)
+    k = max(min(k, len(scores)), 0)
+    if k == 0:
+        return np.zeros(0, dtype=np.int64)
+    neg_scores = -np.where(np.isnan(scores), -np.inf, scores)
+    if k < len(scores):
+        candidates_idx = np.argpartition(neg_scores, k - 1)[:k]
+        # include all the features tied with the k-th best one, so that ties are broken by index as in a full sort
+        threshold = neg_scores[candidates_idx].max()
+        candidates_idx = np.concatenate([np.flatnonzero(neg_scores < threshold),
+                                         np.flatnonzero(neg_scores == threshold)])
+    else:
+        candidates_idx = np.arange(len(scores))
+    return candidates_idx[np.lexsort((candidates_idx, neg_scores[candidates_idx]))][:k].astype(np.int64)
+
+
+class FeatureSelector(object):
+    """select the best features of a classifier by scoring them on a training set
+
+    The scores are computed once by :meth:`fit` and the indices of the selected features are cached, so that they are
+    not sorted again for each transformed document. Changing the number of selected features through :meth:`select`
+    does not require computing the scores again
+    """
+
+    def __init__(self, scorer: FeatureScorer = FeatureScorer.CHI2, k: int = None):
+        """create a new feature selector
+
+        :param scorer: the function used to score the features
+        :type scorer: FeatureScorer
+        :param k: the number of features to select. All the features are selected, sorted by score, if None
+        :type k: int
+        """
+        self.scorer = scorer
+        self.k = k
+        self.scores_ = None
+        self.pvalues_ = None
+        self.selected_idx_ = None
+
+    def fit(self, features, target):
+        """score the features on a training set and select the best ones
+
+        :param features: the feature matrix of the training set
+        :param target: the classes of the documents of the training set
+        :type target: List[int]
+        :return: the feature selector
+        :rtype: FeatureSelector
+        """
+        scores, pvalues = SCORE_FUNCTIONS[self.scorer](features, target)
+        self.scores_ = np.asarray(scores, dtype=np.float64)
+        self.pvalues_ = np.asarray(pvalues, dtype=np.float64) if pvalues is not None else None
+        return self.select(self.k)
+
+    def select(self, k: int = None):
+        """change the number of selected features, re-using the scores computed by :meth:`fit`
+
+        :param k: the number of features to select. All the features are selected, sorted by score, if None
+        :type k: int
+        :return: the feature selector
+        :rtype: FeatureSelector
+        """
+        if self.scores_ is None:
+            raise Exception('the features have not been scored yet')
+        self.k = k
+        self.selected_idx_ = get_top_k_idx(self.scores_, len(self.scores_) if k is None else k)
+        return self
+
+    def set_selected_idx(self, selected_idx: List[int]):
+        """select a given list of features instead of the best ones, re-using the scores computed by :meth:`fit` (e.g.,
+        to keep the order of the features selected before some features were added or removed)
+
+        :param selected_idx: the indices of the features to select, in the order in which they are selected
+        :type selected_idx: List[int]
+        :return: the feature selector
+        :rtype: FeatureSelector
+        """
+        if self.scores_ is None:
+            raise Exception('the features have not been scored yet')
+        self.selected_idx_ = np.asarray(selected_idx, dtype=np.int64)
+        self.k = len(self.selected_idx_)
+        return self
+
+    def get_selected_idx(self):
+        """get the indices of the selected features, sorted by decreasing score unless they have been set by
+        :meth:`set_selected_idx`
+
+        :return: the indices of the selected features
+        :rtype: np.ndarray
+        """
+        if self.selected_idx_ is None:
+            raise Exception('the features have not been scored yet')
+        return self.selected_idx_
+
+    def get_selected_scores(self):
+        """get the scores of the selected features, in the same order of :meth:`get_selected_idx`
+
+        :return: the scores of the selected features
+        :rtype: np.ndarray
+        """
+        return self.scores_[self.get_selected_idx()]
+
+    def transform(self, features):
+        """restrict a feature matrix to the selected features
+
+        :param features: the feature matrix
+        :return: the columns of the matrix corresponding to the selected features
+        """
+        return features[:, self.get_selected_idx()]
@@ -0,0 +1,390 @@
+"""Serve a set of Textpresso document classifiers held in memory over a local HTTP or Unix socket"""
+
+import http.client
+import json
+import os
+import queue
+import socket
+import stat
+import threading
+import time
+from collections import OrderedDict
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from socketserver import ThreadingMixIn, UnixStreamServer
+from typing import List, TYPE_CHECKING
+from namedlist import namedlist
+from textpresso_classifiers.fileutils import extract_text_from_file
+
+if TYPE_CHECKING:
+    # clients do not need the classifiers and the libraries they import
+    from textpresso_classifiers.multimodel import MultiModelClassifier
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+DEFAULT_MAX_BATCH_SIZE = 64
+DEFAULT_MAX_WAIT = 0.005
+
+ServiceStats_ = namedlist("ServiceStats", "num_requests, num_docs, num_failed, num_batches, prediction_time")
+
+
+class ServiceStats(ServiceStats_):
+    """statistics on the requests served by a classification service"""
+
+    def get_mean_batch_size(self):
+        """get the mean number of documents classified together in a batch
+
+        :return: the mean size of the batches
+        :rtype: float
+        """
+        return self.num_docs / self.num_batches if self.num_batches > 0 else 0.0
+
+
+class _PendingRequest(object):
+    """documents of a request waiting to be classified by the batching thread"""
+
+    def __init__(self, texts: List[str]):
+        self.texts = texts
+        self.predictions = None
+        self.error = None
+        self.done = threading.Event()
+
+
+def _read_file(file_path: str, file_type: str):
+    try:
+        return extract_text_from_file(file_path, file_type=file_type)
+    except Exception:
+        # files that cannot be read are reported to the client as missing predictions
+        return None
+
+
+class _ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class _ThreadingUnixHTTPServer(ThreadingMixIn, UnixStreamServer):
+    daemon_threads = True
+
+
+class _ServiceRequestHandler(BaseHTTPRequestHandler):
+    """handler of the requests to a classification service
+
+    The service is available as the *service* attribute of the server
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def setup(self):
+        super().setup()
+        if isinstance(self.client_address, tuple):
+            # headers and body are written separately, which the nagle algorithm would delay on tcp connections
+            self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, True)
+
+    def address_string(self):
+        # the clients of Unix sockets have no address
+        return self.client_address[0] if isinstance(self.client_address, tuple) else "local"
+
+    def log_message(self, format, *args):
+        if self.server.service.verbose:
+            super().log_message(format, *args)
+
+    def _send_json(self, status: int, content):
+        body = json.dumps(content).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        service = self.server.service
+        if self.path == "/models":
+            self._send_json(200, {"models": service.multi_classifier.get_model_names()})
+        elif self.path == "/stats":
+            self._send_json(200, dict(service.stats._asdict(), mean_batch_size=service.stats.get_mean_batch_size()))
+        else:
+            self._send_json(404, {"error": "unknown path " + self.path})
+
+    def do_POST(self):
+        if self.path != "/predict":
+            self._send_json(404, {"error": "unknown path " + self.path})
+            return
+        try:
+            request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8"))
+            if "texts" in request:
+                texts = request["texts"]
+            elif "paths" in request:
+                texts = [_read_file(path, request.get("file_type", "pdf")) for path in request["paths"]]
+            else:
+                raise ValueError("the request must contain a list of texts or of paths")
+        except (ValueError, KeyError, TypeError) as error:
+            self._send_json(400, {"error": str(error)})
+            return
+        try:
+            predictions = self.server.service.predict_texts(texts)
+        except Exception as error:
+            self._send_json(500, {"error": str(error)})
+            return
+        self._send_json(200, {"models": self.server.service.multi_classifier.get_model_names(),
+                              "predictions": predictions})
+
+
+class ClassificationService(object):
+    """resident service that holds a set of classifiers in memory and classifies the documents sent by its clients
+
+    The documents of concurrent requests are queued and classified together in batches by a single thread, so that the
+    cost of analyzing the text and applying each model is shared by the requests. A batch is classified as soon as it
+    contains *max_batch_size* documents or *max_wait* seconds after its first document arrived. The service accepts
+    requests over a local TCP port or a Unix socket:
+
+    * ``POST /predict`` with a json body ``{"texts": [...]}`` or ``{"paths": [...], "file_type": "pdf"}`` returns
+      ``{"models": [...], "predictions": [...]}``, with a dictionary of the classes predicted by each model for each
+      document, or null for the files that cannot be converted
+    * ``GET /models`` returns the names of the classifiers
+    * ``GET /stats`` returns the statistics of the service
+    """
+
+    def __init__(self, multi_classifier: "MultiModelClassifier", max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT, verbose: bool = False):
+        """create a new service
+
+        :param multi_classifier: the classifiers to serve
+        :type multi_classifier: MultiModelClassifier
+        :param max_batch_size: the maximum number of documents classified in a batch. Larger requests are classified in
+            a single batch
+        :type max_batch_size: int
+        :param max_wait: the maximum time in seconds that a document waits for other requests to fill its batch
+        :type max_wait: float
+        :param verbose: whether to log the requests to stderr
+        :type verbose: bool
+        """
+        self.multi_classifier = multi_classifier
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.verbose = verbose
+        self.stats = ServiceStats(0, 0, 0, 0, 0.0)
+        self.server = None
+        self._queue = queue.Queue()
+        self._stats_lock = threading.Lock()
+        self._threads = []
+
+    def predict_texts(self, texts: List[str]):
+        """classify a list of documents with all the classifiers of the service, together with the documents of the
+        concurrent requests
+
+        :param texts: the fulltext of the documents, or None for the documents that cannot be converted
+        :type texts: List[str]
+        :return: the predictions of the classifiers for each document, or None for the missing documents
+        :rtype: List[Dict[str, int]]
+        """
+        data = [text for text in texts if text is not None]
+        with self._stats_lock:
+            self.stats.num_requests += 1
+            self.stats.num_failed += len(texts) - len(data)
+        doc_predictions = []
+        if len(data) > 0:
+            pending_request = _PendingRequest(data)
+            self._queue.put(pending_request)
+            pending_request.done.wait()
+            if pending_request.error is not None:
+                raise pending_request.error
+            doc_predictions = pending_request.predictions
+        doc_predictions = iter(doc_predictions)
+        return [next(doc_predictions) if text is not None else None for text in texts]
+
+    def _next_batch(self):
+        pending_request = self._queue.get()
+        if pending_request is None:
+            return None
+        batch = [pending_request]
+        num_docs = len(pending_request.texts)
+        deadline = time.perf_counter() + self.max_wait
+        while num_docs < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                pending_request = self._queue.get(timeout=timeout) if timeout > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if pending_request is None:
+                # stop after classifying the current batch
+                self._queue.put(None)
+                break
+            batch.append(pending_request)
+            num_docs += len(pending_request.texts)
+        return batch
+
+    def _classify_batches(self):
+        while True:
+            batch = self._next_batch()
+            if batch is None:
+                break
+            texts = [text for pending_request in batch for text in pending_request.texts]
+            start_time = time.perf_counter()
+            try:
+                predictions = self.multi_classifier.predict_texts(texts)
+            except Exception as error:
+                for pending_request in batch:
+                    pending_request.error = error
+                    pending_request.done.set()
+                continue
+            with self._stats_lock:
+                self.stats.prediction_time += time.perf_counter() - start_time
+                self.stats.num_docs += len(texts)
+                self.stats.num_batches += 1
+            doc_idx = 0
+            for pending_request in batch:
+                pending_request.predictions = [
+                    OrderedDict((name, model_predictions[idx]) for name, model_predictions in predictions.items())
+                    for idx in range(doc_idx, doc_idx + len(pending_request.texts))]
+                doc_idx += len(pending_request.texts)
+                pending_request.done.set()
+
+    def start(self, host: str = "127.0.0.1", port: int = 0, unix_socket: str = None):
+        """start serving requests in background threads
+
+        :param host: the host name or address on which the service listens
+        :type host: str
+        :param port: the TCP port on which the service listens. A free port is chosen if 0
+        :type port: int
+        :param unix_socket: the path to a Unix socket on which the service listens instead of a TCP port. A stale socket
+            left at the same path by a previous service is replaced
+        :type unix_socket: str
+        :return: the address of the service, as (host, port) or the path to the Unix socket
+        """
+        if self.server is not None:
+            raise Exception('the service is already running')
+        if unix_socket is not None:
+            if os.path.exists(unix_socket):
+                if not stat.S_ISSOCK(os.stat(unix_socket).st_mode):
+                    raise Exception('the path of the unix socket exists and is not a socket')
+                os.remove(unix_socket)
+            self.server = _ThreadingUnixHTTPServer(unix_socket, _ServiceRequestHandler)
+        else:
+            self.server = _ThreadingHTTPServer((host, port), _ServiceRequestHandler)
+        self.server.service = self
+        self._threads = [threading.Thread(target=self._classify_batches, daemon=True),
+                         threading.Thread(target=self.server.serve_forever, daemon=True)]
+        for thread in self._threads:
+            thread.start()
+        return self.get_address()
+
+    def get_address(self):
+        """get the address of the running service
+
+        :return: the address of the service, as (host, port) or the path to the Unix socket
+        """
+        if self.server is None:
+            return None
+        return self.server.server_address
+
+    def wait(self):
+        """wait until the service is stopped"""
+        for thread in self._threads:
+            thread.join()
+
+    def stop(self):
+        """stop the service, after classifying the documents that are already queued"""
+        if self.server is None:
+            return
+        self.server.shutdown()
+        self.server.server_close()
+        self._queue.put(None)
+        self.wait()
+        if isinstance(self.server, UnixStreamServer) and os.path.exists(self.server.server_address):
+            os.remove(self.server.server_address)
+        self.server = None
+        self._threads = []
+        self._queue = queue.Queue()
+
+
+class _UnixHTTPConnection(http.client.HTTPConnection):
+
+    def __init__(self, unix_socket: str, timeout: float = None):
+        super().__init__("localhost", timeout=timeout)
+        self.unix_socket = unix_socket
+
+    def connect(self):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        if self.timeout is not None:
+            self.sock.settimeout(self.timeout)
+        self.sock.connect(self.unix_socket)
+
+
+class ClassificationClient(object):
+    """client of a :class:`ClassificationService`. The connection to the service is kept open between requests, so
+    that a client must not be shared by multiple threads"""
+
+    def __init__(self, host: str = "127.0.0.1", port: int = None, unix_socket: str = None, timeout: float = None):
+        """create a new client
+
+        :param host: the host name or address of the service
+        :type host: str
+        :param port: the TCP port of the service
+        :type port: int
+        :param unix_socket: the path to the Unix socket of the service, used instead of host and port
+        :type unix_socket: str
+        :param timeout: the timeout of the requests in seconds. Requests never time out if None
+        :type timeout: float
+        """
+        if unix_socket is not None:
+            self.connection = _UnixHTTPConnection(unix_socket, timeout=timeout)
+        elif port is not None:
+            self.connection = http.client.HTTPConnection(host, port, timeout=timeout)
+        else:
+            raise Exception('either the port or the unix socket of the service must be specified')
+
+    def _request(self, method: str, path: str, content=None):
+        body = json.dumps(content).encode("utf-8") if content is not None else None
+        headers = {"Content-Type": "application/json"} if body is not None else {}
+        self.connection.request(method, path, body=body, headers=headers)
+        response = self.connection.getresponse()
+        result = json.loads(response.read().decode("utf-8"))
+        if response.status != 200:
+            raise Exception('the service returned an error: ' + str(result.get("error")))
+        return result
+
+    def get_model_names(self):
+        """get the names of the classifiers of the service
+
+        :return: the names of the classifiers
+        :rtype: List[str]
+        """
+        return self._request("GET", "/models")["models"]
+
+    def get_stats(self):
+        """get the statistics of the service
+
+        :return: the statistics of the service
+        :rtype: Dict[str, float]
+        """
+        return self._request("GET", "/stats")
+
+    def predict_texts(self, texts: List[str]):
+        """classify a list of documents with all the classifiers of the service
+
+        :param texts: the fulltext of the documents
+        :type texts: List[str]
+        :return: the classes predicted by each classifier for each document
+        :rtype: List[Dict[str, int]]
+        """
+        return self._request("POST", "/predict", {"texts": texts})["predictions"]
+
+    def predict_files(self, file_paths: List[str], file_type: str = "pdf"):
+        """classify a list of files with all the classifiers of the service. The files are read by the service, so that
+        the paths must be accessible to it
+
+        :param file_paths: the paths to the files
+        :type file_paths: List[str]
+        :param file_type: the type of the files
+        :type file_type: str
+        :return: the classes predicted by each classifier for each file, or None for the files that cannot be converted
+        :rtype: List[Dict[str, int]]
+        """
+        return self._request("POST", "/predict", {"paths": [os.path.abspath(file_path) for file_path in file_paths],
+                                                  "file_type": file_type})["predictions"]
+
+    def close(self):
+        """close the connection to the service"""
+        self.connection.close()
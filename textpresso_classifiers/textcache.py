@@ -0,0 +1,148 @@
+"""Persistent cache of the fulltext extracted from pdf and CAS files"""
+
+import hashlib
+import os
+import tempfile
+from namedlist import namedlist
+
+__author__ = "Valerio Arnaboldi"
+
+__version__ = "1.0.1"
+
+
+DEFAULT_MAX_CACHE_SIZE = 10 * 1024 ** 3
+CACHE_FILE_EXTENSION = ".txt"
+
+CacheStats_ = namedlist("CacheStats", "hits, misses, entries, size")
+
+
+class CacheStats(CacheStats_):
+    """statistics on the usage of a text cache"""
+    pass
+
+
+class TextCache(object):
+    """on-disk cache of the normalized fulltext of documents
+
+    Each entry is stored in a separate file in the cache directory and is identified by the absolute path of the
+    original document, its size, its modification time, and the type of file (e.g., "cas_pdf" or "cas_xml"), so that
+    modified documents are automatically re-extracted. The total size of the cache is kept below the specified limit
+    by evicting the least recently used entries. The cache can be shared by multiple processes
+    """
+
+    def __init__(self, cache_dir: str, max_size: int = DEFAULT_MAX_CACHE_SIZE):
+        """create a new cache or open an existing one
+
+        :param cache_dir: the directory where to store the cache entries
+        :type cache_dir: str
+        :param max_size: the maximum size of the cache in bytes
+        :type max_size: int
+        """
+        self.cache_dir = cache_dir
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+        self.size = sum(entry_stat.st_size for _, entry_stat in self._stat_entries())
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state["hits"] = 0
+        state["misses"] = 0
+        return state
+
+    def _stat_entries(self):
+        # entries evicted by other processes after the directory has been scanned are skipped
+        entry_stats = []
+        for entry in os.scandir(self.cache_dir):
+            if entry.name.endswith(CACHE_FILE_EXTENSION):
+                try:
+                    entry_stats.append((entry.path, entry.stat()))
+                except FileNotFoundError:
+                    pass
+        return entry_stats
+
+    def _get_entry_path(self, file_path: str, file_type: str):
+        file_stat = os.stat(file_path)
+        key = "\t".join([os.path.abspath(file_path), str(file_stat.st_size), str(file_stat.st_mtime_ns), file_type])
+        return os.path.join(self.cache_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + CACHE_FILE_EXTENSION)
+
+    def get(self, file_path: str, file_type: str):
+        """get the fulltext of a document from the cache
+
+        :param file_path: the path to the original document
+        :type file_path: str
+        :param file_type: the type of the document
+        :type file_type: str
+        :return: the cached fulltext or None if the document is not in the cache
+        :rtype: str
+        """
+        entry_path = self._get_entry_path(file_path, file_type)
+        try:
+            with open(entry_path, encoding="utf-8") as entry_file:
+                text = entry_file.read()
+            os.utime(entry_path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return text
+
+    def put(self, file_path: str, file_type: str, text: str):
+        """add the fulltext of a document to the cache, evicting old entries if the cache exceeds its maximum size
+
+        :param file_path: the path to the original document
+        :type file_path: str
+        :param file_type: the type of the document
+        :type file_type: str
+        :param text: the fulltext of the document
+        :type text: str
+        """
+        entry_path = self._get_entry_path(file_path, file_type)
+        tmp_fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=".tmp")
+        with os.fdopen(tmp_fd, "w", encoding="utf-8") as tmp_file:
+            tmp_file.write(text)
+        try:
+            old_entry_size = os.path.getsize(entry_path)
+        except FileNotFoundError:
+            old_entry_size = 0
+        os.replace(tmp_path, entry_path)
+        # an entry that replaces an existing one only adds the difference in size
+        self.size += os.path.getsize(entry_path) - old_entry_size
+        if self.size > self.max_size:
+            self.evict()
+
+    def evict(self, target_size: int = None):
+        """remove the least recently used entries from the cache until its size is below the target size
+
+        :param target_size: the size to reach, in bytes. By default it is set to 90% of the maximum size of the cache
+        :type target_size: int
+        """
+        if target_size is None:
+            target_size = int(self.max_size * 0.9)
+        entries = sorted([(entry_stat.st_mtime, entry_stat.st_size, entry_path) for entry_path, entry_stat in
+                          self._stat_entries()])
+        self.size = sum(entry[1] for entry in entries)
+        for _, entry_size, entry_path in entries:
+            if self.size <= target_size:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            self.size -= entry_size
+
+    def clear(self):
+        """remove all the entries from the cache"""
+        self.evict(target_size=0)
+
+    def get_stats(self):
+        """get the usage statistics of the cache
+
+        :return: the number of hits and misses since the cache was opened, the number of entries and the total size of
+            the cache in bytes
+        :rtype: CacheStats
+        """
+        entry_stats = self._stat_entries()
+        return CacheStats(self.hits, self.misses, len(entry_stats), sum(entry_stat.st_size for _, entry_stat in
+                                                                        entry_stats))
@@ -67,10 +67,16 @@ do
         for model in ${models[@]}
         do
             mkdir -p ${data_dir}/${datatype}/${model}
-            tp_doc_classifier.py -p ${data_dir}/${datatype}/valp_tp -c ${model_dir}/${datatype}/${model}.pkl -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valp_tp.csv &
-            tp_doc_classifier.py -p ${data_dir}/${datatype}/valp_fp -c ${model_dir}/${datatype}/${model}.pkl -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valp_fp.csv &
-            tp_doc_classifier.py -p ${data_dir}/${datatype}/valn_tn -c ${model_dir}/${datatype}/${model}.pkl -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valn_tn.csv &
-            tp_doc_classifier.py -p ${data_dir}/${datatype}/valn_fn -c ${model_dir}/${datatype}/${model}.pkl -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valn_fn.csv &
+            # models saved with memory-mapped arrays are shared by the concurrent processes
+            model_file=${model_dir}/${datatype}/${model}.pkl
+            if [ -d ${model_dir}/${datatype}/${model}.mmap ]
+            then
+                model_file=${model_dir}/${datatype}/${model}.mmap
+            fi
+            tp_doc_classifier.py -p ${data_dir}/${datatype}/valp_tp -c ${model_file} -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valp_tp.csv &
+            tp_doc_classifier.py -p ${data_dir}/${datatype}/valp_fp -c ${model_file} -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valp_fp.csv &
+            tp_doc_classifier.py -p ${data_dir}/${datatype}/valn_tn -c ${model_file} -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valn_tn.csv &
+            tp_doc_classifier.py -p ${data_dir}/${datatype}/valn_fn -c ${model_file} -m ${model} -f ${FILE_TYPE} > ${data_dir}/${datatype}/${model}/prediction_valn_fn.csv &
             if [[ ${wait_after_model} == "true" ]]
             then
                 wait
@@ -75,7 +75,7 @@ do
                 find "$sup" -name "*.tpcas.gz" | xargs -I {} cp "{}" "${OUTPUT_DIR}/${filetype}/tmp/"
             done
         fi
-        find "${OUTPUT_DIR}/${filetype}/tmp/" -name "${line}*.tpcas.gz" | xargs -I {} sh -c 'filename=$(echo {} | rev | cut -d "/" -f 1 | rev); convert_doc_to_txt.py -f $1 "{}" > "$0/$2/tmp/$(echo $filename | sed 's/.tpcas.gz/.txt/g')"' "${OUTPUT_DIR}" "${cas_type}" "${filetype}"
+        find "${OUTPUT_DIR}/${filetype}/tmp/" -name "${line}*.tpcas.gz" -print0 | xargs -0 convert_doc_to_txt.py -f "${cas_type}" -o "${OUTPUT_DIR}/${filetype}/tmp"
         find "${OUTPUT_DIR}/${filetype}/tmp/" -name "${line}*.tpcas.gz" | xargs -I {} rm "{}"
         cat "${OUTPUT_DIR}/${filetype}/tmp/${line}"* > "${OUTPUT_DIR}/${filetype}/tmp/${line}.concat.txt"
         find "${OUTPUT_DIR}/${filetype}/tmp/" -name "${line}*.txt" | grep -v ".concat.txt" | xargs -I {} rm "{}"
@@ -6,6 +6,7 @@ function usage {
     echo "  -n --ngram-size          set the n-gram size"
     echo "  -m --max-features        set the maximum number of best features to be kept for feature selection"
     echo "  -z --tokenization-scheme type of tokenization to apply to extract the feature set. Accepted values are TFIDF or BOW (Bag of Words)"
+    echo "  -s --save-mmap           also save the models as directories of memory-mapped arrays, used by predict_and_save.sh"
     echo "  -h --help                display help"
     exit 1
 }
@@ -15,6 +16,7 @@ FILE_TYPE="pdf"
 NGRAM_SIZE="2"
 MAX_FEATURES="20000"
 TOKENIZATION="TFIDF"
+SAVE_MMAP="false"
 
 models=("KNN" "SVM_LINEAR" "SVM_NONLINEAR" "TREE" "RF" "MLP" "NAIVEB" "GAUSS" "LDA" "XGBOOST")
 
@@ -46,6 +48,10 @@ case $key in
     TOKENIZATION="$1"
     shift
     ;;
+    -s|--save-mmap)
+    SAVE_MMAP="true"
+    shift
+    ;;
     -h|--help)
     usage
     ;;
@@ -72,7 +78,12 @@ do
     then
         for model in ${models[@]}
         do
-            tp_doc_classifier.py -t ${INPUT_DIR}/${datatype} -c ${INPUT_DIR}/${datatype}/${model}.pkl -f ${FILE_TYPE} -m ${model} -n ${NGRAM_SIZE} -b ${MAX_FEATURES} -z ${TOKENIZATION} &
+            mmap_options=""
+            if [[ ${SAVE_MMAP} == "true" ]]
+            then
+                mmap_options="-s ${INPUT_DIR}/${datatype}/${model}.mmap --mmap"
+            fi
+            tp_doc_classifier.py -t ${INPUT_DIR}/${datatype} -c ${INPUT_DIR}/${datatype}/${model}.pkl -f ${FILE_TYPE} -m ${model} -n ${NGRAM_SIZE} -b ${MAX_FEATURES} -z ${TOKENIZATION} ${mmap_options} &
         done
     fi
     wait